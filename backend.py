@@ -1,9 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import requests
+from services import BUSY_MESSAGE, SERVICE_MODULES, HttpService, LocalService, ServiceError
+from singleflight import AsyncSingleFlight, singleflight_stats
+from llm_memo import llm_memo_stats
+from speculation import Speculation, SpeculativeTask, speculation_stats
+from metrics import install_metrics, timed_stage
+from deadline import DEADLINE_MESSAGE, DeadlineExceeded, check_deadline, deadline_headers, install_deadline, remaining
+from readiness import Warmup, install_readiness
+import asyncio
+import httpx
 import logging
-
-app = FastAPI()
+import os
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -15,6 +25,151 @@ DOCTOR_NAME_URL = "http://localhost:8003/doctor-availability-by-name"
 DOCTOR_DISEASE_URL = "http://localhost:8004/doctor-availability-by-disease"
 DOCTOR_SPECIALIZATION_URL = "http://localhost:8005/doctor-availability-by-specialty"
 GENERAL_QUERY_URL = "http://localhost:8006/general-query"
+RAG_STREAM_URL = "http://localhost:8002/rag/stream"
+GENERAL_QUERY_STREAM_URL = "http://localhost:8006/general-query/stream"
+RAG_PREFETCH_URL = "http://localhost:8002/rag/prefetch"
+RAG_PREFETCH_ABANDON_URL = "http://localhost:8002/rag/prefetch/abandon"
+
+SERVICE_URLS = {
+    "intent": INTENT_CLASSIFICATION_URL,
+    "rag": RAG_URL,
+    "doctor_name": DOCTOR_NAME_URL,
+    "doctor_disease": DOCTOR_DISEASE_URL,
+    "doctor_specialization": DOCTOR_SPECIALIZATION_URL,
+    "general_query": GENERAL_QUERY_URL,
+    "rag_prefetch": RAG_PREFETCH_URL,
+    "rag_prefetch_abandon": RAG_PREFETCH_ABANDON_URL,
+}
+
+# Services that can stream their answer token by token, and the intents they serve
+SERVICE_STREAM_URLS = {
+    "rag": RAG_STREAM_URL,
+    "general_query": GENERAL_QUERY_STREAM_URL,
+}
+STREAMING_INTENTS = {
+    "asking about health tips and general disease": "rag",
+    "general query": "general_query",
+}
+
+# "http" calls the microservices on ports 8001-8006, "monolith" runs their
+# handlers inside this process (see run.py --mode)
+BACKEND_MODE = os.getenv("BACKEND_MODE", "http")
+
+# Speculative mode: lookups that don't depend on the intent (the RAG semantic
+# cache lookup and retrieval) start while the intent is being classified. The
+# handler of the chosen intent picks up their result, the others are cancelled.
+BACKEND_SPECULATION = os.getenv("BACKEND_SPECULATION", "0") == "1"
+
+# Downstream timeout and connection pool limits. Every limit can be overridden
+# globally (BACKEND_MAX_CONNECTIONS) or per service (BACKEND_RAG_MAX_CONNECTIONS).
+SERVICE_TIMEOUT = float(os.getenv("BACKEND_SERVICE_TIMEOUT", 180))
+DEFAULT_POOL_LIMITS = {
+    "MAX_CONNECTIONS": 100,
+    "MAX_KEEPALIVE_CONNECTIONS": 20,
+    "KEEPALIVE_EXPIRY": 30.0,
+}
+
+def pool_limits(service):
+    """
+    Builds the httpx connection pool limits for a downstream service.
+    """
+    def limit(key, cast):
+        value = os.getenv(f"BACKEND_{service.upper()}_{key}", os.getenv(f"BACKEND_{key}"))
+        return cast(value) if value is not None else DEFAULT_POOL_LIMITS[key]
+
+    return httpx.Limits(
+        max_connections=limit("MAX_CONNECTIONS", int),
+        max_keepalive_connections=limit("MAX_KEEPALIVE_CONNECTIONS", int),
+        keepalive_expiry=limit("KEEPALIVE_EXPIRY", float),
+    )
+
+# Downstream services behind a common interface (services.py), created and
+# closed with the app lifecycle. Over HTTP every service gets one keep-alive
+# client (and connection pool) shared by all requests.
+downstream_services = {}
+
+def create_service(service):
+    if BACKEND_MODE == "monolith":
+        return LocalService(SERVICE_MODULES[service], SERVICE_URLS[service], SERVICE_STREAM_URLS.get(service))
+    client = httpx.AsyncClient(limits=pool_limits(service), timeout=SERVICE_TIMEOUT)
+    return HttpService(client, SERVICE_URLS[service], SERVICE_STREAM_URLS.get(service))
+
+# The backend has nothing to load itself; in monolith mode it is ready once the
+# in-process services have warmed up
+warmup = Warmup("backend").start()
+
+@asynccontextmanager
+async def lifespan(app):
+    logging.info(f"Backend mode: {BACKEND_MODE}")
+    for service in SERVICE_URLS:
+        downstream_services[service] = create_service(service)
+        dependency = getattr(downstream_services[service], "warmup", None)
+        if dependency is not None and dependency not in warmup.dependencies:
+            warmup.dependencies.append(dependency)
+    try:
+        yield
+    finally:
+        for downstream in downstream_services.values():
+            await downstream.aclose()
+        downstream_services.clear()
+
+app = FastAPI(lifespan=lifespan)
+install_metrics(app, "backend")
+# Every chat gets a time budget (REQUEST_BUDGET, or the frontend's X-Request-Deadline-Ms);
+# the time left is forwarded to each downstream call, which gives up when it runs out
+install_deadline(app, "backend")
+install_readiness(app, warmup)
+
+class ServiceBusy(Exception):
+    """
+    Raised when a downstream service sheds the request because the LLM is overloaded.
+    """
+
+async def post_service(service, payload):
+    """
+    Sends a request to a downstream service without blocking the event loop,
+    with the time left of the chat's budget as its deadline.
+    """
+    check_deadline(service)
+    try:
+        response = await downstream_services[service].post(payload, headers=deadline_headers(), timeout=remaining())
+    except httpx.TimeoutException:
+        raise DeadlineExceeded(service)
+    if response.status_code == 429:
+        raise ServiceBusy(service)
+    if response.status_code == 504:
+        raise DeadlineExceeded(service)
+    return response
+
+async def prefetch_rag(query):
+    """
+    Has the RAG service look up its cache and retrieve context ahead of the /rag call.
+
+    When the speculation is cancelled (another intent was chosen) the RAG
+    service is told to drop the prefetch and stop the work still running.
+    """
+    try:
+        response = await post_service("rag_prefetch", {"query": query})
+    except asyncio.CancelledError:
+        abandon = asyncio.ensure_future(abandon_rag_prefetch(query))
+        abandoning.add(abandon)
+        abandon.add_done_callback(abandoning.discard)
+        raise
+    if response.status_code != 200:
+        raise ServiceError(response.status_code, response.text)
+
+# Abandon notices still being sent, referenced so they are not garbage collected
+abandoning = set()
+
+async def abandon_rag_prefetch(query):
+    try:
+        await post_service("rag_prefetch_abandon", {"query": query})
+    except Exception as e:
+        logging.warning(f"Could not abandon the RAG prefetch for {query!r}: {e}")
+
+SPECULATIVE_TASKS = [
+    SpeculativeTask("rag_prefetch", prefetch_rag, {"asking about health tips and general disease"}),
+]
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -29,115 +184,217 @@ class ChatResponse(BaseModel):
 def health_check():
     return {"status": "ok"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+# Coalesced request counters (in monolith mode, of every service)
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+# Memoized LLM extraction counters (in monolith mode, of every service)
+@app.get("/llm-memo-stats")
+def memo_stats():
+    return llm_memo_stats()
+
+# Used/wasted speculative lookups and the latency they saved
+@app.get("/speculation-stats")
+def get_speculation_stats():
+    return {"enabled": BACKEND_SPECULATION, "tasks": speculation_stats()}
+
+@timed_stage("backend.classify")
+async def classify(query):
+    """
+    Calls the intent service; returns (intent, slots), or (None, {}) when classification fails.
+
+    Slots (doctor_name, specialty or disease) are only filled in the intent
+    service's joint mode, and let the doctor services skip their own extraction.
+    """
+    intent_response = await post_service("intent", {"query": query})
+    if intent_response.status_code != 200:
+        logging.error(f"Intent classification failed: {intent_response.text}")
+        return None, {}
+
+    intent_data = intent_response.json()
+    intent = intent_data["intent"]
+    slots = intent_data.get("slots") or {}
+    logging.info(f"Detected intent: {intent} (source: {intent_data.get('source')}, confidence: {intent_data.get('confidence')}, slots: {slots})")
+    return intent, slots
+
+async def classify_with_speculation(query):
+    """
+    classify(), running the SPECULATIVE_TASKS alongside it in speculative mode.
+
+    Once the intent is known, the lookups its handler uses are awaited (so the
+    downstream service finds their result) and the others are cancelled.
+    """
+    if not BACKEND_SPECULATION:
+        return await classify(query)
+
+    speculation = Speculation(SPECULATIVE_TASKS, query).start()
     try:
-        # Intent Classification
-        intent_response = requests.post(
-            INTENT_CLASSIFICATION_URL,
-            json={"query": request.query},
-            timeout=180
-        )
-        if intent_response.status_code != 200:
-            logging.error(f"Intent classification failed: {intent_response.text}")
-            return ChatResponse(intent="error", response="Sedang terjadi kesalahan.")
+        intent, slots = await classify(query)
+    except BaseException:
+        speculation.cancel()
+        raise
+
+    kept = speculation.resolve(intent)
+    # A failed lookup is only a missed head start, the handler does the work itself
+    await asyncio.gather(*kept.values(), return_exceptions=True)
+    return intent, slots
+
+@timed_stage("backend.answer")
+async def answer(intent, request, slots=None):
+    """
+    Dispatches the query (and any extracted slots) to the service that handles the intent and formats its reply.
+    """
+    payload = {"query": request.query, **(slots or {})}
+
+    # Intent Handling
+    if intent == "asking about health tips and general disease":
+        rag_response = await post_service("rag", {"query": request.query})
+        if rag_response.status_code != 200:
+            logging.error(f"RAG service failed: {rag_response.text}")
+            return "Sedang terjadi kesalahan."
         
-        intent_data = intent_response.json()
-        intent = intent_data["intent"]
-        logging.info(f"Detected intent: {intent}")
-
-        # Intent Handling
-        if intent == "asking about health tips and general disease":
-            rag_response = requests.post(
-                RAG_URL,
-                json={"query": request.query},
-                timeout=180
-            )
-            if rag_response.status_code != 200:
-                logging.error(f"RAG service failed: {rag_response.text}")
-                return ChatResponse(intent=intent, response="Sedang terjadi kesalahan.")
-            
-            rag_data = rag_response.json()
-            response_text = rag_data.get("response", "Maaf, saya tidak bisa menjawab pertanyaan Anda.")
-
-        elif intent == "doctor's availability search by its name":
-            doctor_name_response = requests.post(
-                DOCTOR_NAME_URL,
-                json={"query": request.query},
-                timeout=180
-            )
-            if doctor_name_response.status_code != 200:
-                logging.error(f"Doctor Name Failed: {doctor_name_response.text}")
-                return ChatResponse(intent=intent, response="Sedang terjadi kesalahan.")
-            
-            doctor_data = doctor_name_response.json()
-            doctor_name = doctor_data.get("doctor", "Nama Dokter tidak diketahui.")
-            availability = doctor_data.get("availability", "")
-
-            if not availability.strip():
-                response_text = f"{doctor_name} tidak memiliki jadwal tersedia."
-            else:
-                response_text = f"Jadwal {doctor_name}:\n\n{availability}"
-
-        elif intent == "doctor's availability search by its disease":
-            doctor_disease_response = requests.post(
-                DOCTOR_DISEASE_URL,
-                json={"query": request.query},
-                timeout=180
-            )
-            if doctor_disease_response.status_code != 200:
-                logging.error(f"Doctor Disease Failed: {doctor_disease_response.text}")
-                return ChatResponse(intent=intent, response="Sedang terjadi kesalahan.")
-            
-            doctor_data = doctor_disease_response.json()
-            doctor_name = doctor_data.get("doctor_name", "Nama Dokter tidak diketahui.")
-            availability = doctor_data.get("availability", "")
-
-            if not availability.strip():
-                response_text = f"{doctor_name} tidak memiliki jadwal tersedia.."
-            else:
-                response_text = f"Jadwal {doctor_name}:\n\n{availability}"
+        rag_data = rag_response.json()
+        response_text = rag_data.get("response", "Maaf, saya tidak bisa menjawab pertanyaan Anda.")
+
+    elif intent == "doctor's availability search by its name":
+        doctor_name_response = await post_service("doctor_name", payload)
+        if doctor_name_response.status_code != 200:
+            logging.error(f"Doctor Name Failed: {doctor_name_response.text}")
+            return "Sedang terjadi kesalahan."
         
-        elif intent == "doctor's availability search by its specialization":
-            doctor_specialty_response = requests.post(
-                DOCTOR_SPECIALIZATION_URL,
-                json={"query": request.query},
-                timeout=180
-            )
-            if doctor_specialty_response.status_code != 200:
-                logging.error(f"Doctor Specialty Failed: {doctor_specialty_response.text}")
-                return ChatResponse(intent=intent, response="Sedang terjadi kesalahan.")
-            
-            doctor_data = doctor_specialty_response.json()
-            specialty = doctor_data.get("specialty", "Spesialisasi tidak ditemukan.")
-            availability = doctor_data.get("availability", "")
-
-            if not availability.strip():
-                response_text = f"Tidak ada dokter dengan sepsialisasi: {specialty}."
-            else:
-                response_text = f"Jadwal dokter dengan spesialisasi {specialty}:\n\n{availability}"
-
-        elif intent == "general query":
-            llm_response = requests.post(
-                GENERAL_QUERY_URL,
-                json={"query": request.query},
-                timeout=180
-            )
-            if llm_response.status_code != 200:
-                logging.error(f"LLM service failed: {llm_response.text}")
-                return ChatResponse(intent=intent, response="Sedang terjadi kesalahan.")
-            
-            llm_data = llm_response.json()
-            response_text = llm_data.get("response", "Maaf, saya tidak bisa menjawab pertanyaan Anda.")
+        doctor_data = doctor_name_response.json()
+        doctor_name = doctor_data.get("doctor", "Nama Dokter tidak diketahui.")
+        availability = doctor_data.get("availability", "")
 
+        if not availability.strip():
+            response_text = f"{doctor_name} tidak memiliki jadwal tersedia."
         else:
-            responses = {
-                "unanswerable question": "Maaf, saya tidak bisa menjawab pertanyaan ini."
-            }
-            response_text = responses.get(intent, "Unexpected intent detected.")
+            response_text = f"Jadwal {doctor_name}:\n\n{availability}"
+
+    elif intent == "doctor's availability search by its disease":
+        doctor_disease_response = await post_service("doctor_disease", payload)
+        if doctor_disease_response.status_code != 200:
+            logging.error(f"Doctor Disease Failed: {doctor_disease_response.text}")
+            return "Sedang terjadi kesalahan."
         
+        doctor_data = doctor_disease_response.json()
+        doctor_name = doctor_data.get("doctor_name", "Nama Dokter tidak diketahui.")
+        availability = doctor_data.get("availability", "")
+
+        if not availability.strip():
+            response_text = f"{doctor_name} tidak memiliki jadwal tersedia.."
+        else:
+            response_text = f"Jadwal {doctor_name}:\n\n{availability}"
+    
+    elif intent == "doctor's availability search by its specialization":
+        doctor_specialty_response = await post_service("doctor_specialization", payload)
+        if doctor_specialty_response.status_code != 200:
+            logging.error(f"Doctor Specialty Failed: {doctor_specialty_response.text}")
+            return "Sedang terjadi kesalahan."
+        
+        doctor_data = doctor_specialty_response.json()
+        specialty = doctor_data.get("specialty", "Spesialisasi tidak ditemukan.")
+        availability = doctor_data.get("availability", "")
+
+        if not availability.strip():
+            response_text = f"Tidak ada dokter dengan sepsialisasi: {specialty}."
+        else:
+            response_text = f"Jadwal dokter dengan spesialisasi {specialty}:\n\n{availability}"
+
+    elif intent == "general query":
+        llm_response = await post_service("general_query", {"query": request.query})
+        if llm_response.status_code != 200:
+            logging.error(f"LLM service failed: {llm_response.text}")
+            return "Sedang terjadi kesalahan."
+        
+        llm_data = llm_response.json()
+        response_text = llm_data.get("response", "Maaf, saya tidak bisa menjawab pertanyaan Anda.")
+
+    else:
+        responses = {
+            "unanswerable question": "Maaf, saya tidak bisa menjawab pertanyaan ini."
+        }
+        response_text = responses.get(intent, "Unexpected intent detected.")
+    
+    return response_text
+
+# Concurrent chats with the same query share one classification and answer
+chat_flight = AsyncSingleFlight("chat")
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    return await chat_flight.do(request.query, lambda: respond(request))
+
+async def respond(request):
+    try:
+        # Intent Classification
+        intent, slots = await classify_with_speculation(request.query)
+        if intent is None:
+            return ChatResponse(intent="error", response="Sedang terjadi kesalahan.")
+
+        response_text = await answer(intent, request, slots)
         return ChatResponse(intent=intent, response=response_text)
 
+    except ServiceBusy as e:
+        logging.warning(f"Chat request shed by the {e} service")
+        return ChatResponse(intent="busy", response=BUSY_MESSAGE)
+    except DeadlineExceeded as e:
+        logging.warning(f"Chat request ran out of time at {e}")
+        return ChatResponse(intent="timeout", response=DEADLINE_MESSAGE)
     except Exception as e:
         logging.error(f"Unexpected error in chat API: {e}")
         return ChatResponse(intent="error", response="Sedang terjadi kesalahan.")
+
+async def stream_service(service, query, start_time):
+    """
+    Relays a downstream token stream chunk by chunk, without buffering the answer.
+    When the client disconnects this generator is closed, which closes the
+    downstream stream and stops its generation.
+    """
+    try:
+        check_deadline(service)
+        first_chunk = True
+        async for chunk in downstream_services[service].stream({"query": query}, headers=deadline_headers(), timeout=remaining()):
+            if first_chunk:
+                logging.info(f"Chat stream time to first token: {time.perf_counter() - start_time:.3f}s")
+                first_chunk = False
+            yield chunk
+        logging.info(f"Chat stream total time: {time.perf_counter() - start_time:.3f}s")
+    except ServiceError as e:
+        logging.error(f"{service} stream failed: {e.text}")
+        yield {429: BUSY_MESSAGE, 504: DEADLINE_MESSAGE}.get(e.status_code, "Sedang terjadi kesalahan.")
+    except (DeadlineExceeded, httpx.TimeoutException):
+        logging.warning(f"Chat stream from {service} ran out of time")
+        yield DEADLINE_MESSAGE
+    except Exception as e:
+        logging.error(f"Unexpected error while streaming from {service}: {e}")
+        yield "Sedang terjadi kesalahan."
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streams the reply as chunked plain text; the detected intent is sent in the X-Intent header.
+    """
+    start_time = time.perf_counter()
+    try:
+        intent, slots = await classify_with_speculation(request.query)
+        if intent is None:
+            return StreamingResponse(iter(["Sedang terjadi kesalahan."]), media_type="text/plain; charset=utf-8", headers={"X-Intent": "error"})
+
+        service = STREAMING_INTENTS.get(intent)
+        if service:
+            stream = stream_service(service, request.query, start_time)
+        else:
+            stream = iter([await answer(intent, request, slots)])
+        return StreamingResponse(stream, media_type="text/plain; charset=utf-8", headers={"X-Intent": intent})
+
+    except ServiceBusy as e:
+        logging.warning(f"Chat stream request shed by the {e} service")
+        return StreamingResponse(iter([BUSY_MESSAGE]), media_type="text/plain; charset=utf-8", headers={"X-Intent": "busy"})
+    except DeadlineExceeded as e:
+        logging.warning(f"Chat stream request ran out of time at {e}")
+        return StreamingResponse(iter([DEADLINE_MESSAGE]), media_type="text/plain; charset=utf-8", headers={"X-Intent": "timeout"})
+    except Exception as e:
+        logging.error(f"Unexpected error in chat stream API: {e}")
+        return StreamingResponse(iter(["Sedang terjadi kesalahan."]), media_type="text/plain; charset=utf-8", headers={"X-Intent": "error"})
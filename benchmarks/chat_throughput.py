@@ -0,0 +1,158 @@
+"""
+Measures /chat throughput of the backend at increasing client concurrency.
+
+With --stub the downstream services (ports 8001-8006) are replaced by stubs
+that answer after a fixed delay, and the backend is started on port 8000, so
+the numbers only reflect how well the backend overlaps downstream calls.
+
+    python -m benchmarks.chat_throughput --stub --delay 0.5
+    python -m benchmarks.chat_throughput --concurrency 1 4 16 --requests 64
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+CHAT_URL = "http://localhost:8000/chat"
+
+QUERIES = [
+    "halo",
+    "apa tips menjaga kesehatan jantung?",
+    "saya mau bertemu dr budi",
+    "jadwal dokter tht",
+    "saya sakit kepala, dokter apa yang ada?",
+]
+
+# Stubbed downstream endpoints: (port, path, response body)
+STUB_ENDPOINTS = [
+    (8001, "/classify-intent", {"intent": "general query"}),
+    (8002, "/rag", {"response": "stub"}),
+    (8003, "/doctor-availability-by-name", {"doctor": "Dr. Stub", "availability": "stub"}),
+    (8004, "/doctor-availability-by-disease", {"doctor_name": "Dr. Stub", "availability": "stub"}),
+    (8005, "/doctor-availability-by-specialty", {"specialty": "Stub", "availability": "stub"}),
+    (8006, "/general-query", {"response": "stub"}),
+]
+
+
+def start_stub_services(delay):
+    """
+    Runs every downstream stub in a background thread on its usual port.
+    """
+    import uvicorn
+    from fastapi import FastAPI
+
+    def make_stub(path, body):
+        stub = FastAPI()
+
+        @stub.get("/check")
+        def check():
+            return {"status": "ok"}
+
+        @stub.post(path)
+        async def handler(payload: dict):
+            await asyncio.sleep(delay)
+            return body
+
+        return stub
+
+    servers = []
+    for port, path, body in STUB_ENDPOINTS:
+        stub = make_stub(path, body)
+        server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run_level(concurrency, total_requests):
+    """
+    Sends total_requests chat requests with at most `concurrency` in flight.
+    """
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(CHAT_URL, json={"query": QUERIES[i % len(QUERIES)]})
+                    if response.status_code != 200 or response.json().get("intent") == "error":
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "latency_p50_s": round(statistics.median(latencies), 3),
+        "latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--stub", action="store_true", help="stub the downstream services and start the backend")
+    parser.add_argument("--delay", type=float, default=0.5, help="stub response delay in seconds")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    backend = None
+    if args.stub:
+        start_stub_services(args.delay)
+        backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend:app", "--port", "8000", "--log-level", "warning"])
+    try:
+        wait_until_up("http://localhost:8000/check")
+        results = []
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(concurrency, args.requests))
+            results.append(result)
+            print(
+                f"concurrency={result['concurrency']:>3}  "
+                f"throughput={result['throughput_rps']:>7} req/s  "
+                f"p50={result['latency_p50_s']}s  p95={result['latency_p95_s']}s  "
+                f"errors={result['errors']}"
+            )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if backend:
+            backend.terminate()
+            backend.wait(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
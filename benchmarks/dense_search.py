@@ -0,0 +1,125 @@
+"""
+Microbenchmark of the memory-mapped DenseIndex against the Chroma MMR retriever.
+
+Uses random unit vectors with the dimension of all-indo-e5-small-v4, so no
+model or PDF is needed. For each corpus size it reports build time, on-disk
+size, top-k search latency for single and batched queries, MMR latency, and
+the same numbers for Chroma (skipped above --chroma-max rows, since inserting
+a million rows into Chroma takes a long time).
+
+    python -m benchmarks.dense_search
+    python -m benchmarks.dense_search --sizes 10000 100000 --dtype float16
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from dense_index import DenseIndex
+
+DIM = 384
+
+
+def random_vectors(rng, rows, batch=100_000):
+    for start in range(0, rows, batch):
+        yield from rng.standard_normal((min(batch, rows - start), DIM), dtype=np.float32)
+
+
+def time_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def bench_dense(rows, queries, dtype, k, fetch_k, repeats, seed):
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as index_dir:
+        documents = [Document(page_content=f"chunk {i}") for i in range(rows)]
+        start = time.perf_counter()
+        index = DenseIndex.build(index_dir, documents, random_vectors(rng, rows), dtype=dtype)
+        build_s = time.perf_counter() - start
+        size_mb = os.path.getsize(os.path.join(index_dir, DenseIndex.VECTORS_FILE)) / 2**20
+
+        result = {
+            "build_s": round(build_s, 2),
+            "vectors_mb": round(size_mb, 1),
+            "search_ms": time_ms(lambda: index.search(queries[0], k), repeats),
+            f"search_batch{len(queries)}_ms": time_ms(lambda: index.search(queries, k), repeats),
+            "mmr_ms": time_ms(lambda: index.mmr(queries[0], k=k, fetch_k=fetch_k), repeats),
+        }
+        del index
+    return result
+
+
+def bench_chroma(rows, queries, k, fetch_k, repeats, seed):
+    import chromadb
+
+    rng = np.random.default_rng(seed)
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(f"bench_{rows}_{seed}")
+    start = time.perf_counter()
+    batch = 5000
+    vectors = random_vectors(rng, rows)
+    for offset in range(0, rows, batch):
+        count = min(batch, rows - offset)
+        collection.add(
+            ids=[str(offset + i) for i in range(count)],
+            embeddings=[next(vectors).tolist() for _ in range(count)],
+            documents=[f"chunk {offset + i}" for i in range(count)],
+        )
+    build_s = time.perf_counter() - start
+
+    from langchain_community.vectorstores import Chroma
+    store = Chroma(client=client, collection_name=collection.name)
+    query = queries[0].tolist()
+    result = {
+        "build_s": round(build_s, 2),
+        "search_ms": time_ms(lambda: collection.query(query_embeddings=[query], n_results=k), repeats),
+        f"search_batch{len(queries)}_ms": time_ms(
+            lambda: collection.query(query_embeddings=queries.tolist(), n_results=k), repeats
+        ),
+        "mmr_ms": time_ms(lambda: store.max_marginal_relevance_search_by_vector(query, k=k, fetch_k=fetch_k), repeats),
+    }
+    client.delete_collection(collection.name)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--batch", type=int, default=32, help="queries per batched search")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--chroma-max", type=int, default=100_000, help="skip Chroma above this many rows")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    queries = np.random.default_rng(1).standard_normal((args.batch, DIM), dtype=np.float32)
+    results = []
+    for rows in args.sizes:
+        result = {"rows": rows, "dense": bench_dense(rows, queries, args.dtype, args.k, args.fetch_k, args.repeats, seed=0)}
+        if rows <= args.chroma_max:
+            try:
+                result["chroma"] = bench_chroma(rows, queries, args.k, args.fetch_k, args.repeats, seed=0)
+            except ImportError:
+                result["chroma"] = None
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares /chat latency and memory of the two run.py deployment modes.
+
+For each mode the services are started exactly as run.py does, a few warm-up
+requests are sent, then every query is sent --rounds times in sequence. The
+report gives latency percentiles per mode and the resident memory (RSS, read
+from /proc, so Linux only) summed over all of the mode's processes.
+
+    python -m benchmarks.deployment_modes
+    python -m benchmarks.deployment_modes --modes monolith --rounds 5 --output modes.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+import run
+from benchmarks.chat_throughput import CHAT_URL, QUERIES, wait_until_up
+
+
+def rss_bytes(pid):
+    """
+    Resident set size of a process, in bytes.
+    """
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def measure_mode(mode, rounds, warmup, startup_timeout):
+    # Each mode starts with an empty LLM memo, so neither is served from the other's outputs
+    os.environ["LLM_MEMO_PATH"] = os.path.join(tempfile.mkdtemp(prefix=f"deployment_modes_{mode}_"), "llm_memo.sqlite3")
+    start = time.perf_counter()
+    processes = run.start_microservices(mode)
+    try:
+        for microservice in run.microservices_for(mode):
+            wait_until_up(microservice["ready_url"], timeout=startup_timeout)
+        startup_s = time.perf_counter() - start
+
+        latencies = []
+        errors = 0
+        with httpx.Client(timeout=300) as client:
+            for query in QUERIES[:warmup]:
+                client.post(CHAT_URL, json={"query": query})
+            for _ in range(rounds):
+                for query in QUERIES:
+                    request_start = time.perf_counter()
+                    response = client.post(CHAT_URL, json={"query": query})
+                    latencies.append(time.perf_counter() - request_start)
+                    if response.status_code != 200 or response.json().get("intent") == "error":
+                        errors += 1
+
+        latencies.sort()
+        return {
+            "mode": mode,
+            "processes": len(processes),
+            "startup_s": round(startup_s, 2),
+            "requests": len(latencies),
+            "errors": errors,
+            "latency_mean_s": round(statistics.fmean(latencies), 3),
+            "latency_p50_s": round(statistics.median(latencies), 3),
+            "latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            "rss_mb": round(sum(rss_bytes(process.pid) for process in processes) / 2**20, 1),
+        }
+    finally:
+        run.stop_microservices(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=run.MODES, default=run.MODES)
+    parser.add_argument("--rounds", type=int, default=3, help="times every query is sent")
+    parser.add_argument("--warmup", type=int, default=len(QUERIES), help="warm-up requests per mode")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        result = measure_mode(mode, args.rounds, args.warmup, args.startup_timeout)
+        results.append(result)
+        print(
+            f"{result['mode']:>9}: processes={result['processes']}  rss={result['rss_mb']} MB  "
+            f"p50={result['latency_p50_s']}s  p95={result['latency_p95_s']}s  "
+            f"startup={result['startup_s']}s  errors={result['errors']}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
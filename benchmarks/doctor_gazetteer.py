@@ -0,0 +1,71 @@
+"""
+Measures how many doctor-name queries the gazetteer resolves without an LLM call.
+
+For every query in benchmarks/doctor_name_queries.json it runs the gazetteer
+the way the doctor-name service does (strict, DOCTOR_GAZETTEER_THRESHOLD) and
+reports the share of queries served without the LLM, accuracy when served,
+and the queries answered with a doctor they do not name. Queries labelled
+with a null doctor (e.g. specialty requests such as "dokter saraf") must not
+be served. --loose runs the match without the strict evidence rule, for
+comparison.
+
+    python -m benchmarks.doctor_gazetteer
+    python -m benchmarks.doctor_gazetteer --loose --output gazetteer.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import time
+
+from doctor_gazetteer import GAZETTEER_CONFIDENCE_THRESHOLD, DoctorGazetteer
+from doctor_schedule import DATABASE_PATH, ScheduleSnapshot
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "doctor_name_queries.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--db", default=DATABASE_PATH)
+    parser.add_argument("--loose", action="store_true", help="skip the strict evidence rule")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    connection = sqlite3.connect(args.db)
+    gazetteer = DoctorGazetteer(ScheduleSnapshot.load(connection, 0).doctors)
+    connection.close()
+
+    served, wrong, latencies = [], [], []
+    for item in corpus:
+        start = time.perf_counter()
+        doctor, confidence = gazetteer.match(item["query"], strict=not args.loose)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if doctor is None or confidence < GAZETTEER_CONFIDENCE_THRESHOLD:
+            continue
+        served.append(item)
+        if doctor.name != item["doctor"]:
+            wrong.append({"query": item["query"], "expected": item["doctor"], "served": doctor.name, "confidence": round(confidence, 3)})
+
+    report = {
+        "queries": len(corpus),
+        "strict": not args.loose,
+        "served_without_llm": round(len(served) / len(corpus), 3),
+        "accuracy_when_served": round(1 - len(wrong) / len(served), 3) if served else None,
+        "wrong": wrong,
+        "latency": {
+            "p50_ms": round(statistics.median(latencies), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Parity, latency and memory of the ONNX embedding backend against PyTorch.
+
+Every chunk of the docs/ PDFs and every query of benchmarks/retrieval_queries.json
+is embedded by both backends (export the ONNX model first with
+`python onnx_embeddings.py`). The report has:
+
+    cosine      cosine similarity between the two backends' vectors of the same
+                text (mean, p5 and min), over chunks and queries
+    overlap     mean fraction of the top --k chunks shared by both backends per
+                query, each searching its own chunk vectors
+    latency     single-query p50/p95 and bulk chunk embedding time per backend
+    memory      RSS added by loading each backend (each is loaded in a fresh
+                process; Linux only)
+
+    python -m benchmarks.embedding_parity --output parity.json
+    python -m benchmarks.embedding_parity --threads 2 --batch-size 16
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.hybrid_retrieval import DOCS_DIR, QUERIES_PATH
+
+
+def rss_bytes():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def load_texts(queries_path):
+    from indexer import IncrementalIndexer
+
+    indexer = IncrementalIndexer(DOCS_DIR, tempfile.mkdtemp(), None, None)
+    chunks = []
+    for file in sorted(os.listdir(DOCS_DIR)):
+        if file.endswith(".pdf"):
+            chunks.extend(chunk.page_content for chunk in indexer.split_file(os.path.join(DOCS_DIR, file))[0])
+    with open(queries_path, encoding="utf-8") as f:
+        queries = [item["query"] for item in json.load(f)]
+    return chunks, queries
+
+
+def embed_with(backend, chunks, queries, repeats):
+    """
+    Loads one backend in this process and embeds every text; returns the vectors, timings and memory.
+    """
+    import embedding_model
+
+    before = rss_bytes()
+    start = time.perf_counter()
+    embeddings = embedding_model.get_embeddings(backend)
+    embeddings.embed_query("pemanasan")
+    load_s = time.perf_counter() - start
+    loaded = rss_bytes()
+
+    start = time.perf_counter()
+    chunk_vectors = embeddings.embed_documents(chunks)
+    bulk_s = time.perf_counter() - start
+    query_vectors, latencies = [], []
+    for query in queries:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            vector = embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_vectors.append(vector)
+    latencies.sort()
+    return {
+        "chunk_vectors": chunk_vectors,
+        "query_vectors": query_vectors,
+        "load_s": round(load_s, 3),
+        "model_rss_mb": round((loaded - before) / 2**20, 1),
+        "peak_rss_mb": round(rss_bytes() / 2**20, 1),
+        "bulk_chunks_per_s": round(len(chunks) / bulk_s, 1),
+        "query_p50_ms": round(latencies[len(latencies) // 2], 3),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+    }
+
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cosine_summary(a, b):
+    similarities = np.sort(np.sum(normalized(a) * normalized(b), axis=1))
+    return {
+        "mean": round(float(similarities.mean()), 5),
+        "p5": round(float(similarities[int(len(similarities) * 0.05)]), 5),
+        "min": round(float(similarities[0]), 5),
+    }
+
+
+def top_k(query_vectors, chunk_vectors, k):
+    scores = normalized(query_vectors) @ normalized(chunk_vectors).T
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--threads", type=int, help="EMBEDDING_ONNX_THREADS for the ONNX backend")
+    parser.add_argument("--batch-size", type=int, help="EMBEDDING_BATCH_SIZE for both backends")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    chunks, queries = load_texts(args.queries)
+
+    # Child run: embed with one backend and write the result for the parent
+    if args.backend:
+        with open(args.vectors, "w") as f:
+            json.dump(embed_with(args.backend, chunks, queries, args.repeats), f)
+        return
+
+    env = dict(os.environ)
+    if args.threads is not None:
+        env["EMBEDDING_ONNX_THREADS"] = str(args.threads)
+    if args.batch_size is not None:
+        env["EMBEDDING_BATCH_SIZE"] = str(args.batch_size)
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for backend in ("torch", "onnx"):
+            path = os.path.join(output_dir, f"{backend}.json")
+            subprocess.run([
+                sys.executable, "-m", "benchmarks.embedding_parity", "--backend", backend, "--vectors", path,
+                "--queries", args.queries, "--repeats", str(args.repeats),
+            ], env=env, check=True)
+            with open(path) as f:
+                results[backend] = json.load(f)
+
+    torch_results, onnx_results = results["torch"], results["onnx"]
+    torch_top = top_k(torch_results["query_vectors"], torch_results["chunk_vectors"], args.k)
+    onnx_top = top_k(onnx_results["query_vectors"], onnx_results["chunk_vectors"], args.k)
+    report = {
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "k": args.k,
+        "cosine": {
+            "chunks": cosine_summary(torch_results["chunk_vectors"], onnx_results["chunk_vectors"]),
+            "queries": cosine_summary(torch_results["query_vectors"], onnx_results["query_vectors"]),
+        },
+        "overlap_at_k": round(statistics.fmean(len(a & b) / args.k for a, b in zip(torch_top, onnx_top)), 3),
+        "backends": {
+            backend: {key: value for key, value in result.items() if not key.endswith("_vectors")}
+            for backend, result in results.items()
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
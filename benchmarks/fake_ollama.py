@@ -0,0 +1,146 @@
+"""
+A stand-in for Ollama's HTTP API with deterministic outputs and timing.
+
+Intent-classification and extraction prompts are answered from the canned
+"intent" / "extraction" fields of the workload file (matched on the query in
+the prompt), joint intent prompts (INTENT_JOINT_MODE=1) with both as JSON;
+anything else is treated as a long-form generation and answered
+with --generation-tokens filler tokens. Every reply waits --prompt-latency
+before the first token and --token-latency per token, and at most --parallel
+generations run at once, like OLLAMA_NUM_PARALLEL.
+
+    python -m benchmarks.fake_ollama --port 11435 --token-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+WORKLOAD_PATH = os.path.join(os.path.dirname(__file__), "workload.json")
+
+# Sentence repeated to build generation replies
+FILLER = "Jaga pola makan seimbang, cukup istirahat, dan rutin berolahraga agar tubuh tetap sehat."
+
+QUERY_PATTERN = re.compile(r"Query:\s*(.+)")
+
+# Slot the joint intent prompt fills from the canned extraction, per intent
+JOINT_SLOTS = {
+    "doctor's availability search by its name": "doctor_name",
+    "doctor's availability search by its specialization": "specialty",
+    "doctor's availability search by its disease": "disease",
+}
+
+
+def classify_prompt(prompt):
+    """
+    Returns "joint", "intent", "extraction" or "generation" for one of the services' prompts.
+    """
+    if "Respond only with JSON" in prompt:
+        return "joint"
+    if "Classify the following user query" in prompt:
+        return "intent"
+    if "Please extract the" in prompt:
+        return "extraction"
+    return "generation"
+
+
+def create_app(workload_path=WORKLOAD_PATH, prompt_latency=0.05, token_latency=0.02, generation_tokens=64, parallel=2):
+    with open(workload_path, encoding="utf-8") as f:
+        canned = {item["query"].strip().lower(): item for item in json.load(f)}
+
+    filler_tokens = (FILLER.split() * (generation_tokens // len(FILLER.split()) + 1))[:generation_tokens]
+    slots = asyncio.Semaphore(parallel)
+    app = FastAPI()
+
+    def reply_tokens(prompt):
+        kind = classify_prompt(prompt)
+        if kind == "generation":
+            return [f"{token} " for token in filler_tokens]
+
+        match = QUERY_PATTERN.search(prompt)
+        item = canned.get(match.group(1).strip().lower(), {}) if match else {}
+        if kind == "joint":
+            intent = item.get("intent", "general query")
+            output = {"intent": intent, **{slot: None for slot in JOINT_SLOTS.values()}}
+            if intent in JOINT_SLOTS:
+                output[JOINT_SLOTS[intent]] = item.get("extraction")
+            text = json.dumps(output)
+        elif kind == "intent":
+            text = item.get("intent", "general query")
+        else:
+            text = item.get("extraction", "")
+        words = text.split()
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)] or [""]
+
+    def chunk(model, text, done=False, **extra):
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": done,
+            **extra,
+        }
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": [{"name": "llama3:latest", "model": "llama3:latest"}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "llama3")
+        prompt = body.get("prompt", "")
+        tokens = reply_tokens(prompt)
+        final = {
+            "done_reason": "stop",
+            "prompt_eval_count": len(prompt.split()),
+            "eval_count": len(tokens),
+        }
+
+        async def produce():
+            async with slots:
+                start = time.perf_counter()
+                await asyncio.sleep(prompt_latency)
+                for token in tokens:
+                    await asyncio.sleep(token_latency)
+                    yield token
+                final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+
+        if body.get("stream", True) is False:
+            text = "".join([token async for token in produce()])
+            return {**chunk(model, text, done=True), **final}
+
+        async def stream():
+            async for token in produce():
+                yield json.dumps(chunk(model, token)) + "\n"
+            yield json.dumps(chunk(model, "", done=True, **final)) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--workload", default=WORKLOAD_PATH, help="JSON file with canned intent/extraction outputs")
+    parser.add_argument("--prompt-latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per generated token")
+    parser.add_argument("--generation-tokens", type=int, default=64, help="tokens in a long-form reply")
+    parser.add_argument("--parallel", type=int, default=2, help="generations served at once")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.workload, args.prompt_latency, args.token_latency, args.generation_tokens, args.parallel)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
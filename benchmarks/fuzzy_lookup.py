@@ -0,0 +1,117 @@
+"""
+Benchmarks disease/symptom lookup: linear Levenshtein.ratio scan vs FuzzyIndex.
+
+The table is the real disease_to_specialization rows padded with synthetic
+multi-word terms built from Indonesian-like syllables. Queries are real rows
+with one character replaced, so both the match and the threshold path are
+exercised. Agreement is the fraction of queries where the index returns the
+same specialization as the linear scan (1.0, the lookup is exact); exhaustive
+is the fraction of lookups (short queries) that also had to scan the entries
+sharing no n-gram with the query.
+
+    python -m benchmarks.fuzzy_lookup
+    python -m benchmarks.fuzzy_lookup --sizes 1000 100000 --queries 500
+"""
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import time
+
+from Levenshtein import ratio
+
+from fuzzy_index import FuzzyIndex
+
+SYLLABLES = [
+    "ka", "ra", "di", "tu", "sa", "ma", "ni", "pe", "ng", "an", "lo", "si", "ba", "ko", "ge",
+    "ja", "tung", "pa", "ru", "ku", "lit", "mi", "gren", "dia", "be", "tes", "hi", "per", "ten", "si",
+]
+THRESHOLD = 0.7
+
+
+def load_rows(db_path):
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute("SELECT disease_or_symptom, specialization FROM disease_to_specialization").fetchall()
+    connection.close()
+    return rows
+
+
+def synthetic_rows(rng, count, specializations):
+    rows = []
+    for _ in range(count):
+        words = [
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        rows.append((" ".join(words).title(), rng.choice(specializations)))
+    return rows
+
+
+def linear_best_match(rows, query):
+    best_match, best_ratio = None, 0.0
+    for disease, specialization in rows:
+        similarity = ratio(query.lower(), disease.lower())
+        if similarity > best_ratio:
+            best_match, best_ratio = specialization, similarity
+    return best_match if best_ratio >= THRESHOLD else None
+
+
+def typo(rng, text):
+    chars = list(text)
+    chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+def mean_us(fn, queries):
+    start = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return (time.perf_counter() - start) / len(queries) * 1e6, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="doctors.db")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    real_rows = load_rows(args.db)
+    specializations = sorted({specialization for _, specialization in real_rows})
+    padding = synthetic_rows(rng, max(args.sizes), specializations)
+    queries = [typo(rng, rng.choice(real_rows)[0]) for _ in range(args.queries)]
+
+    results = []
+    for size in args.sizes:
+        rows = real_rows + padding[:max(0, size - len(real_rows))]
+        start = time.perf_counter()
+        index = FuzzyIndex(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        linear_us, expected = mean_us(lambda query: linear_best_match(rows, query), queries)
+        indexed_us, actual = mean_us(lambda query: index.best_match(query, THRESHOLD)[0], queries)
+        exhaustive = index.exhaustive_lookups / index.lookups
+        candidates = statistics.fmean(len(index.candidates(query, THRESHOLD)) for query in queries)
+
+        result = {
+            "rows": len(rows),
+            "build_ms": round(build_ms, 1),
+            "linear_us": round(linear_us, 1),
+            "indexed_us": round(indexed_us, 1),
+            "speedup": round(linear_us / indexed_us, 1),
+            "mean_candidates": round(candidates, 1),
+            "exhaustive": round(exhaustive, 3),
+            "agreement": round(sum(a == b for a, b in zip(expected, actual)) / len(queries), 4),
+        }
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
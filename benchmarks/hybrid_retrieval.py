@@ -0,0 +1,164 @@
+"""
+Latency and recall of dense, BM25 and hybrid retrieval over the docs/ PDFs.
+
+The PDFs are chunked exactly as the rag service indexes them. For every query
+in benchmarks/retrieval_queries.json a chunk is relevant when it contains one
+of the query's "relevant" terms. Each method returns the top --k chunks:
+
+    dense    query embedding + MMR over the DenseIndex (the previous behaviour)
+    bm25     the lexical index alone
+    hybrid   dense and BM25 fused by reciprocal rank fusion
+    auto     what rag.py does: BM25 alone for keyword queries, hybrid otherwise
+
+and the report has recall@k, MRR and the median latency (including the query
+embedding) per method, over all queries, keyword queries and questions.
+
+    python -m benchmarks.hybrid_retrieval --output hybrid.json
+    python -m benchmarks.hybrid_retrieval --skip-dense
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from indexer import IncrementalIndexer
+from lexical_index import BM25Index, is_keyword_query, reciprocal_rank_fusion
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "retrieval_queries.json")
+DOCS_DIR = "docs/"
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def is_relevant(document, terms):
+    return any(term in normalize(document.page_content) for term in terms)
+
+
+def score(results, relevant_ids, k):
+    ids = [document.metadata["chunk_id"] for document in results[:k]]
+    found = [chunk_id for chunk_id in ids if chunk_id in relevant_ids]
+    first = next((rank for rank, chunk_id in enumerate(ids, start=1) if chunk_id in relevant_ids), None)
+    return {
+        "recall": len(found) / min(len(relevant_ids), k) if relevant_ids else None,
+        "reciprocal_rank": 1 / first if first else 0.0,
+    }
+
+
+def summarize(records):
+    records = [record for record in records if record["recall"] is not None]
+    if not records:
+        return None
+    return {
+        "queries": len(records),
+        "recall_at_k": round(statistics.fmean(record["recall"] for record in records), 3),
+        "mrr": round(statistics.fmean(record["reciprocal_rank"] for record in records), 3),
+        "p50_ms": round(statistics.median(record["latency_ms"] for record in records), 3),
+    }
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per query and method")
+    parser.add_argument("--skip-dense", action="store_true", help="only evaluate BM25 (no embedding model needed)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.queries, encoding="utf-8") as f:
+        queries = json.load(f)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        lexical_index = BM25Index(os.path.join(data_dir, "lexical"))
+        if args.skip_dense:
+            # Chunk without embedding; ids follow the indexer's "<file>-<n>" scheme
+            indexer = IncrementalIndexer(DOCS_DIR, data_dir, None, None)
+            chunks = []
+            for file in sorted(os.listdir(DOCS_DIR)):
+                if file.endswith(".pdf"):
+                    file_chunks, _ = indexer.split_file(os.path.join(DOCS_DIR, file))
+                    for i, chunk in enumerate(file_chunks):
+                        chunk.metadata.update(source=file, chunk_id=f"{file}-{i}")
+                    lexical_index.add_file(file, file_chunks)
+                    chunks.extend(file_chunks)
+        else:
+            from dense_index import DenseIndex, DenseRetriever
+            from embedding_model import get_embeddings
+
+            embeddings = get_embeddings()
+            indexer = IncrementalIndexer(DOCS_DIR, data_dir, embeddings, None)
+            indexer.sync()
+            lexical_index.sync(indexer)
+            documents, vectors = zip(*indexer.iter_chunks())
+            chunks = list(documents)
+            dense_index = DenseIndex.build(os.path.join(data_dir, "dense"), documents, vectors)
+            retriever = DenseRetriever(index=dense_index, embeddings=embeddings, k=args.k)
+
+        def bm25(query):
+            return [document for document, _ in lexical_index.search(query, args.k)]
+
+        def dense(query):
+            return retriever.search_by_vector(np.asarray(embeddings.embed_query(query), dtype=np.float32))
+
+        def hybrid(query):
+            return reciprocal_rank_fusion([dense(query), bm25(query)], limit=args.k)
+
+        def auto(query):
+            if is_keyword_query(query):
+                results = bm25(query)
+                if results:
+                    return results
+            return hybrid(query)
+
+        methods = {"bm25": bm25}
+        if not args.skip_dense:
+            methods.update(dense=dense, hybrid=hybrid, auto=auto)
+            dense("pemanasan")  # load the model before timing
+
+        records = {name: [] for name in methods}
+        for item in queries:
+            relevant_ids = {chunk.metadata["chunk_id"] for chunk in chunks if is_relevant(chunk, item["relevant"])}
+            for name, method in methods.items():
+                results, latency_ms = timed(lambda: method(item["query"]), args.repeats)
+                records[name].append({
+                    "query": item["query"],
+                    "keyword": is_keyword_query(item["query"]),
+                    "latency_ms": latency_ms,
+                    **score(results, relevant_ids, args.k),
+                })
+
+    report = {
+        "chunks": len(chunks),
+        "k": args.k,
+        "methods": {
+            name: {
+                "all": summarize(method_records),
+                "keyword_queries": summarize([record for record in method_records if record["keyword"]]),
+                "questions": summarize([record for record in method_records if not record["keyword"]]),
+            }
+            for name, method_records in records.items()
+        },
+    }
+    print(json.dumps(report["methods"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Throughput and peak memory of the PDF ingestion pipeline (ingestion.py).
+
+The docs/ PDFs are copied --copies times into a temporary corpus, and every
+combination of corpus size and --workers is ingested by a fresh
+IncrementalIndexer in its own process, so peak RSS (ru_maxrss, Linux) is not
+carried over between runs. It is the RSS of the ingesting process, which
+holds the chunks and embedding batches; the pool workers are children of the
+multiprocessing fork server and each parse one file at a time. The report has
+files, pages, chunks and embeddings per second for every run; with a
+streaming pipeline the time grows with the corpus while peak RSS stays flat.
+
+--fake-embeddings replaces the embedding model with a hash, to measure parsing
+and chunking alone (no model download needed).
+
+    python -m benchmarks.ingestion_throughput --copies 10 50 --workers 1 4 --output ingestion.json
+    python -m benchmarks.ingestion_throughput --fake-embeddings --copies 20 100
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+DOCS_DIR = "docs/"
+FAKE_DIMENSIONS = 384
+
+
+class HashEmbeddings:
+    """
+    Deterministic stand-in for the embedding model.
+    """
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255 for i in range(FAKE_DIMENSIONS)]
+
+
+def make_corpus(directory, copies):
+    pdf_files = [file for file in sorted(os.listdir(DOCS_DIR)) if file.endswith(".pdf")]
+    for i in range(copies):
+        for file in pdf_files:
+            shutil.copy(os.path.join(DOCS_DIR, file), os.path.join(directory, f"{i:05d}-{file}"))
+
+
+def run_once(docs_dir, workers, batch_size, fake_embeddings):
+    """
+    Ingests docs_dir into an empty index in this process; returns the ingestion stats and peak RSS.
+    """
+    os.environ["INGEST_WORKERS"] = str(workers)
+    os.environ["INGEST_EMBED_BATCH_SIZE"] = str(batch_size)
+    from indexer import IncrementalIndexer
+
+    if fake_embeddings:
+        embeddings = HashEmbeddings()
+    else:
+        from embedding_model import get_embeddings
+        embeddings = get_embeddings()
+        embeddings.embed_documents(["pemanasan"])  # load the model before timing
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        indexer = IncrementalIndexer(docs_dir, data_dir, embeddings, None)
+        indexer.sync()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {**indexer.ingestion_stats.as_dict(), "workers": workers, "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, nargs="+", default=[10, 50], help="corpus sizes, in copies of docs/")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--fake-embeddings", action="store_true", help="hash texts instead of running the embedding model")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--run-once", metavar="DOCS_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_once:
+        print(json.dumps(run_once(args.run_once, args.workers[0], args.batch_size, args.fake_embeddings)))
+        return
+
+    runs = []
+    for copies in args.copies:
+        with tempfile.TemporaryDirectory() as docs_dir:
+            make_corpus(docs_dir, copies)
+            for workers in args.workers:
+                command = [
+                    sys.executable, "-m", "benchmarks.ingestion_throughput", "--run-once", docs_dir,
+                    "--workers", str(workers), "--batch-size", str(args.batch_size),
+                ]
+                if args.fake_embeddings:
+                    command.append("--fake-embeddings")
+                output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+                result = {"copies": copies, **json.loads(output.strip().splitlines()[-1])}
+                print(json.dumps(result))
+                runs.append(result)
+
+    report = {"batch_size": args.batch_size, "fake_embeddings": args.fake_embeddings, "runs": runs}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compares the embedding fast-path intent classifier with the llama3 path.
+
+Accuracy of the embedding classifier is measured with leave-one-out over the
+labelled seed set, so no example is classified by a centroid it contributed to.
+The LLM path classifies the same queries through intent.classify_intent_llm.
+
+    python -m benchmarks.intent_comparison
+    python -m benchmarks.intent_comparison --skip-llm --threshold 0.5
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+import intent
+import llm_memo
+
+
+def leave_one_out(vectors, labels, intents, temperature):
+    """
+    Yields (predicted_intent, confidence) for every example, with that example left out.
+    """
+    labels = np.asarray(labels)
+    for i in range(len(vectors)):
+        mask = np.arange(len(vectors)) != i
+        centroids = np.vstack([vectors[mask & (labels == label)].mean(axis=0) for label in intents])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        similarities = centroids @ vectors[i]
+        scores = np.exp((similarities - similarities.max()) / temperature)
+        probabilities = scores / scores.sum()
+        best = int(np.argmax(probabilities))
+        yield intents[best], float(probabilities[best])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summarize_latency(latencies_ms):
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "p50_ms": round(statistics.median(latencies_ms), 2),
+        "p95_ms": round(latencies_ms[int(0.95 * (len(latencies_ms) - 1))], 2),
+        "mean_ms": round(statistics.fmean(latencies_ms), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=intent.INTENT_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--skip-llm", action="store_true", help="only evaluate the embedding classifier")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Time every LLM call, not outputs memoized by an earlier run or an earlier query
+    llm_memo.LLM_MEMO_ENABLED = False
+    intent.warmup.wait()
+    examples = intent.load_intent_examples()
+    intents = [label for label in intent.valid_intents if examples.get(label)]
+    queries = [query for label in intents for query in examples[label]]
+    labels = [label for label in intents for _ in examples[label]]
+
+    vectors = np.asarray(intent.embedding_classifier.embeddings.embed_documents(queries), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    predictions = list(leave_one_out(vectors, labels, intents, intent.embedding_classifier.temperature))
+
+    # Latency of the fast path as served (query embedding + centroid scoring)
+    embedding_latencies = [timed(intent.embedding_classifier.predict, query)[1] for query in queries]
+
+    report = {
+        "examples": len(queries),
+        "threshold": args.threshold,
+        "embedding": {
+            "accuracy": round(sum(p == y for (p, _), y in zip(predictions, labels)) / len(labels), 3),
+            "latency": summarize_latency(embedding_latencies),
+        },
+    }
+    confident = [(p, y) for (p, c), y in zip(predictions, labels) if c >= args.threshold]
+    report["embedding"]["coverage_at_threshold"] = round(len(confident) / len(labels), 3)
+    report["embedding"]["accuracy_at_threshold"] = (
+        round(sum(p == y for p, y in confident) / len(confident), 3) if confident else None
+    )
+
+    if not args.skip_llm:
+        llm_predictions, llm_latencies = zip(*(timed(intent.classify_intent_llm, query) for query in queries))
+        hybrid = [
+            p if c >= args.threshold else llm
+            for (p, c), llm in zip(predictions, llm_predictions)
+        ]
+        hybrid_latencies = [
+            e if c >= args.threshold else e + l
+            for (_, c), e, l in zip(predictions, embedding_latencies, llm_latencies)
+        ]
+        report["llm"] = {
+            "accuracy": round(sum(p == y for p, y in zip(llm_predictions, labels)) / len(labels), 3),
+            "latency": summarize_latency(llm_latencies),
+        }
+        report["hybrid"] = {
+            "accuracy": round(sum(p == y for p, y in zip(hybrid, labels)) / len(labels), 3),
+            "latency": summarize_latency(hybrid_latencies),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
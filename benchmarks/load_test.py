@@ -0,0 +1,228 @@
+"""
+Replays a mixed Indonesian workload against the full stack backed by a fake Ollama.
+
+The fake Ollama server (benchmarks/fake_ollama.py) is started with fixed
+latencies, then the services are started exactly as run.py does (in --mode
+http or monolith) with OLLAMA_URL pointing at the fake and an empty semantic
+cache and LLM memo. For every --concurrency level, --requests queries are drawn from
+benchmarks/workload.json (weighted, seeded) and sent to /chat (or /chat/stream
+with --stream). The JSON report has p50/p95/p99 latency, throughput and errors
+per level and per workload intent, plus the commit it was measured on, so runs
+can be diffed across commits.
+
+    python -m benchmarks.load_test --output load_test.json
+    python -m benchmarks.load_test --mode monolith --concurrency 1 8 32 --requests 200 --stream --output monolith.json
+    python -m benchmarks.load_test --no-start --output running_stack.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+import run
+from benchmarks.chat_throughput import wait_until_up
+from benchmarks.fake_ollama import WORKLOAD_PATH
+
+BACKEND_URL = "http://localhost:8000"
+
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "mean_s": round(statistics.fmean(values), 4),
+        "p50_s": round(percentile(values, 0.50), 4),
+        "p95_s": round(percentile(values, 0.95), 4),
+        "p99_s": round(percentile(values, 0.99), 4),
+        "max_s": round(values[-1], 4),
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def draw_queries(workload, count, seed):
+    rng = random.Random(seed)
+    return rng.choices(workload, weights=[item.get("weight", 1) for item in workload], k=count)
+
+
+async def send(client, item, stream):
+    """
+    Sends one chat request; returns a result record.
+    """
+    start = time.perf_counter()
+    result = {"intent": item["intent"], "served_intent": None, "ok": False, "ttft_s": None}
+    try:
+        if stream:
+            async with client.stream("POST", f"{BACKEND_URL}/chat/stream", json={"query": item["query"]}) as response:
+                result["served_intent"] = response.headers.get("X-Intent")
+                async for chunk in response.aiter_text():
+                    if chunk and result["ttft_s"] is None:
+                        result["ttft_s"] = time.perf_counter() - start
+                result["ok"] = response.status_code == 200
+        else:
+            response = await client.post(f"{BACKEND_URL}/chat", json={"query": item["query"]})
+            result["served_intent"] = response.json().get("intent") if response.status_code == 200 else None
+            result["ok"] = response.status_code == 200
+    except httpx.HTTPError:
+        pass
+    result["ok"] = result["ok"] and result["served_intent"] not in (None, "error", "busy")
+    result["latency_s"] = time.perf_counter() - start
+    return result
+
+
+async def run_level(workload, concurrency, total_requests, seed, stream):
+    queries = draw_queries(workload, total_requests, seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        async def one(item):
+            async with semaphore:
+                return await send(client, item, stream)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(item) for item in queries))
+        elapsed = time.perf_counter() - start
+
+    def summarize(records):
+        summary = {
+            "requests": len(records),
+            "errors": sum(not record["ok"] for record in records),
+            "misrouted": sum(record["ok"] and record["served_intent"] != record["intent"] for record in records),
+            "throughput_rps": round(len(records) / elapsed, 3),
+            "latency": latency_summary([record["latency_s"] for record in records]),
+        }
+        if stream:
+            summary["ttft"] = latency_summary([record["ttft_s"] for record in records if record["ttft_s"] is not None])
+        return summary
+
+    by_intent = {}
+    for record in results:
+        by_intent.setdefault(record["intent"], []).append(record)
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        **summarize(results),
+        "intents": {intent: summarize(records) for intent, records in sorted(by_intent.items())},
+    }
+
+
+def start_stack(args):
+    """
+    Starts the fake Ollama and the services; returns the processes to stop afterwards.
+    """
+    fake = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_ollama",
+        "--port", str(args.fake_port),
+        "--workload", args.workload,
+        "--prompt-latency", str(args.prompt_latency),
+        "--token-latency", str(args.token_latency),
+        "--generation-tokens", str(args.generation_tokens),
+        "--parallel", str(args.parallel),
+    ])
+    wait_until_up(f"http://127.0.0.1:{args.fake_port}/api/tags")
+
+    # Services inherit the environment: point them at the fake, with a fresh semantic cache and LLM memo
+    cache_dir = tempfile.mkdtemp(prefix="load_test_")
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{args.fake_port}"
+    os.environ["RAG_CACHE_PATH"] = os.path.join(cache_dir, "semantic_cache.pkl")
+    os.environ["LLM_MEMO_PATH"] = os.path.join(cache_dir, "llm_memo.sqlite3")
+    processes = run.start_microservices(args.mode)
+    for microservice in run.microservices_for(args.mode):
+        wait_until_up(microservice["ready_url"], timeout=args.startup_timeout)
+    return fake, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=run.MODES, default="http")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and report time to first chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before the first level")
+    parser.add_argument("--workload", default=WORKLOAD_PATH)
+    parser.add_argument("--no-start", action="store_true", help="benchmark an already running stack")
+    parser.add_argument("--fake-port", type=int, default=11435)
+    parser.add_argument("--prompt-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--generation-tokens", type=int, default=64)
+    parser.add_argument("--parallel", type=int, default=2, help="generations the fake Ollama serves at once")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--output", required=True, help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.workload, encoding="utf-8") as f:
+        workload = json.load(f)
+
+    fake, processes = (None, []) if args.no_start else start_stack(args)
+    try:
+        wait_until_up(f"{BACKEND_URL}/check", timeout=args.startup_timeout)
+        asyncio.run(run_level(workload, 1, args.warmup, args.seed - 1, args.stream))
+
+        levels = []
+        for i, concurrency in enumerate(args.concurrency):
+            level = asyncio.run(run_level(workload, concurrency, args.requests, args.seed + i, args.stream))
+            levels.append(level)
+            print(
+                f"concurrency={concurrency:>3}  throughput={level['throughput_rps']:>8} req/s  "
+                f"p50={level['latency']['p50_s']}s  p95={level['latency']['p95_s']}s  p99={level['latency']['p99_s']}s  "
+                f"errors={level['errors']}"
+            )
+    finally:
+        run.stop_microservices(processes)
+        if fake:
+            fake.terminate()
+            fake.wait(timeout=5)
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "mode": args.mode,
+            "endpoint": "/chat/stream" if args.stream else "/chat",
+            "requests_per_level": args.requests,
+            "seed": args.seed,
+            "workload": os.path.relpath(args.workload),
+            "fake_ollama": None if args.no_start else {
+                "prompt_latency_s": args.prompt_latency,
+                "token_latency_s": args.token_latency,
+                "generation_tokens": args.generation_tokens,
+                "parallel": args.parallel,
+            },
+        },
+        "levels": levels,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput and latency of micro-batched query embedding (embedding_batcher.py).
+
+--queries texts from benchmarks/workload.json are embedded by --concurrency
+threads, once per --windows value, with the batcher in front of the embedding
+model ("off" embeds every query on its own, as without the batcher). The
+report has queries per second, p50/p99 latency per query, and the batcher's
+batch size and queueing delay, to pick RAG_EMBED_BATCH_WINDOW_MS for the
+expected load.
+
+    python -m benchmarks.query_batching --concurrency 1 8 32 --output batching.json
+    python -m benchmarks.query_batching --windows off 0 2 5 10 --max-batch 64
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_ollama import WORKLOAD_PATH
+from embedding_batcher import MicroBatchEmbeddings
+from embedding_model import get_embeddings
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(embeddings, queries, concurrency):
+    def timed(query):
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "queries_per_second": round(len(queries) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", nargs="+", default=["off", "0", "2", "5", "10"], help="batch windows in ms, or off")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(WORKLOAD_PATH, encoding="utf-8") as f:
+        texts = [item["query"] for item in json.load(f)]
+    # Distinct texts, so no layer in front of the model can answer from a cache
+    queries = [f"{texts[i % len(texts)]} ({i})" for i in range(args.queries)]
+
+    model = get_embeddings()
+    model.embed_query("pemanasan")  # load the model before timing
+
+    results = []
+    for window in args.windows:
+        for concurrency in args.concurrency:
+            if window == "off":
+                embeddings, stats = model, {}
+                result = run(embeddings, queries, concurrency)
+            else:
+                embeddings = MicroBatchEmbeddings(model, window=float(window) / 1000, max_batch_size=args.max_batch, name=f"bench-{window}")
+                result = run(embeddings, queries, concurrency)
+                stats = embeddings.stats()
+            result = {"window_ms": window, "concurrency": concurrency, **result, **{
+                key: stats.get(key) for key in ("mean_batch_size", "p95_batch_size", "p50_queue_delay_ms", "p95_queue_delay_ms")
+            }}
+            print(json.dumps(result))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"max_batch_size": args.max_batch, "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
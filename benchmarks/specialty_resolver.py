@@ -0,0 +1,83 @@
+"""
+Measures how many specialty queries the synonym dictionary resolves without an LLM call.
+
+For every query in benchmarks/specialty_queries.json it runs the rule-based
+matcher, and (unless --skip-llm) the llama3 specialty_extraction path, and
+reports the share of queries served by rules, accuracy of each path, accuracy
+of the combined resolver, and the latency of each path.
+
+    python -m benchmarks.specialty_resolver
+    python -m benchmarks.specialty_resolver --skip-llm
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import llm_memo
+from specialty_resolver import match_specialty
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "specialty_queries.json")
+
+
+def timed(fn, query):
+    start = time.perf_counter()
+    result = fn(query)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def latency(latencies_ms):
+    return {
+        "p50_ms": round(statistics.median(latencies_ms), 3),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--skip-llm", action="store_true", help="only evaluate the rule-based path")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Time every LLM call, not outputs memoized by an earlier run or an earlier query
+    llm_memo.LLM_MEMO_ENABLED = False
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    rule_results = [timed(match_specialty, item["query"]) for item in corpus]
+    served = [(item, result) for item, (result, _) in zip(corpus, rule_results) if result]
+    report = {
+        "queries": len(corpus),
+        "served_without_llm": round(len(served) / len(corpus), 3),
+        "rule": {
+            "accuracy_when_matched": round(sum(result == item["specialty"] for item, result in served) / len(served), 3) if served else None,
+            "latency": latency([ms for _, ms in rule_results]),
+        },
+    }
+
+    if not args.skip_llm:
+        from function_doctorspecialization import specialty_extraction
+
+        llm_results = [timed(specialty_extraction, item["query"]) for item in corpus]
+        combined = [rule or llm for (rule, _), (llm, _) in zip(rule_results, llm_results)]
+        combined_ms = [rule_ms if rule else rule_ms + llm_ms for (rule, rule_ms), (_, llm_ms) in zip(rule_results, llm_results)]
+        report["llm"] = {
+            "accuracy": round(sum(result == item["specialty"] for item, (result, _) in zip(corpus, llm_results)) / len(corpus), 3),
+            "latency": latency([ms for _, ms in llm_results]),
+        }
+        report["rule_then_llm"] = {
+            "accuracy": round(sum(result == item["specialty"] for item, result in zip(corpus, combined)) / len(corpus), 3),
+            "latency": latency(combined_ms),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import math
+
+# Rough size of a token for the budget: about four characters of Indonesian or English text
+CHARS_PER_TOKEN = 4
+
+# Overlaps shorter than this are treated as coincidence, longer ones are only
+# searched up to the largest overlap the indexer's splitters produce
+MIN_OVERLAP_CHARS = 10
+MAX_OVERLAP_CHARS = 200
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def overlap_length(left, right):
+    """
+    Length of the longest suffix of left that is also a prefix of right.
+    """
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def position(document):
+    """
+    Sort key placing chunks in reading order: document, chunk, child.
+    """
+    metadata = document.metadata
+    return metadata.get("source", ""), metadata.get("chunk_index", 0), metadata.get("child_index", -1)
+
+
+def novel_text(text, source, packed):
+    """
+    The part of text not already covered by the packed pieces of the same source, or "" when fully covered.
+    """
+    for other_text, other_source, _ in packed:
+        if other_source != source:
+            continue
+        if text in other_text:
+            return ""
+        text = text[overlap_length(other_text, text):]
+        cut = overlap_length(text, other_text)
+        if cut:
+            text = text[:-cut]
+    return text
+
+
+def pack_context(documents, max_tokens):
+    """
+    Picks documents in ranked order until max_tokens is reached, skipping text
+    already included (overlapping neighbours, a child inside its packed parent),
+    and returns the context in reading order with overlaps removed.
+    """
+    packed = []
+    used_tokens = 0
+    for document in documents:
+        text = document.page_content.strip()
+        source = document.metadata.get("source")
+        tokens = estimate_tokens(novel_text(text, source, packed))
+        if tokens == 0 or used_tokens + tokens > max_tokens:
+            continue
+        packed.append((text, source, document))
+        used_tokens += tokens
+
+    # Join neighbouring pieces of the same document without repeating their overlap
+    parts = []
+    previous_text, previous_source = "", None
+    for text, source, document in sorted(packed, key=lambda item: position(item[2])):
+        trimmed = text
+        if source == previous_source:
+            if text in previous_text:
+                continue
+            trimmed = text[overlap_length(previous_text, text):]
+        parts.append(trimmed)
+        previous_text, previous_source = text, source
+    return "\n\n".join(part for part in parts if part)
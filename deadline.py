@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.responses import JSONResponse
+from metrics import Counter
+from starlette.concurrency import iterate_in_threadpool
+import logging
+import os
+import time
+
+# Remaining time budget of a request in milliseconds, forwarded with every downstream call
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+# Budget of a request that arrives without the header (the previous downstream timeout)
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", 180))
+
+# Reply when the budget ran out before the answer was ready
+DEADLINE_MESSAGE = "Maaf, permintaan Anda memakan waktu terlalu lama. Silakan coba lagi."
+
+skipped_stages = Counter(
+    "chatbot_deadline_skipped_total", "Stages not started because the request deadline had passed (work saved).", ["service", "stage"],
+)
+cancelled_generations = Counter(
+    "chatbot_generation_cancelled_total", "LLM generations stopped before the end, by deadline or client disconnect.", ["service", "reason"],
+)
+cancelled_tokens = Counter(
+    "chatbot_generation_cancelled_tokens_total", "Tokens generated by LLM calls that were then cancelled (work abandoned).", ["service", "reason"],
+)
+cancelled_seconds = Counter(
+    "chatbot_generation_cancelled_seconds_total", "Time spent on LLM calls that were then cancelled.", ["service", "reason"],
+)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the request's time budget ran out before a stage could start or finish.
+    """
+
+
+class RequestDeadline:
+    """
+    Service name and absolute deadline (time.monotonic()) of the current request.
+    """
+    def __init__(self, service, expires_at):
+        self.service = service
+        self.expires_at = expires_at
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def cancel(self):
+        """
+        Ends the budget now, so the next check_deadline() of the request raises.
+        """
+        self.expires_at = min(self.expires_at, time.monotonic())
+
+
+# Set for every request by DeadlineMiddleware; copied into the worker threads of sync endpoints
+_current = ContextVar("request_deadline", default=None)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def remaining():
+    """
+    Seconds left for the current request, or None outside a request.
+    """
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def check_deadline(stage):
+    """
+    Raises DeadlineExceeded (and counts the stage as skipped) when the current request is out of time.
+    """
+    deadline = _current.get()
+    if deadline is not None and deadline.remaining() <= 0:
+        skipped_stages.inc(service=deadline.service, stage=stage)
+        raise DeadlineExceeded(stage)
+
+
+@contextmanager
+def cancellable_deadline(service):
+    """
+    Runs the block under its own copy of the current deadline (REQUEST_BUDGET
+    from now outside a request) and yields it. Cancelling the copy stops the
+    block's remaining stages without ending the caller's request, which in
+    monolith mode is the same request.
+    """
+    parent = _current.get()
+    expires_at = parent.expires_at if parent is not None else time.monotonic() + REQUEST_BUDGET
+    deadline = RequestDeadline(service, expires_at)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def deadline_headers():
+    """
+    Headers forwarding the remaining budget to a downstream service.
+    """
+    left = remaining()
+    return {DEADLINE_HEADER: str(max(0, int(left * 1000)))} if left is not None else {}
+
+
+def record_cancellation(reason, tokens, seconds):
+    deadline = _current.get()
+    service = deadline.service if deadline is not None else "unknown"
+    cancelled_generations.inc(service=service, reason=reason)
+    cancelled_tokens.inc(tokens, service=service, reason=reason)
+    cancelled_seconds.inc(seconds, service=service, reason=reason)
+    logging.info(f"LLM generation cancelled ({reason}) after {tokens} tokens and {seconds:.2f}s")
+
+
+async def close_on_disconnect(iterator):
+    """
+    Streams a sync iterator from worker threads, like StreamingResponse does,
+    but closes it when the response is cancelled because the client
+    disconnected, so the generation behind it stops instead of running on.
+    """
+    try:
+        async for chunk in iterate_in_threadpool(iterator):
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # A generator still running on a worker thread, closed once it is collected
+                pass
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware setting the deadline of every request from the header, or
+    REQUEST_BUDGET seconds from now when the caller sent none.
+    """
+    def __init__(self, app, service):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = REQUEST_BUDGET
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1").lower() == DEADLINE_HEADER.lower():
+                try:
+                    budget = int(value) / 1000
+                except ValueError:
+                    logging.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {value!r}")
+                break
+        token = _current.set(RequestDeadline(self.service, time.monotonic() + budget))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+
+
+def install_deadline(app, service):
+    """
+    Gives every request of the service a deadline and answers 504 when it passes.
+    """
+    app.add_middleware(DeadlineMiddleware, service=service)
+
+    @app.exception_handler(DeadlineExceeded)
+    async def deadline_exceeded_handler(request, error):
+        logging.warning(f"Request deadline exceeded at {error}")
+        return JSONResponse(status_code=504, content={"detail": DEADLINE_MESSAGE})
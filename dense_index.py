@@ -0,0 +1,205 @@
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+import numpy as np
+import json
+import os
+import pickle
+
+# Rows scored per matrix product, bounds the temporary score buffer for large indexes
+SEARCH_BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(query_vector, candidate_vectors, k, lambda_mult=0.5):
+    """
+    Maximal marginal relevance over normalized vectors; returns positions into candidate_vectors.
+
+    Scores match LangChain's maximal_marginal_relevance: the first pick is the
+    most similar candidate, and every next pick maximizes
+    lambda_mult * sim(query) - (1 - lambda_mult) * max sim(already selected).
+    """
+    if len(candidate_vectors) == 0 or k <= 0:
+        return []
+    query_similarity = candidate_vectors @ query_vector
+    pairwise = candidate_vectors @ candidate_vectors.T
+    redundancy = np.full(len(candidate_vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidate_vectors), dtype=bool)
+
+    selected = [int(np.argmax(query_similarity))]
+    available[selected[0]] = False
+    while len(selected) < min(k, len(candidate_vectors)):
+        redundancy = np.maximum(redundancy, pairwise[:, selected[-1]])
+        scores = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+    return selected
+
+
+class DenseIndex:
+    """
+    Read-only dense vector index backed by a memory-mapped matrix.
+
+    build() writes the normalized embeddings as one contiguous float32 (or
+    float16) .npy matrix next to a pickle of the chunk documents. open() maps the
+    matrix read-only, so every worker process searching the same index shares
+    the same page-cache pages instead of holding its own copy.
+    """
+    VECTORS_FILE = "vectors.npy"
+    DOCUMENTS_FILE = "documents.pkl"
+    META_FILE = "meta.json"
+
+    def __init__(self, vectors, documents, meta):
+        self.vectors = vectors
+        self.documents = documents
+        self.meta = meta
+        self._rows_by_id = None
+
+    @classmethod
+    def build(cls, index_dir, documents, embeddings, dtype="float32", fingerprint=None, batch_rows=SEARCH_BLOCK_ROWS):
+        """
+        Writes a new index; embeddings may be any iterable of vectors aligned with documents.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        documents = list(documents)
+        embeddings = iter(embeddings)
+        first = np.asarray(next(embeddings), dtype=np.float32) if documents else None
+        dim = first.shape[0] if documents else 0
+
+        # Write to temporary files and swap them in, so readers never see a partial index
+        vectors_tmp = os.path.join(index_dir, cls.VECTORS_FILE + ".tmp")
+        if not documents:
+            with open(vectors_tmp, "wb") as f:
+                np.save(f, np.zeros((0, 0), dtype=np.dtype(dtype)))
+        else:
+            cls._write_vectors(vectors_tmp, first, embeddings, len(documents), dtype, batch_rows)
+
+        documents_tmp = os.path.join(index_dir, cls.DOCUMENTS_FILE + ".tmp")
+        with open(documents_tmp, "wb") as f:
+            pickle.dump(documents, f)
+        meta_tmp = os.path.join(index_dir, cls.META_FILE + ".tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "dtype": dtype, "rows": len(documents), "dim": dim}, f)
+
+        os.replace(vectors_tmp, os.path.join(index_dir, cls.VECTORS_FILE))
+        os.replace(documents_tmp, os.path.join(index_dir, cls.DOCUMENTS_FILE))
+        os.replace(meta_tmp, os.path.join(index_dir, cls.META_FILE))
+        return cls.open(index_dir)
+
+    @staticmethod
+    def _write_vectors(path, first, embeddings, rows, dtype, batch_rows):
+        matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.dtype(dtype), shape=(rows, first.shape[0]))
+        pending = [first]
+        row = 0
+        for vector in embeddings:
+            pending.append(vector)
+            if len(pending) == batch_rows:
+                matrix[row:row + len(pending)] = normalize_rows(pending)
+                row += len(pending)
+                pending = []
+        if pending:
+            matrix[row:row + len(pending)] = normalize_rows(pending)
+            row += len(pending)
+        if row != rows:
+            raise ValueError(f"Got {row} embeddings for {rows} documents")
+        matrix.flush()
+
+    @classmethod
+    def open(cls, index_dir):
+        with open(os.path.join(index_dir, cls.META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(index_dir, cls.VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, cls.DOCUMENTS_FILE), "rb") as f:
+            documents = pickle.load(f)
+        return cls(vectors, documents, meta)
+
+    @classmethod
+    def stored_fingerprint(cls, index_dir):
+        path = os.path.join(index_dir, cls.META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+
+    def __len__(self):
+        return len(self.documents)
+
+    def rows_for(self, ids):
+        """
+        Rows of the documents with the given chunk_id metadata, in order, skipping unknown ids.
+        """
+        if self._rows_by_id is None:
+            self._rows_by_id = {document.metadata.get("chunk_id"): row for row, document in enumerate(self.documents)}
+        return [self._rows_by_id[chunk_id] for chunk_id in ids if chunk_id in self._rows_by_id]
+
+    def search(self, query_vectors, k):
+        """
+        Batched exact cosine search; returns (indices, scores), each of shape (n_queries, k).
+        """
+        queries = normalize_rows(np.atleast_2d(query_vectors))
+        k = min(k, len(self))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_indices = np.concatenate([best_indices, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_indices = np.take_along_axis(best_indices, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_indices, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def mmr(self, query_vector, k=4, fetch_k=20, lambda_mult=0.5):
+        """
+        Returns the indices of k diverse results chosen by MMR among the fetch_k nearest chunks.
+        """
+        if len(self) == 0:
+            return []
+        query = normalize_rows(query_vector)
+        candidates, _ = self.search(query, fetch_k)
+        candidates = candidates[0]
+        candidate_vectors = np.asarray(self.vectors[np.sort(candidates)], dtype=np.float32)
+        # Read the rows in file order, then put them back in ranked order
+        candidate_vectors = candidate_vectors[np.argsort(np.argsort(candidates))]
+        return [int(candidates[i]) for i in mmr_select(query, candidate_vectors, k, lambda_mult)]
+
+
+class DenseRetriever(BaseRetriever):
+    """
+    LangChain retriever over a DenseIndex, a drop-in replacement for the Chroma MMR retriever.
+    """
+    index: DenseIndex
+    embeddings: Embeddings
+    search_type: str = "mmr"
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def search_by_vector(self, query_vector):
+        if self.search_type == "mmr":
+            indices = self.index.mmr(query_vector, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult)
+        else:
+            indices = self.index.search(query_vector, self.k)[0][0].tolist()
+        return [self.index.documents[i] for i in indices]
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        return self.search_by_vector(self.embeddings.embed_query(query))
@@ -0,0 +1,123 @@
+from doctor_schedule import DOCTOR_TITLES, normalize_name, strip_title
+import os
+
+# Minimum confidence for a gazetteer match to be used without asking the LLM
+GAZETTEER_CONFIDENCE_THRESHOLD = float(os.getenv("DOCTOR_GAZETTEER_THRESHOLD", 0.6))
+
+# Bonus when a matched name directly follows "dr", "dok" or "dokter"
+TITLE_BONUS = 0.3
+
+
+def max_edits(token):
+    """
+    Typos tolerated for a token: none for short tokens, one up to 7 letters, two beyond.
+    """
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 7 else 2
+
+
+class TokenTrie:
+    """
+    Character trie over name tokens with bounded edit-distance search.
+    """
+    def __init__(self, tokens=()):
+        self.root = {}
+        for token in tokens:
+            self.add(token)
+
+    def add(self, token):
+        node = self.root
+        for char in token:
+            node = node.setdefault(char, {})
+        node[None] = token
+
+    def search(self, word, max_distance):
+        """
+        Returns {token: edit_distance} for every token within max_distance of word.
+        """
+        results = {}
+        first_row = list(range(len(word) + 1))
+        for char, child in self.root.items():
+            if char is not None:
+                self._search(child, char, word, first_row, max_distance, results)
+        return results
+
+    def _search(self, node, char, word, previous_row, max_distance, results):
+        # One Levenshtein DP row per trie edge; prune once the whole row exceeds max_distance
+        row = [previous_row[0] + 1]
+        for i in range(1, len(word) + 1):
+            row.append(min(
+                row[i - 1] + 1,
+                previous_row[i] + 1,
+                previous_row[i - 1] + (word[i - 1] != char),
+            ))
+        if None in node and row[-1] <= max_distance:
+            results[node[None]] = row[-1]
+        if min(row) <= max_distance:
+            for next_char, child in node.items():
+                if next_char is not None:
+                    self._search(child, next_char, word, row, max_distance, results)
+
+
+class DoctorGazetteer:
+    """
+    Resolves a doctor straight from the user's query by matching the tokens of
+    every doctor's name, tolerating titles ("dr", "dok", "dokter") and small typos.
+
+    A doctor's confidence is the similarity-weighted share of its name tokens
+    found in the query, plus TITLE_BONUS when a match directly follows a title,
+    capped at 1. Ambiguous matches (two doctors with the same best confidence)
+    are rejected.
+
+    A strict match additionally needs an exact name token or at least two
+    matched name tokens, so that a single near miss after a title ("dokter
+    saraf" for Dr. Sarah) is left to the LLM instead of answering for the
+    wrong doctor.
+    """
+    def __init__(self, doctors):
+        self.doctors = list(doctors)
+        self.name_tokens = [strip_title(normalize_name(doctor.name)).split() for doctor in self.doctors]
+        self.doctors_by_token = {}
+        for position, tokens in enumerate(self.name_tokens):
+            for token in set(tokens):
+                self.doctors_by_token.setdefault(token, []).append(position)
+        self.trie = TokenTrie(self.doctors_by_token)
+
+    def match(self, query, strict=False):
+        """
+        Returns (doctor, confidence) for the best match, or (None, 0.0).
+        """
+        query_tokens = normalize_name(query).split()
+
+        # Best similarity of each name token per doctor, and whether a title preceded it
+        similarities = {}
+        titled = set()
+        exact = set()
+        for i, word in enumerate(query_tokens):
+            if word in DOCTOR_TITLES:
+                continue
+            for token, distance in self.trie.search(word, max_edits(word)).items():
+                similarity = 1 - distance / max(len(word), len(token))
+                for position in self.doctors_by_token[token]:
+                    per_token = similarities.setdefault(position, {})
+                    per_token[token] = max(per_token.get(token, 0.0), similarity)
+                    if distance == 0:
+                        exact.add(position)
+                    if i > 0 and query_tokens[i - 1] in DOCTOR_TITLES:
+                        titled.add(position)
+
+        scored = sorted(
+            (
+                min(1.0, sum(per_token.values()) / len(self.name_tokens[position]) + (TITLE_BONUS if position in titled else 0.0)),
+                position,
+            )
+            for position, per_token in similarities.items()
+            if not strict or position in exact or len(per_token) >= 2
+        )
+        if not scored:
+            return None, 0.0
+        confidence, position = scored[-1]
+        if len(scored) > 1 and scored[-2][0] == confidence:
+            return None, 0.0
+        return self.doctors[position], confidence
@@ -0,0 +1,172 @@
+from metrics import stage
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Path to the doctors database
+DATABASE_PATH = "doctors.db"
+
+# How often the background watcher checks doctors.db for changes (seconds)
+SCHEDULE_CHECK_INTERVAL = float(os.getenv("DOCTOR_SCHEDULE_CHECK_INTERVAL", 2))
+
+# Titles users put in front of a doctor's name
+DOCTOR_TITLES = {"dr", "dok", "dokter"}
+
+
+def normalize_name(name):
+    """
+    Lowercases a name and strips punctuation and extra whitespace ("Dr. Budi  Santoso" -> "dr budi santoso").
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+
+def strip_title(normalized_name):
+    tokens = normalized_name.split()
+    while tokens and tokens[0] in DOCTOR_TITLES:
+        tokens = tokens[1:]
+    return " ".join(tokens)
+
+
+class Doctor:
+    """
+    A doctor with availability slots and pre-rendered schedule lines.
+    """
+    __slots__ = ("id", "name", "specialization", "availability", "slot_lines", "schedule_text")
+
+    def __init__(self, doctor_id, name, specialization, availability):
+        self.id = doctor_id
+        self.name = name
+        self.specialization = specialization
+        self.availability = availability  # [(day, time_start, time_end), ...]
+        self.slot_lines = [f"Hari: {day}, Pukul: {time_start} - {time_end}" for day, time_start, time_end in availability]
+        self.schedule_text = "".join(f"{line}\n" for line in self.slot_lines)
+
+
+class ScheduleSnapshot:
+    """
+    Immutable in-memory copy of doctors.db, indexed for the request hot path.
+
+    Services may memoize anything derived from a snapshot (rendered schedule
+    text, lookup indexes) with memo(); the memo lives and dies with the
+    snapshot, so it never outlives a reload.
+    """
+    def __init__(self, doctors, disease_to_specialization, version):
+        self.version = version
+        self.doctors = doctors
+        self.doctors_by_id = {doctor.id: doctor for doctor in doctors}
+        self.doctors_by_name = {}
+        self.doctors_by_specialization = {}
+        for doctor in doctors:
+            normalized = normalize_name(doctor.name)
+            self.doctors_by_name.setdefault(normalized, doctor)
+            self.doctors_by_name.setdefault(strip_title(normalized), doctor)
+            self.doctors_by_specialization.setdefault(doctor.specialization, []).append(doctor)
+        self.disease_to_specialization = disease_to_specialization  # [(disease_or_symptom, specialization), ...]
+        self._memo = {}
+
+    def find_doctor(self, name):
+        normalized = normalize_name(name)
+        return self.doctors_by_name.get(normalized) or self.doctors_by_name.get(strip_title(normalized))
+
+    def memo(self, key, build):
+        """
+        Returns build() and caches the result for the lifetime of this snapshot.
+        """
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = build()
+            return value
+
+    @classmethod
+    def load(cls, connection, version):
+        cursor = connection.cursor()
+        cursor.execute("SELECT doctor_id, day, time_start, time_end FROM availability ORDER BY id")
+        availability = {}
+        for doctor_id, day, time_start, time_end in cursor.fetchall():
+            availability.setdefault(doctor_id, []).append((day, time_start, time_end))
+
+        cursor.execute("SELECT id, name, specialization FROM doctors ORDER BY id")
+        doctors = [
+            Doctor(doctor_id, name, specialization, availability.get(doctor_id, []))
+            for doctor_id, name, specialization in cursor.fetchall()
+        ]
+
+        cursor.execute("SELECT disease_or_symptom, specialization FROM disease_to_specialization ORDER BY id")
+        return cls(doctors, cursor.fetchall(), version)
+
+
+class ScheduleStore:
+    """
+    Holds the current ScheduleSnapshot and swaps in a new one when doctors.db changes.
+
+    A daemon thread polls the file's mtime/size and SQLite's data_version every
+    check_interval seconds and reloads in the background, so snapshot() is a
+    plain attribute read and requests never touch the database.
+    """
+    def __init__(self, db_path=DATABASE_PATH, check_interval=SCHEDULE_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._watch_connection = None
+        self._watcher = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self.refresh()
+            with self._lock:
+                self._start_watcher()
+        return self._snapshot
+
+    def refresh(self):
+        """
+        Reloads the snapshot if the database changed; returns True when a new snapshot was loaded.
+        """
+        with self._lock:
+            stamp = self._current_stamp()
+            if self._snapshot is not None and stamp == self._stamp:
+                return False
+            connection = sqlite3.connect(self.db_path)
+            try:
+                with stage("db.load_schedule"):
+                    snapshot = ScheduleSnapshot.load(connection, version=(self._snapshot.version + 1) if self._snapshot else 1)
+            finally:
+                connection.close()
+            self._snapshot, self._stamp = snapshot, stamp
+            logging.info(f"Loaded doctor schedule snapshot v{snapshot.version} ({len(snapshot.doctors)} doctors)")
+            return True
+
+    def _current_stamp(self):
+        stat = os.stat(self.db_path)
+        wal_path = f"{self.db_path}-wal"
+        wal_mtime = os.stat(wal_path).st_mtime_ns if os.path.exists(wal_path) else None
+        if self._watch_connection is None:
+            self._watch_connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        data_version = self._watch_connection.execute("PRAGMA data_version").fetchone()[0]
+        return stat.st_mtime_ns, stat.st_size, wal_mtime, data_version
+
+    def _start_watcher(self):
+        if self._watcher is not None or self.check_interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="doctor-schedule-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error while reloading doctor schedule: {e}")
+
+
+# Shared store used by the doctor services
+schedule_store = ScheduleStore()
+
+def get_snapshot():
+    return schedule_store.snapshot()
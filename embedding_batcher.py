@@ -0,0 +1,118 @@
+from collections import deque
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from embedding_model import embedding_model_id
+from metrics import Histogram
+import logging
+import statistics
+import threading
+import time
+
+# Number of recent batches and queue delays kept for the percentiles of stats()
+BATCH_SAMPLES = 1000
+
+batch_size_histogram = Histogram(
+    "chatbot_embedding_batch_size", "Queries embedded per forward pass.", ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+queue_delay_histogram = Histogram(
+    "chatbot_embedding_queue_delay_seconds", "Time a query waited for its embedding batch to start.", ["batcher"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """
+    Embeddings whose embed_query calls from concurrent threads are embedded
+    together: the first query of a batch waits up to window seconds for others
+    (or until max_batch_size queries are queued), then one worker thread embeds
+    them in a single forward pass and hands every caller its vector. Queries
+    that arrive while a batch is running are sent as soon as it ends if their
+    window has already passed.
+
+    embed_documents (indexing) goes straight to the wrapped embeddings.
+    """
+    def __init__(self, embeddings, window=0.005, max_batch_size=32, name="query"):
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self.model_id = embedding_model_id(embeddings)
+        self.batches = 0
+        self.queries = 0
+        self.batch_sizes = deque(maxlen=BATCH_SAMPLES)
+        self.queue_delays = deque(maxlen=BATCH_SAMPLES)
+        self._queue = []  # (text, Future, enqueued_at)
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        future = Future()
+        with self._condition:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"embedding-batcher-{self.name}", daemon=True)
+                self._worker.start()
+            self._queue.append((text, future, time.perf_counter()))
+            self._condition.notify()
+        return future.result()
+
+    def _next_batch(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue)
+            deadline = self._queue[0][2] + self.window
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            self._record(batch, started)
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Embedding batch of {len(batch)} queries failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _record(self, batch, started):
+        self.batches += 1
+        self.queries += len(batch)
+        self.batch_sizes.append(len(batch))
+        batch_size_histogram.observe(len(batch), batcher=self.name)
+        for _, _, enqueued_at in batch:
+            delay = started - enqueued_at
+            self.queue_delays.append(delay)
+            queue_delay_histogram.observe(delay, batcher=self.name)
+
+    def stats(self):
+        """
+        Batch size and queueing delay summary over the recent batches; /metrics has the histograms.
+        """
+        sizes, delays = sorted(self.batch_sizes), sorted(self.queue_delays)
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": round(statistics.fmean(sizes), 2) if sizes else None,
+            "p95_batch_size": percentile(sizes, 0.95),
+            "p50_queue_delay_ms": round(percentile(delays, 0.50) * 1000, 3) if delays else None,
+            "p95_queue_delay_ms": round(percentile(delays, 0.95) * 1000, 3) if delays else None,
+        }
@@ -0,0 +1,34 @@
+from functools import lru_cache
+import os
+
+# Sentence embedding model shared by the RAG index and the intent classifier
+EMBEDDING_MODEL_NAME = "LazarusNLP/all-indo-e5-small-v4"
+
+# "torch" runs the model with sentence-transformers; "onnx" runs the model
+# exported by `python onnx_embeddings.py` (int8-quantized) on ONNX Runtime
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./models/all-indo-e5-small-v4-onnx")
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", 0))  # 0: one per core
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+
+@lru_cache(maxsize=None)
+def get_embeddings(backend=None):
+    """
+    Returns the process-wide embeddings object, loading the model on first use.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        if not os.path.exists(EMBEDDING_ONNX_DIR):
+            raise FileNotFoundError(f"No ONNX model in {EMBEDDING_ONNX_DIR}, export it with `python onnx_embeddings.py`")
+        return OnnxEmbeddings(EMBEDDING_ONNX_DIR, threads=EMBEDDING_ONNX_THREADS, batch_size=EMBEDDING_BATCH_SIZE)
+    # Imported here so importing a service does not pay for loading torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE})
+
+def embedding_model_id(embeddings):
+    """
+    Identifies the model and backend behind an embeddings object. Vectors of
+    different ids are not comparable closely enough to share an index.
+    """
+    return getattr(embeddings, "model_id", None) or getattr(embeddings, "model_name", None)
@@ -1,5 +1,7 @@
 import streamlit as st
 import httpx
+import os
+import time
 
 # Streamlit App Config
 st.set_page_config(page_title="AI ChatBot Rumah Sakit", layout="centered")
@@ -7,6 +9,13 @@ st.title("AI Customer Service Rumah Sakit")
 
 # Backend API URL
 API_URL = "http://localhost:8000/chat"
+STREAM_API_URL = "http://localhost:8000/chat/stream"
+STREAMING_ENABLED = os.getenv("CHATBOT_STREAMING", "1") == "1"
+
+# Seconds to wait for a reply. The backend gets a slightly smaller budget, so it
+# stops the generation and answers with a timeout message before we give up.
+REQUEST_TIMEOUT = 200
+DEADLINE_HEADERS = {"X-Request-Deadline-Ms": str((REQUEST_TIMEOUT - 5) * 1000)}
 
 # Session State for Context and Messages
 # if "context" not in st.session_state:
@@ -14,6 +23,19 @@ API_URL = "http://localhost:8000/chat"
 if "messages" not in st.session_state:
     st.session_state.messages = []  # To store chat history
 
+# Yields the reply chunks as they arrive and records time-to-first-token and total latency
+def stream_chat(query, timings):
+    start_time = time.perf_counter()
+    with httpx.stream("POST", STREAM_API_URL, json={"query": query}, headers=DEADLINE_HEADERS, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        for chunk in response.iter_text():
+            if not chunk:
+                continue
+            if "ttft" not in timings:
+                timings["ttft"] = time.perf_counter() - start_time
+            yield chunk
+    timings["total"] = time.perf_counter() - start_time
+
 # Chat UI
 for message in st.session_state.messages:
     if message["role"] == "user":
@@ -32,18 +54,30 @@ if user_input := st.chat_input("Masukkan pertanyaan Anda di sini..."):
 
     # Send request to FastAPI
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
+        if STREAMING_ENABLED:
             try:
-                response = httpx.post(
-                    API_URL,
-                    # json={"context": st.session_state.context, "query": user_input}
-                    json={"query": user_input},
-                    timeout=200
-                )
-                response_data = response.json()
-                bot_response = response_data["response"]
-                # st.session_state.context = response_data["context"]
+                timings = {}
+                bot_response = st.write_stream(stream_chat(user_input, timings))
                 st.session_state.messages.append({"role": "bot", "content": bot_response})
-                st.markdown(bot_response)
+                st.caption(
+                    f"Token pertama: {timings.get('ttft', 0):.2f} detik · Total: {timings.get('total', 0):.2f} detik"
+                )
             except Exception as e:
                 st.error(f"Error: {e}")
+        else:
+            with st.spinner("Thinking..."):
+                try:
+                    response = httpx.post(
+                        API_URL,
+                        # json={"context": st.session_state.context, "query": user_input}
+                        json={"query": user_input},
+                        headers=DEADLINE_HEADERS,
+                        timeout=REQUEST_TIMEOUT
+                    )
+                    response_data = response.json()
+                    bot_response = response_data["response"]
+                    # st.session_state.context = response_data["context"]
+                    st.session_state.messages.append({"role": "bot", "content": bot_response})
+                    st.markdown(bot_response)
+                except Exception as e:
+                    st.error(f"Error: {e}")
@@ -1,30 +1,42 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-from Levenshtein import ratio
-import sqlite3
+from typing import Optional
+from llm import get_llm, install_busy_handler
+from llm_memo import MemoizedPrompt, llm_memo_stats
+from doctor_schedule import get_snapshot
+from singleflight import single_flight, singleflight_stats
+from metrics import install_metrics, timed_stage
+from deadline import install_deadline
+from readiness import Warmup, install_readiness
+from fuzzy_index import FuzzyIndex
 
 # Initialize the FastAPI app
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "doctor_disease")
+install_deadline(app, "doctor_disease")
 
 # Initialize the model
-model = OllamaLLM(model="llama3")
+model = get_llm("extraction", temperature=0)
+
+# Load the doctor schedule snapshot (reloaded in the background when doctors.db changes)
+# on a background thread, so /check answers immediately and /ready once it is loaded
+warmup = Warmup("doctor_disease")
+install_readiness(app, warmup)
+warmup.add_step("doctor_schedule.load", get_snapshot)
+warmup.start()
 
 # Request and Response Models
 class QueryRequest(BaseModel):
     query: str
+    disease: Optional[str] = None  # Slot filled by the intent service in joint mode
 
 class DoctorDiseaseResponse(BaseModel):
     doctor_name: str
     availability: str
 
 
-def extract_disease_or_symptom(query):
-    """
-    Extracts the disease or symptom from the user's query using the LLM.
-    """
-    disease_extraction_template = """
+disease_extraction_template = """
     Please extract the disease or symptom mentioned in the user's query.
 
     Query: {question}
@@ -33,110 +45,97 @@ def extract_disease_or_symptom(query):
     - Provide only the disease or symptom as it is (dont translate to English), nothing else.
     - Use proper capitalization for the extracted disease or symptom.
     """
-    prompt = ChatPromptTemplate.from_template(disease_extraction_template)
-    extraction_chain = prompt | model
+# Prompt and chain built once, memoized for repeated queries
+disease_extraction_prompt = MemoizedPrompt(
+    "disease-extraction", disease_extraction_template, model, deadline_stage="doctor_disease.llm_extraction",
+)
 
-    extracted_disease = extraction_chain.invoke({"question": query})
-    return extracted_disease.strip()
+
+@timed_stage("extract_disease_or_symptom")
+@single_flight("disease-extraction")
+def extract_disease_or_symptom(query):
+    """
+    Extracts the disease or symptom from the user's query using the LLM.
+    """
+    return disease_extraction_prompt.invoke(query)
 
 
+@timed_stage("disease_index.match")
 def get_specialization_from_disease_or_symptom(disease_or_symptom):
     """
     Maps the extracted disease or symptom to a specialization using fuzzy matching.
     """
-    conn = sqlite3.connect('doctors.db')
-    cursor = conn.cursor()
-
-    # Fetch all diseases and their specializations
-    cursor.execute("""
-        SELECT disease_or_symptom, specialization
-        FROM disease_to_specialization
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-
-    if not rows:
+    snapshot = get_snapshot()
+    if not snapshot.disease_to_specialization:
         return None
 
-    # Use fuzzy matching to find the best match
-    best_match = None
-    best_ratio = 0.0
-    for disease, specialization in rows:
-        similarity = ratio(disease_or_symptom.lower(), disease.lower())
-        if similarity > best_ratio:
-            best_match = specialization
-            best_ratio = similarity
+    # Use the n-gram index (built once per schedule snapshot) to find the best match
+    disease_index = snapshot.memo("disease-index", lambda: FuzzyIndex(snapshot.disease_to_specialization))
 
     # Apply a threshold to decide if the match is good enough
     threshold = 0.7  # Adjust as needed
-    if best_ratio >= threshold:
-        return best_match
-    else:
-        return None
+    best_match, _ = disease_index.best_match(disease_or_symptom, threshold)
+    return best_match
 
 
+@timed_stage("db.fetch_availability")
 def fetch_doctor_availability_by_specialty(specialty):
     """
     Fetches and returns the doctor's availability and name based on the specialization.
     """
-    conn = sqlite3.connect('doctors.db')
-    cursor = conn.cursor()
-
-    availability_text = f"Jadwal dokter dengan spesialisasi {specialty}:"
-    doctor_name = None
-
-    # Select doctors with the given specialty
-    cursor.execute("""
-        SELECT id, name
-        FROM doctors
-        WHERE specialization = ?
-    """, (specialty,))
-    doctors = cursor.fetchall()
-
-    if doctors:  # If doctors are found for the given specialty
-        for doctor in doctors:
-            doctor_id, doctor_name = doctor
-
-            # Fetch the doctor's availability
-            cursor.execute("""
-                SELECT day, time_start, time_end
-                FROM availability
-                WHERE doctor_id = ?
-            """, (doctor_id,))
-            availability = cursor.fetchall()
-
-            if availability:  # If availability data exists
-                availability_text += f"\nDokter: {doctor_name}"
-                for entry in availability:
-                    day, time_start, time_end = entry
-                    availability_text += f"\nHari: {day}, Pukul: {time_start} - {time_end}"
-            else:
-                availability_text += f"\nDokter {doctor_name} tidak memiliki jadwal yang tersedia."
-    else:
-        availability_text += f"\nTidak ditemukan dokter dengan spesialisasi {specialty}."
-
-    conn.close()
-    return doctor_name, availability_text
+    snapshot = get_snapshot()
+    doctors = snapshot.doctors_by_specialization.get(specialty, [])
+
+    def render():
+        availability_text = f"Jadwal dokter dengan spesialisasi {specialty}:"
+        if doctors:  # If doctors are found for the given specialty
+            for doctor in doctors:
+                if doctor.slot_lines:  # If availability data exists
+                    availability_text += f"\nDokter: {doctor.name}"
+                    for line in doctor.slot_lines:
+                        availability_text += f"\n{line}"
+                else:
+                    availability_text += f"\nDokter {doctor.name} tidak memiliki jadwal yang tersedia."
+        else:
+            availability_text += f"\nTidak ditemukan dokter dengan spesialisasi {specialty}."
+        return availability_text
+
+    doctor_name = doctors[-1].name if doctors else None
+    return doctor_name, snapshot.memo(("disease-specialty", specialty), render)
 
 # Microservices check
 @app.get("/check")   
 def health_check():
     return {"status": "ok"}
 
+# Coalesced request counters
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+@app.get("/llm-memo-stats")
+def memo_stats():
+    return llm_memo_stats()
+
 @app.post("/doctor-availability-by-disease", response_model=DoctorDiseaseResponse)
-async def get_doctor_availability(request: QueryRequest):
+def get_doctor_availability(request: QueryRequest):
     """
     Process the user query, extract the disease or symptom, map it to a specialization, 
     and fetch the doctor's availability for the mapped specialization.
     """
-    # Step 1: Extract disease or symptom from user query using LLM
-    extracted_disease = extract_disease_or_symptom(request.query)
-    
-    if not extracted_disease:
-        raise HTTPException(status_code=400, detail="Gejala atau penyakit tidak dapat diidentifikasi.")
-    
-    # Step 2: Map the extracted disease or symptom to a specialization
-    specialization = get_specialization_from_disease_or_symptom(extracted_disease)
+    # Step 1 and 2: Map the disease slot from the intent service to a specialization,
+    # extracting the disease or symptom with the LLM when there is no usable slot
+    specialization = None
+    if request.disease:
+        specialization = get_specialization_from_disease_or_symptom(request.disease)
+
+    if not specialization:
+        extracted_disease = extract_disease_or_symptom(request.query)
+
+        if not extracted_disease:
+            raise HTTPException(status_code=400, detail="Gejala atau penyakit tidak dapat diidentifikasi.")
+
+        specialization = get_specialization_from_disease_or_symptom(extracted_disease)
     
     if not specialization:
         raise HTTPException(status_code=400, detail="Gejala atau penyakit tersebut tidak ditemukan dalam database.")
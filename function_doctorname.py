@@ -1,25 +1,43 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-import sqlite3
+from typing import Optional
+from llm import get_llm, install_busy_handler
+from llm_memo import MemoizedPrompt, llm_memo_stats
+from doctor_schedule import get_snapshot
+from singleflight import single_flight, singleflight_stats
+from metrics import install_metrics, stage, timed_stage
+from deadline import install_deadline
+from readiness import Warmup, install_readiness
+from doctor_gazetteer import DoctorGazetteer, GAZETTEER_CONFIDENCE_THRESHOLD
+import logging
 
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "doctor_name")
+install_deadline(app, "doctor_name")
 
 # Initialize the model
-model = OllamaLLM(model="llama3")
+model = get_llm("extraction", temperature=0)
+
+# Load the doctor schedule snapshot (reloaded in the background when doctors.db changes)
+# on a background thread, so /check answers immediately and /ready once it is loaded
+warmup = Warmup("doctor_name")
+install_readiness(app, warmup)
+warmup.add_step("doctor_schedule.load", get_snapshot)
+warmup.start()
 
 # Define the request and response models
 class QueryRequest(BaseModel):
     query: str
+    doctor_name: Optional[str] = None  # Slot filled by the intent service in joint mode
 
 class DoctorNameResponse(BaseModel):
     doctor: str
     availability: str
+    source: str = "llm"  # "gazetteer", "slot" or "llm"
 
-def doctor_extraction(query):
-    # Define the prompt template
-    doctor_extraction_template = """
+# Define the prompt template
+doctor_extraction_template = """
     Please extract the doctor name from the query.
 
     Query: {question}
@@ -30,66 +48,76 @@ def doctor_extraction(query):
     - Don't explain anything just return the doctor's name with above format.
     """
 
-    # Define the prompt and chain
-    doctor_extractor = ChatPromptTemplate.from_template(doctor_extraction_template)
-    doctor_extraction_chain = doctor_extractor | model
-    
+# Define the prompt and chain, memoized for repeated queries
+doctor_extraction_prompt = MemoizedPrompt(
+    "doctor-extraction", doctor_extraction_template, model, deadline_stage="doctor_name.llm_extraction",
+)
+
+@timed_stage("doctor_extraction")
+@single_flight("doctor-extraction")
+def doctor_extraction(query):
     # Invoke the chain and get the result
-    extracted_doctor = doctor_extraction_chain.invoke({"question": query}).strip()
+    extracted_doctor = doctor_extraction_prompt.invoke(query)
     return extracted_doctor  # Return the extracted doctor name
 
+def get_gazetteer():
+    # Rebuilt automatically whenever the schedule snapshot is reloaded
+    snapshot = get_snapshot()
+    return snapshot.memo("doctor-gazetteer", lambda: DoctorGazetteer(snapshot.doctors))
+
+def resolve_doctor(query, doctor_name=None):
+    """
+    Resolves the doctor from the query, calling the LLM only when the gazetteer is not confident.
+    A doctor_name slot already extracted by the intent service replaces the LLM call.
+    Returns (doctor or None, extracted name, source).
+    """
+    with stage("gazetteer.match"):
+        doctor, confidence = get_gazetteer().match(query, strict=True)
+    if doctor and confidence >= GAZETTEER_CONFIDENCE_THRESHOLD:
+        return doctor, doctor.name, "gazetteer"
+
+    if doctor_name:
+        extracted_doctor, source = doctor_name, "slot"
+    else:
+        extracted_doctor, source = doctor_extraction(query), "llm"
+    logging.info(f"Extracted doctor ({source}): {extracted_doctor}")
+
+    doctor = get_snapshot().find_doctor(extracted_doctor)
+    if doctor is None:
+        # The LLM may return a partial or misspelled name, match it against the gazetteer
+        doctor, confidence = get_gazetteer().match(extracted_doctor)
+        if confidence < GAZETTEER_CONFIDENCE_THRESHOLD:
+            doctor = None
+    return doctor, extracted_doctor, source
+
 # Microservices check
 @app.get("/check")   
 def health_check():
     return {"status": "ok"}
 
+# Coalesced request counters
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+@app.get("/llm-memo-stats")
+def memo_stats():
+    return llm_memo_stats()
+
 @app.post("/doctor-availability-by-name", response_model=DoctorNameResponse)
-async def get_doctor_availability(request: QueryRequest):
+def get_doctor_availability(request: QueryRequest):
     query = request.query
     
-    # Step 1: Extract doctor's name from the query
-    extracted_doctor = doctor_extraction(query)
-    print(f"Extracted Doctor: {extracted_doctor}")  # Debugging: Print the result
-
-    conn = sqlite3.connect('doctors.db')
-    cursor = conn.cursor()
-
-    # Step 2: Fetch doctor's ID from the database
-    cursor.execute(f"SELECT id FROM doctors WHERE name = '{extracted_doctor}'")
-    doctor = cursor.fetchone()  # Fetch the result (single row)
+    # Step 1 and 2: Resolve the doctor from the query (gazetteer first, LLM as fallback)
+    doctor, extracted_doctor, source = resolve_doctor(query, request.doctor_name)
 
     if doctor:  # Check if the doctor exists
-        doctor_id = doctor[0]  # Get the doctor's ID from the first column
-
-        # Step 3: Fetch doctor's availability
-        cursor.execute(f"""
-            SELECT day, time_start, time_end
-            FROM availability
-            WHERE doctor_id = {doctor_id}
-        """)
-        availability = cursor.fetchall()  # Fetch all availability rows
-
-        # Format the availability response
-        availability_text = ""
-        for entry in availability:
-            if len(entry) == 3:  # Ensure the tuple has 3 values (day, time_start, time_end)
-                day, time_start, time_end = entry
-                availability_text += f"Hari: {day}, Pukul: {time_start} - {time_end}\n"
-            else:
-                # Handle any unexpected data structure (optional logging)
-                print(f"Data: {entry}, tidak bisa diakses.")
-
-        if not availability_text:
+        # Step 3: Use the doctor's pre-rendered availability
+        if not doctor.schedule_text:
             raise HTTPException(status_code=404, detail="Jadwal dokter tidak bisa ditemukan.")
 
-        conn.close()
-
-        if not availability:
-            raise HTTPException(status_code=404, detail="Jadwal dokter tidak bisa ditemukan.")
-        
-        return DoctorNameResponse(doctor=extracted_doctor, availability=availability_text)
+        return DoctorNameResponse(doctor=doctor.name, availability=doctor.schedule_text, source=source)
     else:
-        conn.close()
         raise HTTPException(status_code=404, detail="Dokter tidak ditemukan.")
 
 # Run the app
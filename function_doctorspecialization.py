@@ -1,15 +1,31 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+from typing import Optional
+from llm import get_llm, install_busy_handler, is_busy
+from llm_memo import MemoizedPrompt, llm_memo_stats
 from Levenshtein import distance
-import sqlite3
+from doctor_schedule import get_snapshot
+from singleflight import single_flight, singleflight_stats
+from metrics import install_metrics, stage, timed_stage
+from deadline import DeadlineExceeded, install_deadline
+from readiness import Warmup, install_readiness
+from specialty_resolver import match_specialty
 
 # Initialize the FastAPI app
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "doctor_specialization")
+install_deadline(app, "doctor_specialization")
 
 # Initialize the model
-model = OllamaLLM(model="llama3")
+model = get_llm("extraction", temperature=0)
+
+# Load the doctor schedule snapshot (reloaded in the background when doctors.db changes)
+# on a background thread, so /check answers immediately and /ready once it is loaded
+warmup = Warmup("doctor_specialization")
+install_readiness(app, warmup)
+warmup.add_step("doctor_schedule.load", get_snapshot)
+warmup.start()
 
 # Predefined specialties
 specialties = [
@@ -22,10 +38,12 @@ specialties = [
 # Request and Response Models
 class SpecialtyRequest(BaseModel):
     query: str
+    specialty: Optional[str] = None  # Slot filled by the intent service in joint mode
 
 class SpecialtyResponse(BaseModel):
     specialty: str
     availability: str
+    source: str = "llm"  # "rule", "slot" or "llm"
 
 
 # Helper function to match specialties using Levenshtein distance
@@ -50,9 +68,7 @@ def get_best_match(extracted_specialty, specialties):
     return best_match if best_distance <= threshold else None
 
 
-# Function to extract the specialty using LLM
-def specialty_extraction(query):
-    specialty_extraction_template = """
+specialty_extraction_template = """
     Please extract the specialty from the query.
 
     Query: {question}
@@ -65,55 +81,80 @@ def specialty_extraction(query):
     - Don't translate it to English.
     - Capitalize the first letter.
     """
-    prompt = ChatPromptTemplate.from_template(specialty_extraction_template)
-    specialty_extraction_chain = prompt | model
+# Corrects the extracted specialty to a known one; None when the output is blank or matches none
+def match_extracted_specialty(extracted_specialty):
+    extracted_specialty = extracted_specialty.strip()
+    return get_best_match(extracted_specialty, specialties) if extracted_specialty else None
+
+# Prompt and chain built once, memoized for repeated queries (outputs matching no specialty are not stored)
+specialty_extraction_prompt = MemoizedPrompt(
+    "specialty-extraction", specialty_extraction_template, model,
+    parse=match_extracted_specialty, deadline_stage="doctor_specialization.llm_extraction",
+)
 
-    extracted_specialty = specialty_extraction_chain.invoke({"question": query}).strip()
-    corrected_specialty = get_best_match(extracted_specialty, specialties)
-    return corrected_specialty
+
+# Function to extract the specialty using LLM
+@timed_stage("specialty_extraction")
+@single_flight("specialty-extraction")
+def specialty_extraction(query):
+    return specialty_extraction_prompt.invoke(query)
+
+
+# Function to resolve the specialty, scanning for known synonyms before asking the LLM.
+# A specialty slot already extracted by the intent service replaces the LLM call.
+def resolve_specialty(query, specialty_slot=None):
+    with stage("specialty_rules.match"):
+        specialty = match_specialty(query)
+    if specialty:
+        return specialty, "rule"
+    if specialty_slot:
+        specialty = match_specialty(specialty_slot) or get_best_match(specialty_slot, specialties)
+        if specialty:
+            return specialty, "slot"
+    return specialty_extraction(query), "llm"
 
 
 # Function to fetch doctor availability
+@timed_stage("db.fetch_availability")
 def fetch_doctor_availability_by_specialty(specialty):
-    conn = sqlite3.connect('doctors.db')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT id, name FROM doctors WHERE specialization = ?
-    """, (specialty,))
-    doctors = cursor.fetchall()
+    snapshot = get_snapshot()
+    doctors = snapshot.doctors_by_specialization.get(specialty)
 
     if not doctors:
-        conn.close()
         return None, f"Tidak ditemukan dokter dengan spesialisasi {specialty}."
 
-    availability_text = ""
-    for doctor_id, doctor_name in doctors:
-        cursor.execute("""
-            SELECT day, time_start, time_end FROM availability WHERE doctor_id = ?
-        """, (doctor_id,))
-        availability = cursor.fetchall()
+    def render():
+        availability_text = ""
+        for doctor in doctors:
+            if doctor.slot_lines:
+                availability_text += f"\n\nDokter: {doctor.name}"
+                for line in doctor.slot_lines:
+                    availability_text += f"\n{line}"
+            else:
+                availability_text += f"\n\nDokter {doctor.name} tidak memiliki jadwal yang tersedia."
+        return availability_text
 
-        if availability:
-            availability_text += f"\n\nDokter: {doctor_name}"
-            for day, time_start, time_end in availability:
-                availability_text += f"\nHari: {day}, Pukul: {time_start} - {time_end}"
-        else:
-            availability_text += f"\n\nDokter {doctor_name} tidak memiliki jadwal yang tersedia."
-
-    conn.close()
-    return doctors[0][1], availability_text
+    return doctors[0].name, snapshot.memo(("specialty", specialty), render)
 
 # Microservices check
 @app.get("/check")   
 def health_check():
     return {"status": "ok"}
 
+# Coalesced request counters
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+@app.get("/llm-memo-stats")
+def memo_stats():
+    return llm_memo_stats()
+
 @app.post("/doctor-availability-by-specialty", response_model=SpecialtyResponse)
-async def get_doctor_availability_by_specialty(request: SpecialtyRequest):
+def get_doctor_availability_by_specialty(request: SpecialtyRequest):
     try:
-        # Step 1: Extract the specialty
-        extracted_specialty = specialty_extraction(request.query)
+        # Step 1: Extract the specialty (synonym dictionary first, then the intent slot, LLM as fallback)
+        extracted_specialty, source = resolve_specialty(request.query, request.specialty)
         if not extracted_specialty:
             raise HTTPException(status_code=400, detail="Spesialisasi tidak dapat diidentifikasi dari query.")
 
@@ -122,8 +163,10 @@ async def get_doctor_availability_by_specialty(request: SpecialtyRequest):
         if not doctor_name:
             raise HTTPException(status_code=404, detail=availability_text)
 
-        return SpecialtyResponse(specialty=extracted_specialty, availability=availability_text)
+        return SpecialtyResponse(specialty=extracted_specialty, availability=availability_text, source=source)
     except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
 
 
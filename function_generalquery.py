@@ -1,17 +1,34 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
+from llm import generate_text, get_llm, install_busy_handler, is_busy, stream_tokens
+from deadline import DEADLINE_MESSAGE, DeadlineExceeded, close_on_disconnect, install_deadline
+from services import BUSY_MESSAGE
+from singleflight import SingleFlight, singleflight_stats
+from metrics import install_metrics
+from readiness import Warmup, install_readiness
 import logging
+import time
 
 # FastAPI app
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "general_query")
+install_deadline(app, "general_query")
+
+# Nothing to preload, /ready answers as soon as the server is up
+install_readiness(app, Warmup("general_query").start())
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Llama 3 model setup
 MAX_RESPONSE_TOKENS = 2000  # Maximum tokens for the model's response
-model = OllamaLLM(model="llama3", max_tokens=MAX_RESPONSE_TOKENS)  # Configuring the model
+model = get_llm("generation", max_tokens=MAX_RESPONSE_TOKENS)  # Configuring the model
+
+# Concurrent identical queries share one generation
+general_query_flight = SingleFlight("general-query")
+general_query_stream_flight = SingleFlight("general-query-stream")
 
 # Custom prompt template
 general_query_template = """
@@ -41,8 +58,13 @@ class ChatResponse(BaseModel):
 def health_check():
     return {"status": "ok"}
 
+# Coalesced request counters
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
 @app.post("/general-query", response_model=ChatResponse)
-async def generate_response(request: ChatRequest):
+def generate_response(request: ChatRequest):
     """
     Handle user queries and generate responses using Llama3.
     """
@@ -51,7 +73,7 @@ async def generate_response(request: ChatRequest):
         formatted_prompt = general_query_template.format(query=request.query)
 
         # Generate a response using the LLM
-        result = model.invoke(formatted_prompt)
+        result = general_query_flight.do(request.query, lambda: generate_text(model, formatted_prompt))
         logging.info("Model response generated successfully.")
 
         return ChatResponse(response=result)
@@ -62,5 +84,39 @@ async def generate_response(request: ChatRequest):
             status_code=504, detail="The request timed out. Please try again with a shorter query."
         )
     except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
         logging.error("Unexpected error occurred: %s", str(e))
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+@app.post("/general-query/stream")
+def stream_response(request: ChatRequest):
+    """
+    Stream the Llama3 response as chunked plain text while it is generated.
+    """
+    formatted_prompt = general_query_template.format(query=request.query)
+    start_time = time.perf_counter()
+
+    def generate():
+        first_token = True
+        try:
+            for token in stream_tokens(model, formatted_prompt):
+                if first_token:
+                    logging.info(f"General query time to first token: {time.perf_counter() - start_time:.3f}s")
+                    first_token = False
+                yield token
+        except DeadlineExceeded:
+            # Out of time: the answer so far is sent as is
+            if first_token:
+                yield DEADLINE_MESSAGE
+            return
+        except Exception as e:
+            # The status is already sent, so a shed call is reported in the stream itself
+            if is_busy(e) and first_token:
+                yield BUSY_MESSAGE
+                return
+            raise
+        logging.info(f"General query total generation time: {time.perf_counter() - start_time:.3f}s")
+
+    return StreamingResponse(close_on_disconnect(general_query_stream_flight.stream(request.query, generate)), media_type="text/plain; charset=utf-8")
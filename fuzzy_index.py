@@ -0,0 +1,183 @@
+from collections import Counter
+from Levenshtein import ratio
+import heapq
+
+# Slack when comparing a ratio bound with an exact ratio, for float rounding
+BOUND_EPSILON = 1e-9
+
+
+class FuzzyIndex:
+    """
+    Character n-gram inverted index for Levenshtein.ratio lookups over a large table.
+
+    best_match() returns the same entry as a linear scan (highest ratio wins,
+    the earliest entry wins ties, threshold applied afterwards). It first
+    scores a few candidates that share n-grams with the query. Candidate
+    generation walks the posting lists from the rarest gram up, skips grams
+    shared by more than common_posting_length entries once rarer ones produced
+    candidates (which keeps lookups sublinear as the table grows), drops
+    entries whose length rules out reaching the threshold, and keeps the
+    max_candidates entries with the most shared grams.
+
+    The best candidate is then proven with the q-gram lemma: an entry sharing
+    c grams with the query is at least (max(len) + 1 - c) / n edits away,
+    which bounds its ratio, so beating the best candidate takes a minimum
+    number of shared grams. Every such entry is in one of the rarest posting
+    lists that together hold more than the query's other grams; those lists
+    are counted (even common ones) and the entries whose bound still allows a
+    win are scored. When even an entry sharing no gram could win (short
+    queries), the entries of those lengths are scanned.
+    """
+    def __init__(self, entries, ngram_size=3, max_candidates=64, common_posting_length=256):
+        self.ngram_size = ngram_size
+        self.max_candidates = max_candidates
+        self.common_posting_length = common_posting_length
+        self.keys = []
+        self.values = []
+        self.postings = {}
+        self.by_length = {}
+        self.lookups = 0
+        self.exhaustive_lookups = 0
+        for i, (key, value) in enumerate(entries):
+            key = key.lower()
+            self.keys.append(key)
+            self.values.append(value)
+            self.by_length.setdefault(len(key), []).append(i)
+            for gram in self._grams(key):
+                self.postings.setdefault(gram, []).append(i)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _gram_counts(self, text):
+        padded = f"{' ' * (self.ngram_size - 1)}{text} "
+        return Counter(padded[i:i + self.ngram_size] for i in range(len(padded) - self.ngram_size + 1))
+
+    def _grams(self, text):
+        return set(self._gram_counts(text))
+
+    def _min_shared(self, query_length, length, target):
+        """
+        Fewest grams an entry of the given length must share with the query to reach a ratio of target.
+        """
+        # ratio = 1 - edits / (query_length + length), and every edit destroys at most
+        # ngram_size of the len + 1 grams of a string (q-gram lemma)
+        max_edits = int((1 - target) * (query_length + length) + BOUND_EPSILON)
+        if abs(query_length - length) > max_edits:
+            return None
+        return max(query_length, length) + 1 - max_edits * self.ngram_size
+
+    def _posting_lists(self, gram_counts):
+        """
+        (posting list, times the query contains the gram) of the query grams, rarest first.
+        """
+        return sorted(
+            ((self.postings[gram], count) for gram, count in gram_counts.items() if gram in self.postings),
+            key=lambda item: len(item[0]),
+        )
+
+    def _walk(self, posting_lists, shared=None, start=0, stop_weight=None):
+        """
+        Counts the query grams each entry shares, walking posting_lists from
+        start. Stops at the first common list once rarer ones produced
+        candidates, or (with stop_weight) once the lists walked weigh that much.
+        Returns (shared, position of the first list not walked, weight walked).
+        """
+        shared = Counter() if shared is None else shared
+        weight = 0
+        for position in range(start, len(posting_lists)):
+            posting_list, count = posting_lists[position]
+            if stop_weight is None:
+                if len(posting_list) > self.common_posting_length and shared:
+                    return shared, position, weight
+            elif weight >= stop_weight:
+                return shared, position, weight
+            for i in posting_list:
+                shared[i] += count
+            weight += count
+        return shared, len(posting_lists), weight
+
+    def _length_range(self, query_length, threshold):
+        # ratio >= threshold is only reachable when the lengths are close enough
+        if threshold <= 0:
+            return 0, float("inf")
+        return query_length * threshold / (2 - threshold), query_length * (2 - threshold) / threshold
+
+    def candidates(self, query, threshold=0.0):
+        """
+        Returns the ids of the entries scored first, in table order.
+        """
+        query = query.lower()
+        shared, _, _ = self._walk(self._posting_lists(self._gram_counts(query)))
+        min_length, max_length = self._length_range(len(query), threshold)
+        shared = {i: count for i, count in shared.items() if min_length <= len(self.keys[i]) <= max_length}
+        best = heapq.nlargest(self.max_candidates, shared.items(), key=lambda item: (item[1], -item[0]))
+        return sorted(i for i, _ in best)
+
+    def best_match(self, query, threshold=0.0):
+        """
+        Returns (value, score) of the most similar entry, or (None, score) when it is below the threshold.
+        """
+        query_lower = query.lower()
+        query_length = len(query_lower)
+        self.lookups += 1
+
+        best_id = None
+        best_ratio = 0.0
+
+        def score(ids):
+            nonlocal best_id, best_ratio
+            for i in ids:
+                similarity = ratio(query_lower, self.keys[i])
+                if similarity > best_ratio or (similarity == best_ratio and best_id is not None and i < best_id):
+                    best_id = i
+                    best_ratio = similarity
+
+        # Heuristic pass: the candidates sharing the most rare grams
+        posting_lists = self._posting_lists(self._gram_counts(query_lower))
+        shared, position, walked = self._walk(posting_lists)
+        min_length, max_length = self._length_range(query_length, threshold)
+        in_range = {i: count for i, count in shared.items() if min_length <= len(self.keys[i]) <= max_length}
+        candidates = sorted(i for i, _ in heapq.nlargest(self.max_candidates, in_range.items(), key=lambda item: (item[1], -item[0])))
+        score(candidates)
+
+        # Exact pass: entries that could still reach the threshold and beat (or tie earlier than) the best
+        target = max(best_ratio, threshold) - BOUND_EPSILON
+        required = {}
+        for length in self.by_length:
+            if min_length <= length <= max_length:
+                needed = self._min_shared(query_length, length, target)
+                if needed is not None:
+                    required[length] = needed
+        if not required:
+            return self._result(best_id, best_ratio, threshold)
+
+        total = sum(count for _, count in posting_lists)
+        fewest = min(required.values())
+        if fewest <= 0:
+            # Entries sharing no gram at all are plausible (short queries): scan those lengths too
+            self.exhaustive_lookups += 1
+            shared, _, _ = self._walk(posting_lists, shared, position, stop_weight=float("inf"))
+            unshared = [
+                i for length, needed in required.items() if needed <= 0
+                for i in self.by_length[length] if i not in shared
+            ]
+            unseen = 0
+        else:
+            # An entry sharing at least `fewest` grams is in one of the rarest lists weighing total - fewest + 1
+            shared, _, prefix = self._walk(posting_lists, shared, position, stop_weight=total - fewest + 1 - walked)
+            unshared = []
+            unseen = total - walked - prefix
+
+        scored = set(candidates)
+        extra = [
+            i for i, count in shared.items()
+            if i not in scored and len(self.keys[i]) in required and count + unseen >= required[len(self.keys[i])]
+        ]
+        score(sorted(extra + unshared))
+        return self._result(best_id, best_ratio, threshold)
+
+    def _result(self, best_id, best_ratio, threshold):
+        if best_id is not None and best_ratio >= threshold:
+            return self.values[best_id], best_ratio
+        return None, best_ratio
@@ -0,0 +1,316 @@
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from embedding_model import EMBEDDING_MODEL_NAME, embedding_model_id
+from ingestion import IngestionStats, ingest, split_pdf
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+# Chroma rejects very large upserts, so chunks are written in batches
+UPSERT_BATCH_SIZE = 1000
+
+# Version of the chunk cache layout; caches and indexes of another version are rebuilt
+CACHE_VERSION = 2
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IncrementalIndexer:
+    """
+    Keeps the vector store in sync with the PDFs in docs_dir.
+
+    vectorstore may be None when only the chunk cache is needed (e.g. to build a
+    DenseIndex from iter_chunks()).
+
+    New and changed PDFs go through the streaming ingestion pipeline
+    (ingestion.py): parsed and chunked in a process pool, embedded in batches and
+    written to the store file by file, so memory stays flat as the corpus grows.
+
+    Every PDF is identified by the SHA-256 of its content. Its chunks and their
+    embeddings are cached in data_dir/files/<sha256>.pkl and stored in the vector
+    store under the ids "<doc_id>-<n>", where doc_id is derived from the path and
+    the content hash; manifest.json records the hash and doc_id of every file.
+
+    Every chunk is also split into smaller child chunks (ids "<chunk_id>.<m>",
+    embedded alongside their parent and listed by iter_children()), so queries
+    that need finer context fetch them by id instead of splitting at request time.
+    sync() only chunks and embeds new or changed files, deletes the chunks of
+    removed files, and leaves the store untouched when nothing changed. Files
+    whose size and modification time match the manifest are not re-hashed.
+    """
+    def __init__(self, docs_dir, data_dir, embeddings, vectorstore, chunk_size=500, chunk_overlap=50, child_chunk_size=200, child_chunk_overlap=20):
+        self.docs_dir = docs_dir
+        self.data_dir = data_dir
+        self.embeddings = embeddings
+        # Chunks embedded by another model or backend (e.g. torch vs onnx) are re-embedded
+        self.embedding_id = embedding_model_id(embeddings)
+        # Part of the chunk cache file names, so each backend keeps its own cache
+        self.embedding_digest = hashlib.sha256(self.embedding_id.encode("utf-8")).hexdigest()[:12]
+        self.vectorstore = vectorstore
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.child_splitter = RecursiveCharacterTextSplitter(chunk_size=child_chunk_size, chunk_overlap=child_chunk_overlap)
+        self.manifest_path = os.path.join(data_dir, "manifest.json")
+        self.files_dir = os.path.join(data_dir, "files")
+        self.manifest = self._load_manifest()
+        # Throughput of the last ingestion run (ingestion.IngestionStats), None until a file was processed
+        self.ingestion_stats = None
+
+    def sync(self):
+        """
+        Brings the vector store up to date; returns the names of added, changed and removed files.
+        """
+        pdf_files = sorted(
+            os.path.join(self.docs_dir, file)
+            for file in os.listdir(self.docs_dir)
+            if file.endswith(".pdf")
+        )
+        summary = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        new_manifest = {}
+        to_process = {}
+
+        for pdf_file in pdf_files:
+            stat = os.stat(pdf_file)
+            entry = self.manifest.get(pdf_file)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                sha256 = entry["sha256"]
+            else:
+                sha256 = file_sha256(pdf_file)
+
+            if entry and entry["sha256"] == sha256 and entry.get("version") == CACHE_VERSION and self._same_embedding(entry):
+                summary["unchanged"].append(pdf_file)
+                new_manifest[pdf_file] = self._manifest_entry(sha256, stat, entry["doc_id"], entry["chunks"])
+                continue
+            # New or changed content, or a chunk cache from an older version or another embedding model
+            cache = self._load_file_cache(sha256)
+            if cache is None:
+                to_process[pdf_file] = (sha256, stat, entry)
+            else:
+                new_manifest[pdf_file] = self._index_file(pdf_file, sha256, stat, entry, cache, summary)
+
+        # Files without a chunk cache stream through the ingestion pipeline and
+        # are written to the store one by one as their embeddings complete
+        files = {pdf_file: sha256 for pdf_file, (sha256, _, _) in to_process.items()}
+        for pdf_file, cache in self._process_files(files):
+            sha256, stat, entry = to_process[pdf_file]
+            new_manifest[pdf_file] = self._index_file(pdf_file, sha256, stat, entry, cache, summary)
+
+        for pdf_file, entry in self.manifest.items():
+            if pdf_file not in new_manifest:
+                self._delete_chunks(entry["doc_id"], entry["chunks"])
+                summary["removed"].append(pdf_file)
+
+        # Drop cached chunks of content that is no longer in the corpus
+        live_hashes = {entry["sha256"] for entry in new_manifest.values()}
+        for entry in self.manifest.values():
+            if entry["sha256"] not in live_hashes:
+                self._remove_file_cache(entry["sha256"])
+
+        # Repair a store that does not match the manifest (e.g. deleted or built by an older version)
+        expected = sum(entry["chunks"] for entry in new_manifest.values())
+        if self.vectorstore is not None and self.vectorstore._collection.count() != expected:
+            logging.warning("Vector store does not match the index manifest, reloading it from the chunk cache")
+            self._rebuild_store(new_manifest)
+
+        if new_manifest != self.manifest:
+            self.manifest = new_manifest
+            self._save_manifest()
+        logging.info(
+            "Index sync: %d added, %d changed, %d removed, %d unchanged",
+            len(summary["added"]), len(summary["changed"]), len(summary["removed"]), len(summary["unchanged"]),
+        )
+        return summary
+
+    def fingerprint(self):
+        """
+        Hash of the indexed corpus, changes whenever any document is added, changed or removed.
+        """
+        digest = hashlib.sha256(f"v{CACHE_VERSION}\n{self.embedding_id}\n".encode("utf-8"))
+        for pdf_file in sorted(self.manifest):
+            digest.update(f"{pdf_file}:{self.manifest[pdf_file]['sha256']}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _index_file(self, pdf_file, sha256, stat, entry, cache, summary):
+        """
+        Replaces the chunks of a new or changed file in the store; returns its manifest entry.
+        """
+        if entry:
+            self._delete_chunks(entry["doc_id"], entry["chunks"])
+        doc_id = self._doc_id(pdf_file, sha256)
+        self._upsert(pdf_file, doc_id, cache)
+        summary["changed" if entry else "added"].append(pdf_file)
+        return self._manifest_entry(sha256, stat, doc_id, len(cache["chunks"]))
+
+    def _manifest_entry(self, sha256, stat, doc_id, chunks):
+        return {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "doc_id": doc_id,
+            "chunks": chunks,
+            "version": CACHE_VERSION,
+            "embedding": self.embedding_id,
+        }
+
+    def _same_embedding(self, record):
+        # Manifests and caches written before the embedding id was recorded were made by the default model
+        return record.get("embedding", EMBEDDING_MODEL_NAME) == self.embedding_id
+
+    @staticmethod
+    def _doc_id(pdf_file, sha256):
+        return hashlib.sha256(f"{pdf_file}:{sha256}".encode("utf-8")).hexdigest()[:32]
+
+    def split_file(self, pdf_file):
+        """
+        Returns the chunks of a PDF and, for every chunk, its child chunks.
+        """
+        _, chunks, children = split_pdf(pdf_file, self.text_splitter, self.child_splitter)
+        return chunks, children
+
+    def _process_files(self, files):
+        """
+        Chunks and embeds the files (path -> sha256) through the ingestion pipeline,
+        yielding (pdf_file, cache) as each one completes; the caches are saved as they come.
+        """
+        if not files:
+            return
+        logging.info(f"Chunking and embedding {len(files)} files")
+        self.ingestion_stats = IngestionStats(len(files))
+        for pdf_file, result in ingest(files, self.text_splitter, self.child_splitter, self.embeddings, stats=self.ingestion_stats):
+            cache = {"version": CACHE_VERSION, "embedding": self.embedding_id, **result}
+            self._save_file_cache(files[pdf_file], cache)
+            yield pdf_file, cache
+
+    def iter_chunks(self):
+        """
+        Yields (document, embedding) for every indexed chunk, in manifest order.
+        """
+        for pdf_file in sorted(self.manifest):
+            yield from self.iter_file_chunks(pdf_file)
+
+    def iter_file_chunks(self, pdf_file):
+        """
+        Yields (document, embedding) for every indexed chunk of one file.
+        """
+        entry = self.manifest[pdf_file]
+        cache = self._load_file_cache(entry["sha256"])
+        for i, (chunk, embedding) in enumerate(zip(cache["chunks"], cache["embeddings"])):
+            metadata = self._chunk_metadata(pdf_file, entry["doc_id"], i, chunk, len(cache["children"][i]))
+            yield Document(page_content=chunk.page_content, metadata=metadata), embedding
+
+    def iter_children(self):
+        """
+        Yields (document, embedding) for every child chunk, in manifest order; parent_id links it to its chunk.
+        """
+        for pdf_file, entry in sorted(self.manifest.items()):
+            cache = self._load_file_cache(entry["sha256"])
+            for i, (group, group_embeddings) in enumerate(zip(cache["children"], cache["child_embeddings"])):
+                parent_id = f"{entry['doc_id']}-{i}"
+                for j, (child, embedding) in enumerate(zip(group, group_embeddings)):
+                    metadata = {
+                        **child.metadata,
+                        "source": pdf_file,
+                        "chunk_id": f"{parent_id}.{j}",
+                        "parent_id": parent_id,
+                        "chunk_index": i,
+                        "child_index": j,
+                    }
+                    yield Document(page_content=child.page_content, metadata=metadata), embedding
+
+    @staticmethod
+    def _chunk_metadata(pdf_file, doc_id, i, chunk, child_count):
+        return {**chunk.metadata, "source": pdf_file, "chunk_id": f"{doc_id}-{i}", "chunk_index": i, "child_count": child_count}
+
+    def _upsert(self, pdf_file, doc_id, cache):
+        if self.vectorstore is None:
+            return
+        chunks, chunk_embeddings = cache["chunks"], cache["embeddings"]
+        # Embeddings are precomputed, so they are written to the collection directly
+        # instead of through add_texts, which would embed every chunk again.
+        for start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+            batch = chunks[start:start + UPSERT_BATCH_SIZE]
+            self.vectorstore._collection.upsert(
+                ids=[f"{doc_id}-{start + i}" for i in range(len(batch))],
+                embeddings=chunk_embeddings[start:start + UPSERT_BATCH_SIZE],
+                documents=[chunk.page_content for chunk in batch],
+                metadatas=[
+                    self._chunk_metadata(pdf_file, doc_id, start + i, chunk, len(cache["children"][start + i]))
+                    for i, chunk in enumerate(batch)
+                ],
+            )
+
+    def _delete_chunks(self, doc_id, count):
+        if self.vectorstore is None:
+            return
+        for start in range(0, count, UPSERT_BATCH_SIZE):
+            self.vectorstore.delete(ids=[f"{doc_id}-{i}" for i in range(start, min(count, start + UPSERT_BATCH_SIZE))])
+
+    def _rebuild_store(self, manifest):
+        existing_ids = self.vectorstore.get(include=[])["ids"]
+        for start in range(0, len(existing_ids), UPSERT_BATCH_SIZE):
+            self.vectorstore.delete(ids=existing_ids[start:start + UPSERT_BATCH_SIZE])
+        missing = {}
+        for pdf_file, entry in manifest.items():
+            cache = self._load_file_cache(entry["sha256"])
+            if cache is None:
+                missing[pdf_file] = entry["sha256"]
+            else:
+                self._upsert(pdf_file, entry["doc_id"], cache)
+        for pdf_file, cache in self._process_files(missing):
+            self._upsert(pdf_file, manifest[pdf_file]["doc_id"], cache)
+
+    def _cache_path(self, sha256):
+        return os.path.join(self.files_dir, f"{sha256}-{self.embedding_digest}.pkl")
+
+    def _load_file_cache(self, sha256):
+        """
+        Returns the cached chunks of a file, or None when missing or written by another version or embedding model.
+        """
+        path = self._cache_path(sha256)
+        if not os.path.exists(path):
+            # Written before caches were kept per backend; used when it has the same embedding
+            path = os.path.join(self.files_dir, f"{sha256}.pkl")
+            if not os.path.exists(path):
+                return None
+        with open(path, "rb") as f:
+            cache = pickle.load(f)
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION or not self._same_embedding(cache):
+            return None
+        return cache
+
+    def _remove_file_cache(self, sha256):
+        """
+        Removes the cached chunks of a file for every embedding backend (and the
+        unsuffixed files written before caches were kept per backend).
+        """
+        paths = glob.glob(os.path.join(self.files_dir, f"{sha256}-*.pkl"))
+        paths.append(os.path.join(self.files_dir, f"{sha256}.pkl"))
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _save_file_cache(self, sha256, cache):
+        os.makedirs(self.files_dir, exist_ok=True)
+        with open(self._cache_path(sha256), "wb") as f:
+            pickle.dump(cache, f)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,193 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections import deque
+from langchain_community.document_loaders import PyPDFLoader
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+
+# Worker processes parsing and chunking PDFs (default: one per core)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+
+# Texts per embed_documents call; batches span file boundaries
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 64))
+
+# Files parsed ahead of the embedder. Only these and the files waiting for their
+# last batch are held in memory, so peak memory does not grow with the corpus.
+INGEST_MAX_PENDING_FILES = int(os.getenv("INGEST_MAX_PENDING_FILES", 2 * INGEST_WORKERS))
+
+# Seconds between progress log lines
+PROGRESS_INTERVAL = 10
+
+
+def split_pdf(pdf_file, text_splitter, child_splitter):
+    """
+    Parses a PDF; returns its page count, its chunks and, for every chunk, its child chunks.
+    """
+    pages = PyPDFLoader(pdf_file).load()
+    chunks = text_splitter.split_documents(pages)
+    return len(pages), chunks, [child_splitter.split_documents([chunk]) for chunk in chunks]
+
+
+# Splitters of a worker process, set once by the pool initializer
+_worker_splitters = None
+
+def _init_worker(text_splitter, child_splitter):
+    global _worker_splitters
+    _worker_splitters = (text_splitter, child_splitter)
+
+def _split_timed(pdf_file, splitters=None):
+    start = time.perf_counter()
+    pages, chunks, children = split_pdf(pdf_file, *(splitters or _worker_splitters))
+    return pdf_file, pages, chunks, children, time.perf_counter() - start
+
+
+class IngestionStats:
+    """
+    Progress and per-stage throughput of one ingestion run.
+
+    The rates are over the wall-clock time of the run, except embeddings per
+    second, which is over the time spent in embed_documents; parse_seconds adds
+    up the time of every worker, so it exceeds the wall-clock time when the
+    workers run in parallel.
+    """
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.parse_seconds = 0.0
+        self.embed_seconds = 0.0
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        def rate(count, seconds):
+            return round(count / seconds, 2) if seconds > 0 else None
+        return {
+            "files": self.files,
+            "total_files": self.total_files,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embeddings": self.embeddings,
+            "seconds": round(elapsed, 3),
+            "parse_seconds": round(self.parse_seconds, 3),
+            "embed_seconds": round(self.embed_seconds, 3),
+            "pages_per_second": rate(self.pages, elapsed),
+            "chunks_per_second": rate(self.chunks, elapsed),
+            "embeddings_per_second": rate(self.embeddings, self.embed_seconds),
+        }
+
+    def log_progress(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        stats = self.as_dict()
+        logging.info(
+            f"Ingestion: {stats['files']}/{stats['total_files']} files, {stats['pages']} pages "
+            f"({stats['pages_per_second']}/s), {stats['chunks']} chunks ({stats['chunks_per_second']}/s), "
+            f"{stats['embeddings']} embeddings ({stats['embeddings_per_second']}/s)"
+        )
+
+
+def _pool_context():
+    """
+    Start method of the parsing workers. The services are already multi-threaded
+    (uvicorn, HTTP clients, embedding threads), and forking a threaded process
+    can deadlock the child on a lock some other thread held at fork time, so
+    workers come from a fork server (a clean single-threaded process that only
+    imported this module) or, where there is none, are spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _parse(pdf_files, text_splitter, child_splitter, workers, max_pending):
+    """
+    Yields the parsed files as they complete, with at most max_pending files in flight.
+    """
+    if workers <= 1 or len(pdf_files) <= 1:
+        for pdf_file in pdf_files:
+            yield _split_timed(pdf_file, (text_splitter, child_splitter))
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=_pool_context(),
+        initializer=_init_worker, initargs=(text_splitter, child_splitter),
+    )
+    files = iter(pdf_files)
+    try:
+        running = {pool.submit(_split_timed, pdf_file) for pdf_file in itertools.islice(files, max(1, max_pending))}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_file = next(files, None)
+                if pdf_file is not None:
+                    running.add(pool.submit(_split_timed, pdf_file))
+                yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def ingest(pdf_files, text_splitter, child_splitter, embeddings, workers=INGEST_WORKERS,
+           batch_size=INGEST_EMBED_BATCH_SIZE, max_pending=INGEST_MAX_PENDING_FILES, stats=None):
+    """
+    Parses and chunks the PDFs in a process pool and embeds their chunks and
+    child chunks in batches as they stream in. Yields (pdf_file, result) as soon
+    as every text of a file is embedded, where result has the file's chunks,
+    embeddings, children and child_embeddings; files come out in the order they
+    finished parsing.
+    """
+    pdf_files = list(pdf_files)
+    stats = stats or IngestionStats(len(pdf_files))
+    pending = deque()  # files in the order their texts entered the batch
+    batch = []  # (file state, text) waiting to be embedded
+
+    def embed(items):
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents([text for _, text in items])
+        stats.embed_seconds += time.perf_counter() - start
+        stats.embeddings += len(vectors)
+        for (state, _), vector in zip(items, vectors):
+            state["vectors"].append(vector)
+
+    def completed():
+        # Batches are filled in file order, so files complete in that order too
+        while pending and len(pending[0]["vectors"]) == pending[0]["texts"]:
+            state = pending.popleft()
+            chunks, children, vectors = state["chunks"], state["children"], state["vectors"]
+            child_vectors = iter(vectors[len(chunks):])
+            stats.files += 1
+            stats.log_progress()
+            yield state["pdf_file"], {
+                "chunks": chunks,
+                "embeddings": vectors[:len(chunks)],
+                "children": children,
+                "child_embeddings": [[next(child_vectors) for _ in group] for group in children],
+            }
+
+    for pdf_file, pages, chunks, children, seconds in _parse(pdf_files, text_splitter, child_splitter, workers, max_pending):
+        stats.pages += pages
+        stats.chunks += len(chunks)
+        stats.parse_seconds += seconds
+        # Both granularities of a file are embedded in the same stream
+        texts = [chunk.page_content for chunk in chunks] + [child.page_content for group in children for child in group]
+        state = {"pdf_file": pdf_file, "chunks": chunks, "children": children, "texts": len(texts), "vectors": []}
+        pending.append(state)
+        batch.extend((state, text) for text in texts)
+        while len(batch) >= batch_size:
+            embed(batch[:batch_size])
+            del batch[:batch_size]
+        yield from completed()
+
+    if batch:
+        embed(batch)
+    yield from completed()
+    stats.log_progress(force=True)
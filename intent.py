@@ -1,11 +1,27 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, ValidationError
+from llm import get_llm, install_busy_handler, is_busy
+from llm_memo import MemoizedPrompt, llm_memo_stats
 from difflib import get_close_matches
+from embedding_model import get_embeddings
+from singleflight import single_flight, singleflight_stats
+from metrics import install_metrics, stage, timed_stage
+from deadline import DeadlineExceeded, install_deadline
+from readiness import Warmup, install_readiness
+from typing import Dict, Optional
+import numpy as np
 import logging
+import json
+import os
 
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "intent")
+install_deadline(app, "intent")
+
+# The embedding model is loaded in the background; until then intents are classified by the LLM
+warmup = Warmup("intent")
+install_readiness(app, warmup)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -31,10 +47,64 @@ Classify the following user query into one of these intents:
 Query: {question}
 """
 
+# Joint prompt: the intent together with the slot the doctor services need, as JSON
+joint_intent_template = """
+Instruction:
+- Classify as "General query" if only there is no medical term in the query .
+- The user query may be in Bahasa Indonesia, please handle that. The intent name must be in English.
+- For "doctor's availability" intent (by its name, by specialization, or by disease) the keyword is "menemui", "bertemu"
+- For the "doctor's availability search by its specialization" the specialization may be in Bahasa Indonesia (e.g. Praktisi Umum, Ahli Bedah, Dokter Bedah, Ahli Pencernaan, Dokter Pencernaan, Spesialis THT, Ahli Alergi, etc).
+- If you encounter "THT", that's doctor's specialization, (in English it is same as ENT), so if there is "dokter tht" it means "ENT doctor".
+- If the user asked about some diseases, health tips, or how to prevent some diseases, consider its intent as "Asking about health tips and general disease."
+
+Classify the user query into one of these intents:
+- General query.
+- Doctor's availability search by its name.
+- Doctor's availability search by its specialization.
+- Doctor's availability search by its disease.
+- Asking about health tips and general disease.
+- Unanswerable question.
+
+Also extract the value the intent needs, and use null for the others:
+- "doctor_name": for doctor's availability search by its name, the doctor's name with format Dr. <name>.
+- "specialty": for doctor's availability search by its specialization, the specialty name as it is (don't translate to English).
+- "disease": for doctor's availability search by its disease, the disease or symptom as it is (don't translate to English).
+
+Respond only with JSON, for example:
+{{"intent": "Doctor's availability search by its name", "doctor_name": "Dr. Budi", "specialty": null, "disease": null}}
+
+Query: {question}
+"""
+
 # Initialize the model
-model = OllamaLLM(model="llama3")
-intent_classifier = ChatPromptTemplate.from_template(intent_classification_template)
-intent_chain = intent_classifier | model
+model = get_llm("intent", temperature=0)
+
+# Valid intents list
+valid_intents = [
+    "general query",
+    "doctor's availability search by its name",
+    "doctor's availability search by its specialization",
+    "doctor's availability search by its disease",
+    "asking about health tips and general disease",
+    "unanswerable question"
+]
+
+# Fast-path classifier settings
+INTENT_EXAMPLES_PATH = os.getenv("INTENT_EXAMPLES_PATH", "intent_examples.json")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.6))
+INTENT_SOFTMAX_TEMPERATURE = float(os.getenv("INTENT_SOFTMAX_TEMPERATURE", 0.02))
+
+# Joint mode: when the LLM is needed, one call returns the intent and its slot.
+# Confident embedding classifications return no slots, so the doctor services
+# still run their own extraction call for them
+INTENT_JOINT_MODE = os.getenv("INTENT_JOINT_MODE", "0") == "1"
+
+# Slot each doctor intent needs, and the request field the doctor service reads it from
+SLOT_FOR_INTENT = {
+    "doctor's availability search by its name": "doctor_name",
+    "doctor's availability search by its specialization": "specialty",
+    "doctor's availability search by its disease": "disease",
+}
 
 # Request/Response Models
 class IntentRequest(BaseModel):
@@ -42,42 +112,184 @@ class IntentRequest(BaseModel):
 
 class IntentResponse(BaseModel):
     intent: str
+    confidence: Optional[float] = None
+    source: str = "llm"  # "embedding", "llm" or "llm-joint"
+    slots: Dict[str, str] = {}  # e.g. {"specialty": "Spesialis THT"}, only in joint mode
+
+class JointIntentOutput(BaseModel):
+    intent: str
+    doctor_name: Optional[str] = None
+    specialty: Optional[str] = None
+    disease: Optional[str] = None
 
-# Function to classify intent
-def classify_intent(query):
+
+class EmbeddingIntentClassifier:
+    """
+    Nearest-centroid intent classifier over sentence embeddings of labelled example queries.
+    """
+    def __init__(self, embeddings, examples, temperature=INTENT_SOFTMAX_TEMPERATURE):
+        self.embeddings = embeddings
+        self.temperature = temperature
+        self.intents = [intent for intent in valid_intents if examples.get(intent)]
+
+        centroids = []
+        for intent in self.intents:
+            vectors = self._normalize(np.asarray(embeddings.embed_documents(examples[intent]), dtype=np.float32))
+            centroids.append(vectors.mean(axis=0))
+        self.centroids = self._normalize(np.vstack(centroids))
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def predict(self, query):
+        """
+        Returns (intent, confidence), where confidence is the softmax probability of the closest centroid.
+        """
+        vector = self._normalize(np.asarray(self.embeddings.embed_query(query), dtype=np.float32))
+        similarities = self.centroids @ vector
+        scores = np.exp((similarities - similarities.max()) / self.temperature)
+        probabilities = scores / scores.sum()
+        best = int(np.argmax(probabilities))
+        return self.intents[best], float(probabilities[best])
+
+
+def load_intent_examples(path=INTENT_EXAMPLES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+embedding_classifier = None
+
+@warmup.step("embedding_classifier.load")
+def load_embedding_classifier():
+    global embedding_classifier
+    embedding_classifier = EmbeddingIntentClassifier(get_embeddings(), load_intent_examples())
+
+# Maps the LLM output to a valid intent, fuzzy matching to handle slight variations; None when nothing matches
+def match_intent(result):
+    closest_match = get_close_matches(result.lower().strip(), valid_intents, n=1, cutoff=0.6)
+    return closest_match[0] if closest_match else None
+
+# Memoized for repeated queries; outputs matching no intent are not stored
+intent_prompt = MemoizedPrompt(
+    "intent-llm", intent_classification_template, model, parse=match_intent, deadline_stage="intent.llm",
+)
+
+# Function to classify intent with the LLM, shared by concurrent identical queries
+@timed_stage("classify_intent_llm")
+@single_flight("intent-llm")
+def classify_intent_llm(query):
     try:
         # Get the intent from the model
-        result = intent_chain.invoke({"question": query})
-        intent = result.lower().strip()
-
-        # Valid intents list
-        valid_intents = [
-            "general query",
-            "doctor's availability search by its name",
-            "doctor's availability search by its specialization",
-            "doctor's availability search by its disease",
-            "asking about health tips and general disease",
-            "unanswerable question"
-        ]
-
-        # Fuzzy matching to handle slight variations
-        closest_match = get_close_matches(intent, valid_intents, n=1, cutoff=0.6)
-        return closest_match[0] if closest_match else "unanswerable question"
+        return intent_prompt.invoke(query) or "unanswerable question"
 
     except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
         logging.error(f"Error while classifying intent: {e}")
         return "unanswerable question"
 
+def parse_joint_output(result):
+    """
+    Validates the joint JSON output; returns (intent, slots), or None when it does not fit the schema.
+    """
+    try:
+        output = JointIntentOutput.model_validate(json.loads(result))
+    except (ValueError, ValidationError) as e:
+        logging.warning(f"Invalid joint intent output {result!r}: {e}")
+        return None
+
+    closest_match = get_close_matches(output.intent.lower().strip(" ."), valid_intents, n=1, cutoff=0.6)
+    if not closest_match:
+        logging.warning(f"Unknown intent in joint output: {output.intent!r}")
+        return None
+
+    intent = closest_match[0]
+    slot = SLOT_FOR_INTENT.get(intent)
+    if slot is None:
+        return intent, {}
+    value = (getattr(output, slot) or "").strip()
+    if not value:
+        logging.warning(f"Joint output for '{intent}' is missing {slot}")
+        return None
+    return intent, {slot: value}
+
+# Joint mode asks Ollama for JSON output; outputs that do not fit the schema are not stored
+joint_intent_prompt = MemoizedPrompt(
+    "intent-joint-llm", joint_intent_template, get_llm("intent", format="json", temperature=0),
+    parse=parse_joint_output, deadline_stage="intent.joint_llm",
+)
+
+# Function to classify intent and extract its slot in one LLM call; None when the output is unusable
+@timed_stage("classify_intent_joint")
+@single_flight("intent-joint-llm")
+def classify_intent_joint(query):
+    try:
+        return joint_intent_prompt.invoke(query)
+    except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
+        logging.error(f"Error while classifying intent jointly: {e}")
+        return None
+
+# Function to classify intent, using the LLM only when the fast path is unsure
+@timed_stage("classify_intent")
+def classify_intent(query, threshold=INTENT_CONFIDENCE_THRESHOLD):
+    """
+    Classifies the query with the embedding classifier, falling back to the
+    LLM below the confidence threshold.
+
+    Joint mode only covers that fallback: slots are filled only when the LLM
+    classified the query. A confident embedding result has no slots, and its
+    doctor service extracts them with its own LLM call. That is still one LLM
+    call per query, the same as asking the joint prompt here.
+    """
+    confidence = None
+    if embedding_classifier is None:
+        logging.info("Embedding intent classifier is still loading, using the LLM")
+    else:
+        try:
+            with stage("classify_intent_embedding"):
+                intent, confidence = embedding_classifier.predict(query)
+            if confidence >= threshold:
+                return IntentResponse(intent=intent, confidence=confidence, source="embedding")
+            logging.info(f"Low intent confidence ({confidence:.2f}) for '{intent}', falling back to LLM")
+        except Exception as e:
+            logging.error(f"Error in embedding intent classifier: {e}")
+
+    if INTENT_JOINT_MODE:
+        joint = classify_intent_joint(query)
+        if joint is not None:
+            intent, slots = joint
+            return IntentResponse(intent=intent, confidence=confidence, source="llm-joint", slots=slots)
+        logging.info("Falling back to two-step intent classification")
+
+    return IntentResponse(intent=classify_intent_llm(query), confidence=confidence, source="llm")
+
 # Microservices check
 @app.get("/check")   
 def health_check():
     return {"status": "ok"}
 
+# Coalesced request counters
+@app.get("/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+@app.get("/llm-memo-stats")
+def memo_stats():
+    return llm_memo_stats()
+
 @app.post("/classify-intent", response_model=IntentResponse)
-async def classify_intent_api(request: IntentRequest):
+def classify_intent_api(request: IntentRequest):
     try:
-        detected_intent = classify_intent(request.query)
-        return IntentResponse(intent=detected_intent)
+        return classify_intent(request.query)
     except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
         logging.error(f"Unexpected error in classify-intent API: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+# Load the embedding classifier in the background
+warmup.start()
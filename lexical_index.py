@@ -0,0 +1,258 @@
+from collections import Counter, defaultdict
+from indexer import CACHE_VERSION
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+
+# Bump when tokenize() changes, so persisted indexes are rebuilt
+TOKENIZER_VERSION = 1
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "ada", "adalah", "agar", "akan", "aku", "anda", "apa", "apakah", "atau", "bagaimana", "bagi", "bahwa",
+    "bisa", "bisakah", "dalam", "dan", "dapat", "dari", "dengan", "di", "dong", "gimana", "hal", "ini", "itu",
+    "jelaskan", "jika", "juga", "kah", "kalau", "kami", "karena", "ke", "kenapa", "kita", "lah", "mengapa",
+    "nya", "oleh", "pada", "para", "saja", "sangat", "saya", "se", "secara", "seperti", "serta", "sih",
+    "sudah", "supaya", "tentang", "tersebut", "tolong", "untuk", "ya", "yang", "yg",
+}
+
+# Words that make a query a question rather than a keyword lookup
+QUESTION_WORDS = {
+    "apa", "apakah", "bagaimana", "berapa", "bisakah", "dimana", "gimana", "jelaskan", "kapan", "kenapa",
+    "mengapa", "siapa",
+}
+
+PARTICLES = ("lah", "kah", "tah", "pun")
+POSSESSIVES = ("nya", "ku", "mu")
+DERIVATIONAL_SUFFIXES = ("kan", "an")
+
+# "-i" is only a suffix in me-/di- verbs ("melindungi", "diobati"); loanwords
+# such as "hipertensi" or "konsultasi" keep it
+I_SUFFIX_PREFIXES = ("me", "di")
+
+# Prefix -> replacement by the letter that follows it, "" meaning the prefix is just dropped.
+# Longest prefixes first, e.g. "menyakiti" -> "sakit", "pemeriksa" -> "periksa", "menurun" -> "turun".
+PREFIX_RULES = [
+    ("meny", {"vowel": "s"}),
+    ("peny", {"vowel": "s"}),
+    ("meng", {"any": ""}),
+    ("peng", {"any": ""}),
+    ("mem", {"vowel": "p", "b": "", "p": "", "f": ""}),
+    ("pem", {"vowel": "p", "b": "", "p": "", "f": ""}),
+    ("men", {"vowel": "t", "c": "", "d": "", "j": "", "t": "", "z": ""}),
+    ("pen", {"vowel": "t", "c": "", "d": "", "j": "", "t": "", "z": ""}),
+    ("ber", {"any": ""}),
+    ("per", {"consonant": ""}),
+    ("ter", {"any": ""}),
+    ("me", {"l": "", "m": "", "n": "", "r": "", "w": "", "y": ""}),
+    ("pe", {"l": "", "m": "", "n": "", "r": "", "w": "", "y": ""}),
+    ("di", {"any": ""}),
+    ("ke", {"any": ""}),
+    ("se", {"any": ""}),
+]
+
+# Stems shorter than this are not reduced further, which keeps acronyms (DBD) and short roots intact
+MIN_STEM_LENGTH = 4
+
+# Queries with at most this many terms and no question word are answered from BM25 alone
+LEXICAL_ONLY_MAX_TERMS = 3
+
+# Reciprocal rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+
+def _strip_suffix(word, suffixes):
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def _strip_prefix(word):
+    for prefix, rules in PREFIX_RULES:
+        if not word.startswith(prefix):
+            continue
+        rest = word[len(prefix):]
+        if len(rest) < MIN_STEM_LENGTH - 1:
+            return word
+        kind = "vowel" if rest[0] in "aeiou" else "consonant"
+        for key in (rest[0], kind, "any"):
+            if key in rules:
+                stem = rules[key] + rest
+                return stem if len(stem) >= MIN_STEM_LENGTH else word
+        return word
+    return word
+
+
+def stem(word):
+    """
+    Light rule-based Indonesian stemmer (particles, possessives, one derivational
+    suffix and one prefix), e.g. "kesehatan" -> "sehat", "disebabkan" -> "sebab".
+
+    Without a root dictionary some words are over-stemmed, but queries and
+    documents go through the same rules, so they still match each other.
+    """
+    if len(word) <= MIN_STEM_LENGTH or word.isdigit():
+        return word
+    word = _strip_suffix(word, PARTICLES)
+    word = _strip_suffix(word, POSSESSIVES)
+    stripped = _strip_suffix(word, DERIVATIONAL_SUFFIXES)
+    if stripped == word and word.startswith(I_SUFFIX_PREFIXES):
+        stripped = _strip_suffix(word, ("i",))
+    return _strip_prefix(stripped)
+
+
+def words(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def tokenize(text):
+    """
+    Lowercased, stemmed terms of the text, without stopwords.
+    """
+    return [stem(word) for word in words(text) if word not in STOPWORDS]
+
+
+def is_keyword_query(query):
+    """
+    True for short keyword lookups ("DBD", "obat hipertensi") rather than questions.
+    """
+    query_words = words(query)
+    if not query_words or "?" in query or any(word in QUESTION_WORDS for word in query_words):
+        return False
+    return len(tokenize(query)) <= LEXICAL_ONLY_MAX_TERMS
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, limit=None):
+    """
+    Fuses ranked lists of documents (identified by their chunk_id metadata) by
+    summing 1 / (k + rank) over the lists each document appears in.
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            chunk_id = document.metadata.get("chunk_id") or document.page_content
+            scores[chunk_id] += 1.0 / (k + rank)
+            documents.setdefault(chunk_id, document)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [documents[chunk_id] for chunk_id in fused[:limit]]
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the indexed chunks, persisted in index_dir.
+
+    sync(indexer) tokenizes the chunks of files that are new in the indexer's
+    manifest and drops those of files that left it, so an unchanged corpus is
+    loaded as is and a changed one only re-tokenizes the changed files.
+    """
+    INDEX_FILE = "bm25.pkl"
+
+    def __init__(self, index_dir, k1=1.5, b=0.75):
+        self.path = os.path.join(index_dir, self.INDEX_FILE)
+        self.k1 = k1
+        self.b = b
+        self.files = {}  # doc_id -> chunk ids
+        self.documents = {}  # chunk_id -> Document
+        self.lengths = {}  # chunk_id -> number of terms
+        self.postings = defaultdict(dict)  # term -> {chunk_id: term frequency}
+        self.total_length = 0
+        self._load()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def sync(self, indexer):
+        """
+        Brings the index up to date with the indexer's manifest; returns the number of added and removed files.
+        """
+        live = {entry["doc_id"]: pdf_file for pdf_file, entry in indexer.manifest.items()}
+        removed = [doc_id for doc_id in self.files if doc_id not in live]
+        added = [doc_id for doc_id in live if doc_id not in self.files]
+        for doc_id in removed:
+            self.remove_file(doc_id)
+        for doc_id in added:
+            self.add_file(doc_id, [document for document, _ in indexer.iter_file_chunks(live[doc_id])])
+        if removed or added:
+            self._save()
+        logging.info(f"Lexical index sync: {len(added)} added, {len(removed)} removed, {len(self)} chunks")
+        return {"added": len(added), "removed": len(removed)}
+
+    def search(self, query, k=10):
+        """
+        Returns up to k (document, score) pairs, best first; only chunks sharing a term with the query score.
+        """
+        if not self.documents:
+            return []
+        average_length = self.total_length / len(self.documents)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.documents[chunk_id], score) for chunk_id, score in best]
+
+    def add_file(self, doc_id, documents):
+        """
+        Indexes the chunk documents of one file; every document needs a chunk_id in its metadata.
+        """
+        chunk_ids = []
+        for document in documents:
+            chunk_id = document.metadata["chunk_id"]
+            terms = Counter(tokenize(document.page_content))
+            for term, frequency in terms.items():
+                self.postings[term][chunk_id] = frequency
+            self.documents[chunk_id] = document
+            self.lengths[chunk_id] = sum(terms.values())
+            self.total_length += self.lengths[chunk_id]
+            chunk_ids.append(chunk_id)
+        self.files[doc_id] = chunk_ids
+
+    def remove_file(self, doc_id):
+        chunk_ids = set(self.files.pop(doc_id))
+        for term in [term for term, postings in self.postings.items() if chunk_ids & postings.keys()]:
+            postings = self.postings[term]
+            for chunk_id in chunk_ids & postings.keys():
+                del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+        for chunk_id in chunk_ids:
+            self.total_length -= self.lengths.pop(chunk_id)
+            del self.documents[chunk_id]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != (TOKENIZER_VERSION, CACHE_VERSION):
+            logging.info("Lexical index was built by another version, rebuilding it")
+            return
+        self.files = data["files"]
+        self.documents = data["documents"]
+        self.lengths = data["lengths"]
+        self.postings = defaultdict(dict, data["postings"])
+        self.total_length = sum(self.lengths.values())
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": (TOKENIZER_VERSION, CACHE_VERSION),
+                "files": self.files,
+                "documents": self.documents,
+                "lengths": self.lengths,
+                "postings": dict(self.postings),
+            }, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,109 @@
+from functools import lru_cache
+from fastapi.responses import JSONResponse
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_ollama import OllamaLLM
+from ollama import ResponseError
+from deadline import DeadlineExceeded, check_deadline, current_deadline, record_cancellation
+from metrics import llm_calls, llm_completion_tokens, llm_prompt_tokens, stage_duration
+from services import BUSY_MESSAGE
+import os
+import time
+
+# Ollama model used by every service
+LLM_MODEL_NAME = os.getenv("OLLAMA_MODEL", "llama3")
+
+# Ollama server, and the LLM gateway (llm_gateway.py) that schedules every
+# service's calls to it. Set LLM_GATEWAY_URL to an empty string to call Ollama directly.
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+LLM_GATEWAY_URL = os.getenv("LLM_GATEWAY_URL", "http://localhost:8007")
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Times every LLM call as the llm.invoke stage and counts the prompt and
+    completion tokens Ollama reports at the end of each generation.
+    """
+    def __init__(self, llm_class):
+        self.llm_class = llm_class
+        self.started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self.started.pop(run_id, None)
+        if start is not None:
+            stage_duration.observe(time.perf_counter() - start, stage="llm.invoke")
+        llm_calls.inc(llm_class=self.llm_class, outcome="ok")
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                llm_prompt_tokens.inc(info.get("prompt_eval_count") or 0, llm_class=self.llm_class)
+                llm_completion_tokens.inc(info.get("eval_count") or 0, llm_class=self.llm_class)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+        llm_calls.inc(llm_class=self.llm_class, outcome="error")
+
+@lru_cache(maxsize=None)
+def get_llm(llm_class="generation", **kwargs):
+    """
+    Returns the process-wide Ollama client for the given traffic class and options,
+    so services running in one process (monolith mode) share a single client.
+
+    The class ("intent", "extraction" or "generation") decides the call's
+    priority and limits in the gateway.
+    """
+    kwargs["base_url"] = f"{LLM_GATEWAY_URL.rstrip('/')}/{llm_class}" if LLM_GATEWAY_URL else OLLAMA_URL
+    return OllamaLLM(model=LLM_MODEL_NAME, callbacks=[LLMMetricsCallback(llm_class)], **kwargs)
+
+def is_busy(error):
+    """
+    True when the gateway shed the LLM call because it is overloaded.
+    """
+    return isinstance(error, ResponseError) and error.status_code == 429
+
+def install_busy_handler(app):
+    """
+    Answers 429 with BUSY_MESSAGE when an endpoint fails because its LLM call was shed.
+    """
+    @app.exception_handler(ResponseError)
+    async def llm_error_handler(request, error):
+        if is_busy(error):
+            return JSONResponse(status_code=429, content={"detail": BUSY_MESSAGE})
+        return JSONResponse(status_code=500, content={"detail": str(error)})
+
+def stream_tokens(llm, prompt):
+    """
+    Yields the tokens of llm.stream(prompt) while the request has time left.
+
+    The generation is stopped with DeadlineExceeded once the deadline passes,
+    and when the caller closes the generator (the client disconnected). Either
+    way the Ollama stream is closed, which makes Ollama (through the gateway)
+    abort the generation instead of finishing it for nobody.
+    """
+    check_deadline("llm.generate")
+    deadline = current_deadline()
+    start = time.perf_counter()
+    tokens = llm.stream(prompt)
+    count = 0
+    reason = None
+    try:
+        for token in tokens:
+            count += 1
+            yield token
+            if deadline is not None and deadline.remaining() <= 0:
+                reason = "deadline"
+                raise DeadlineExceeded("llm.generate")
+    except GeneratorExit:
+        reason = "disconnect"
+        raise
+    finally:
+        tokens.close()
+        if reason:
+            record_cancellation(reason, count, time.perf_counter() - start)
+
+def generate_text(llm, prompt):
+    """
+    llm.invoke(prompt), but streamed so the generation stops when the request deadline passes.
+    """
+    return "".join(stream_tokens(llm, prompt))
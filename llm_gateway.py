@@ -0,0 +1,317 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from services import BUSY_MESSAGE
+from metrics import REGISTRY, Histogram, install_metrics
+from readiness import Warmup, install_readiness
+import asyncio
+import httpx
+import logging
+import os
+import statistics
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Ollama server behind the gateway
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+
+# Calls sent to Ollama at the same time, across all classes
+MAX_CONCURRENCY = int(os.getenv("LLM_GATEWAY_MAX_CONCURRENCY", 2))
+
+# Seconds a shed client is told to wait before retrying
+RETRY_AFTER = int(os.getenv("LLM_GATEWAY_RETRY_AFTER", 5))
+
+# Traffic classes, served in priority order (lower first). Every setting can be
+# overridden per class, e.g. LLM_GATEWAY_GENERATION_MAX_QUEUE=32.
+#   max_concurrency: calls of the class running on Ollama at once
+#   max_queue:       calls of the class allowed to wait; more are rejected
+#   max_wait:        seconds a call may wait for a slot before it is rejected
+DEFAULT_LLM_CLASSES = {
+    "intent": {"priority": 0, "max_concurrency": 2, "max_queue": 64, "max_wait": 10.0},
+    "extraction": {"priority": 1, "max_concurrency": 2, "max_queue": 64, "max_wait": 15.0},
+    "generation": {"priority": 2, "max_concurrency": 1, "max_queue": 16, "max_wait": 60.0},
+}
+
+# Number of recent queue waits kept per class for the wait-time percentiles
+WAIT_SAMPLES = 1000
+
+queue_wait = Histogram("chatbot_llm_queue_wait_seconds", "Time LLM calls waited in the gateway queue.", ["llm_class"])
+
+def class_settings(llm_class):
+    """
+    Builds the scheduling settings of a class from the defaults and the environment.
+    """
+    settings = dict(DEFAULT_LLM_CLASSES[llm_class])
+    for key, value in settings.items():
+        override = os.getenv(f"LLM_GATEWAY_{llm_class.upper()}_{key.upper()}")
+        if override is not None:
+            settings[key] = type(value)(override)
+    return settings
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised when a call is shed because its class queue is full or the wait too long.
+    """
+
+
+class LLMClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.failed = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def wait_summary(self):
+        if not self.waits:
+            return {"p50_s": 0.0, "p95_s": 0.0, "max_s": 0.0}
+        waits = sorted(self.waits)
+        return {
+            "p50_s": round(statistics.median(waits), 4),
+            "p95_s": round(waits[int(0.95 * (len(waits) - 1))], 4),
+            "max_s": round(waits[-1], 4),
+        }
+
+
+class LLMScheduler:
+    """
+    Admits LLM calls to Ollama by class priority.
+
+    At most max_concurrency calls run at once overall, and at most each class's
+    own max_concurrency per class. When a slot frees up it goes to the oldest
+    waiting call of the highest-priority class that is under its limit, so short
+    intent/extraction calls overtake queued long-form generations. Queues are
+    bounded: a call is rejected (SchedulerBusy) at once when its queue is full,
+    or when it has waited max_wait seconds.
+
+    Not thread-safe; used from the gateway's event loop only.
+    """
+    def __init__(self, classes, max_concurrency):
+        self.classes = classes
+        self.max_concurrency = max_concurrency
+        self.by_priority = sorted(classes, key=lambda name: classes[name]["priority"])
+        self.queues = {name: deque() for name in classes}
+        self.running = {name: 0 for name in classes}
+        self.total_running = 0
+        self.stats = {name: LLMClassStats() for name in classes}
+
+    def _can_run(self, llm_class):
+        return self.total_running < self.max_concurrency and self.running[llm_class] < self.classes[llm_class]["max_concurrency"]
+
+    def _start(self, llm_class):
+        self.running[llm_class] += 1
+        self.total_running += 1
+        self.stats[llm_class].admitted += 1
+
+    def _dispatch(self):
+        # Hand free slots to waiting calls, highest priority first
+        while self.total_running < self.max_concurrency:
+            for llm_class in self.by_priority:
+                queue = self.queues[llm_class]
+                while queue and queue[0].done():  # abandoned by its caller
+                    queue.popleft()
+                if queue and self._can_run(llm_class):
+                    self._start(llm_class)
+                    queue.popleft().set_result(None)
+                    break
+            else:
+                return
+
+    def _higher_or_equal_waiting(self, llm_class):
+        priority = self.classes[llm_class]["priority"]
+        return any(self.queues[name] for name in self.classes if self.classes[name]["priority"] <= priority)
+
+    async def acquire(self, llm_class):
+        """
+        Waits for a slot for the class; returns the time spent queued, in seconds.
+        """
+        stats = self.stats[llm_class]
+        if self._can_run(llm_class) and not self._higher_or_equal_waiting(llm_class):
+            self._start(llm_class)
+            stats.waits.append(0.0)
+            queue_wait.observe(0.0, llm_class=llm_class)
+            return 0.0
+
+        settings = self.classes[llm_class]
+        queue = self.queues[llm_class]
+        if len(queue) >= settings["max_queue"]:
+            stats.rejected_queue_full += 1
+            raise SchedulerBusy(f"{llm_class} queue is full ({len(queue)} waiting)")
+
+        start = time.perf_counter()
+        slot = asyncio.get_running_loop().create_future()
+        queue.append(slot)
+        try:
+            await asyncio.wait_for(slot, settings["max_wait"])
+        except asyncio.TimeoutError:
+            if not (slot.done() and not slot.cancelled()):  # unless granted just as the wait expired
+                stats.rejected_timeout += 1
+                raise SchedulerBusy(f"{llm_class} call waited more than {settings['max_wait']}s")
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():  # granted just as the caller went away
+                self.release(llm_class)
+            raise
+        finally:
+            if slot in queue:
+                queue.remove(slot)
+
+        waited = time.perf_counter() - start
+        stats.waits.append(waited)
+        queue_wait.observe(waited, llm_class=llm_class)
+        return waited
+
+    def release(self, llm_class):
+        self.running[llm_class] -= 1
+        self.total_running -= 1
+        self._dispatch()
+
+    def metrics(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.total_running,
+            "classes": {
+                name: {
+                    "priority": settings["priority"],
+                    "max_concurrency": settings["max_concurrency"],
+                    "max_queue": settings["max_queue"],
+                    "queue_depth": len(self.queues[name]),
+                    "in_flight": self.running[name],
+                    "admitted": self.stats[name].admitted,
+                    "rejected_queue_full": self.stats[name].rejected_queue_full,
+                    "rejected_timeout": self.stats[name].rejected_timeout,
+                    "failed": self.stats[name].failed,
+                    "wait": self.stats[name].wait_summary(),
+                }
+                for name, settings in self.classes.items()
+            },
+        }
+
+    def collect_metrics(self):
+        # Prometheus families for REGISTRY, read from the scheduler's own counters
+        gauges = [
+            ("chatbot_llm_queue_depth", "LLM calls waiting in the gateway queue.", lambda name: len(self.queues[name])),
+            ("chatbot_llm_in_flight", "LLM calls running on Ollama.", lambda name: self.running[name]),
+        ]
+        counters = [
+            ("chatbot_llm_admitted_total", "LLM calls admitted to Ollama.", lambda name: self.stats[name].admitted),
+            ("chatbot_llm_rejected_total", "LLM calls shed by the gateway.", None),
+            ("chatbot_llm_failed_total", "LLM calls that failed to reach Ollama.", lambda name: self.stats[name].failed),
+        ]
+        families = [
+            (metric, "gauge", help_text, [(metric, {"llm_class": name}, value(name)) for name in self.classes])
+            for metric, help_text, value in gauges
+        ]
+        for metric, help_text, value in counters:
+            if value is None:
+                samples = [
+                    (metric, {"llm_class": name, "reason": reason}, count)
+                    for name in self.classes
+                    for reason, count in (("queue_full", self.stats[name].rejected_queue_full), ("timeout", self.stats[name].rejected_timeout))
+                ]
+            else:
+                samples = [(metric, {"llm_class": name}, value(name)) for name in self.classes]
+            families.append((metric, "counter", help_text, samples))
+        return families
+
+
+scheduler = LLMScheduler({name: class_settings(name) for name in DEFAULT_LLM_CLASSES}, MAX_CONCURRENCY)
+REGISTRY.add_collector(scheduler.collect_metrics)
+
+# Shared keep-alive client to Ollama; generations can take minutes, so no read timeout
+ollama_client = None
+
+@asynccontextmanager
+async def lifespan(app):
+    global ollama_client
+    ollama_client = httpx.AsyncClient(base_url=OLLAMA_URL, timeout=httpx.Timeout(10.0, read=None))
+    try:
+        yield
+    finally:
+        await ollama_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+install_metrics(app, "llm_gateway")
+
+# Nothing to preload, /ready answers as soon as the server is up (registered before the proxy route)
+install_readiness(app, Warmup("llm_gateway").start())
+
+# Microservices check
+@app.get("/check")
+def health_check():
+    return {"status": "ok"}
+
+# Scheduler summary with wait-time percentiles; /metrics has the Prometheus view
+@app.get("/stats")
+def stats():
+    return scheduler.metrics()
+
+@app.api_route("/{llm_class}/{path:path}", methods=["GET", "POST"])
+async def proxy(llm_class: str, path: str, request: Request):
+    """
+    Forwards an Ollama API call (e.g. POST /generation/api/generate) once the
+    scheduler admits it, streaming the reply back; the slot is held until the
+    reply has been fully relayed.
+    """
+    if llm_class not in scheduler.classes:
+        return JSONResponse(status_code=404, content={"error": f"Unknown LLM class: {llm_class}"})
+
+    body = await request.body()
+    try:
+        waited = await scheduler.acquire(llm_class)
+    except SchedulerBusy as e:
+        logging.warning(f"LLM call shed: {e}")
+        return JSONResponse(status_code=429, content={"error": BUSY_MESSAGE}, headers={"Retry-After": str(RETRY_AFTER)})
+
+    if waited > 1:
+        logging.info(f"{llm_class} call waited {waited:.2f}s for a slot")
+    try:
+        upstream = await ollama_client.send(
+            ollama_client.build_request(
+                request.method,
+                f"/{path}",
+                params=request.query_params,
+                content=body,
+                headers={"Content-Type": request.headers.get("content-type", "application/json")},
+            ),
+            stream=True,
+        )
+    except Exception as e:
+        scheduler.stats[llm_class].failed += 1
+        scheduler.release(llm_class)
+        logging.error(f"Ollama request failed: {e}")
+        return JSONResponse(status_code=502, content={"error": str(e)})
+
+    # Released when the relay ends, or by the background task if the client
+    # disconnected before the relay started; whichever comes first
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            await upstream.aclose()
+            scheduler.release(llm_class)
+
+    async def relay():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await release()
+
+    return StreamingResponse(
+        relay(),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type"),
+        background=BackgroundTask(release),
+    )
+
+# Run the app
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8007)
@@ -0,0 +1,264 @@
+from collections import OrderedDict
+from functools import lru_cache
+from langchain_core.prompts import ChatPromptTemplate
+from deadline import check_deadline
+from metrics import REGISTRY
+from singleflight import NORMALIZERS
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Memoized outputs of the short extraction/classification prompts, shared by
+# every process through SQLite (set LLM_MEMO_PATH to an empty string to keep
+# them in memory only)
+LLM_MEMO_ENABLED = os.getenv("LLM_MEMO_ENABLED", "1") == "1"
+LLM_MEMO_PATH = os.getenv("LLM_MEMO_PATH", "./preprocessed_data/llm_memo.sqlite3")
+LLM_MEMO_MEMORY_SIZE = int(os.getenv("LLM_MEMO_MEMORY_SIZE", 2000))  # entries kept in memory per process
+LLM_MEMO_MAX_ROWS = int(os.getenv("LLM_MEMO_MAX_ROWS", 100000))  # rows kept on disk, least recently used dropped
+LLM_MEMO_TTL = float(os.getenv("LLM_MEMO_TTL", 7 * 24 * 3600))
+LLM_MEMO_NORMALIZATION = os.getenv("LLM_MEMO_NORMALIZATION", "casefold")
+
+# Inserts between two trims of the on-disk store to LLM_MEMO_MAX_ROWS
+PRUNE_INTERVAL = 500
+
+# Every memoized prompt created in this process, by call site, for llm_memo_stats()
+_memos = {}
+
+
+def llm_memo_stats():
+    """
+    Returns the hit/miss counters of every memoized prompt in this process and the size of the store.
+    """
+    stats = {name: memo.stats() for name, memo in _memos.items()}
+    if _memos and LLM_MEMO_ENABLED:
+        stats["store"] = get_store().stats()
+    return stats
+
+
+def _collect_metrics():
+    lookups = [
+        (memo.name, result, getattr(memo, attribute))
+        for memo in _memos.values()
+        for result, attribute in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))
+    ]
+    return [
+        (
+            "chatbot_llm_memo_lookups_total", "counter", "Lookups of memoized LLM prompt outputs, by call site and result.",
+            [("chatbot_llm_memo_lookups_total", {"call_site": name, "result": result}, value) for name, result, value in lookups],
+        ),
+        (
+            "chatbot_llm_memo_rejected_total", "counter", "LLM outputs not memoized because they were blank or unparseable.",
+            [("chatbot_llm_memo_rejected_total", {"call_site": memo.name}, memo.rejected) for memo in _memos.values()],
+        ),
+    ]
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+class MemoStore:
+    """
+    LLM outputs by key: an LRU of max_memory entries in this process in front
+    of a SQLite table shared by every process using the same path.
+
+    Entries expire ttl seconds after they were computed; the table is trimmed
+    to max_rows, least recently used first. SQLite errors are logged and
+    treated as misses, so a broken store only costs the LLM calls it would
+    have saved. Memory hits never wait for SQLite: the LRU and the connection
+    have separate locks.
+    """
+    def __init__(self, path=None, max_memory=2000, max_rows=100000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_memory = max_memory
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._inserts = 0
+        self._lock = threading.Lock()  # guards the in-memory LRU only
+        self._db_lock = threading.Lock()  # serializes use of the SQLite connection
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS memo ("
+                "key TEXT PRIMARY KEY, call_site TEXT NOT NULL, version TEXT NOT NULL, "
+                "value TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS memo_used_at ON memo (used_at)")
+            self.prune()
+
+    def get(self, key):
+        """
+        Returns (value, "memory" or "disk"), or (None, None) on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] >= now - self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[0], "memory"
+                del self._memory[key]
+        if self._connection is None:
+            return None, None
+        with self._db_lock:
+            try:
+                row = self._connection.execute(
+                    "SELECT value, created_at FROM memo WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute("UPDATE memo SET used_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                logging.error(f"LLM memo lookup failed: {e}")
+                return None, None
+        if row is None:
+            return None, None
+        with self._lock:
+            self._remember(key, row[0], row[1])
+        return row[0], "disk"
+
+    def put(self, key, call_site, version, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._connection is None:
+            return
+        with self._db_lock:
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO memo (key, call_site, version, value, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, call_site, version, value, now, now),
+                )
+            except sqlite3.Error as e:
+                logging.error(f"LLM memo store failed: {e}")
+                return
+            self._inserts += 1
+            prune = self._inserts % PRUNE_INTERVAL == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Deletes expired rows and the least recently used rows beyond max_rows.
+        """
+        if self._connection is None:
+            return
+        with self._db_lock:
+            try:
+                self._connection.execute("DELETE FROM memo WHERE created_at < ?", (time.time() - self.ttl,))
+                self._connection.execute(
+                    "DELETE FROM memo WHERE key IN (SELECT key FROM memo ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+            except sqlite3.Error as e:
+                logging.error(f"LLM memo pruning failed: {e}")
+
+    def stats(self):
+        rows = None
+        if self._connection is not None:
+            with self._db_lock:
+                try:
+                    rows = self._connection.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+        return {
+            "path": self.path,
+            "memory_size": len(self._memory),
+            "max_memory": self.max_memory,
+            "rows": rows,
+            "max_rows": self.max_rows,
+            "ttl": self.ttl,
+        }
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    """
+    Returns the process-wide memo store, opening the SQLite file on first use.
+    """
+    return MemoStore(LLM_MEMO_PATH or None, LLM_MEMO_MEMORY_SIZE, LLM_MEMO_MAX_ROWS, LLM_MEMO_TTL)
+
+
+class MemoizedPrompt:
+    """
+    A prompt template with a single {question} variable, piped into an LLM,
+    whose output is memoized on (model, template version, normalized question).
+
+    invoke() returns parse(raw output). The raw output is only stored when it
+    is not blank and parse accepts it (returns something other than None or
+    ""), so a malformed generation is retried by the next call instead of
+    being served until it expires. parse also runs on every hit.
+
+    The llm should be built with temperature=0, so the memoized output is the
+    one a fresh call would return. The version is a hash of the template and
+    the model options (including the temperature), so editing a prompt makes
+    its old outputs unreachable. They are not deleted, since
+    other processes sharing the store may still run the old prompt; the TTL
+    and the row limit drop them. The request deadline is only checked when
+    the LLM has to be called.
+    """
+    def __init__(self, name, template, llm, parse=str.strip, deadline_stage=None, normalization=None):
+        self.name = name
+        self.parse = parse
+        self.chain = ChatPromptTemplate.from_template(template) | llm
+        self.model = getattr(llm, "model", None)
+        self.deadline_stage = deadline_stage or f"{name}.llm"
+        self.normalize = NORMALIZERS[normalization or LLM_MEMO_NORMALIZATION]
+        options = f"{self.model}\0{getattr(llm, 'format', None) or ''}\0{getattr(llm, 'temperature', None)}"
+        self.version = hashlib.sha256(f"{options}\0{template}".encode("utf-8")).hexdigest()[:16]
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.rejected = 0
+        _memos[name] = self
+
+    def key(self, question):
+        return hashlib.sha256(f"{self.name}\0{self.version}\0{self.normalize(question)}".encode("utf-8")).hexdigest()
+
+    def invoke(self, question):
+        if not LLM_MEMO_ENABLED:
+            check_deadline(self.deadline_stage)
+            return self.parse(self.chain.invoke({"question": question}))
+
+        store = get_store()
+        key = self.key(question)
+        value, source = store.get(key)
+        if source == "memory":
+            self.memory_hits += 1
+            return self.parse(value)
+        if source == "disk":
+            self.disk_hits += 1
+            return self.parse(value)
+
+        self.misses += 1
+        check_deadline(self.deadline_stage)
+        value = self.chain.invoke({"question": question})
+        result = self.parse(value)
+        if value.strip() and result is not None and result != "":
+            store.put(key, self.name, self.version, value)
+        else:
+            self.rejected += 1
+            logging.warning(f"Not memoizing unusable output of prompt '{self.name}': {value!r}")
+        return result
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "version": self.version,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
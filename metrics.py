@@ -0,0 +1,241 @@
+from contextlib import contextmanager
+from fastapi.responses import PlainTextResponse
+from functools import wraps
+import inspect
+import threading
+import time
+
+# Latency buckets in seconds, from SQLite lookups up to long generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+
+    Collectors are callables returning metric families kept elsewhere (e.g. the
+    single-flight counters) as [(name, type, help, [(sample_name, labels, value)])].
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        families = [metric.collect() for metric in self.metrics.values()]
+        for collector in self.collectors:
+            families.extend(collector())
+        for name, metric_type, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def collect(self):
+        with self.lock:
+            samples = [(self.name, self._labels(key), value) for key, value in self.values.items()]
+        return self.name, self.type, self.help, samples
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Per-bucket counts, then sum and count
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        samples = []
+        with self.lock:
+            items = [(key, list(counts)) for key, counts in self.values.items()]
+        for key, counts in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-1]))
+            samples.append((f"{self.name}_sum", labels, counts[-2]))
+            samples.append((f"{self.name}_count", labels, counts[-1]))
+        return self.name, self.type, self.help, samples
+
+
+# Pipeline stages (classify_intent, doctor_extraction, retriever.invoke, llm.invoke, ...)
+stage_duration = Histogram("chatbot_stage_duration_seconds", "Duration of each pipeline stage.", ["stage"])
+
+# HTTP requests per service
+requests_in_flight = Gauge("chatbot_requests_in_flight", "Requests currently being served.", ["service"])
+request_duration = Histogram("chatbot_request_duration_seconds", "Duration of HTTP requests, including streamed bodies.", ["service", "path"])
+requests_total = Counter("chatbot_requests_total", "HTTP requests served.", ["service", "path", "status"])
+
+# LLM calls, by gateway traffic class
+llm_calls = Counter("chatbot_llm_calls_total", "LLM calls.", ["llm_class", "outcome"])
+llm_prompt_tokens = Counter("chatbot_llm_prompt_tokens_total", "Prompt tokens evaluated by Ollama.", ["llm_class"])
+llm_completion_tokens = Counter("chatbot_llm_completion_tokens_total", "Tokens generated by Ollama.", ["llm_class"])
+
+
+@contextmanager
+def stage(name):
+    """
+    Records the duration of the enclosed block as a pipeline stage.
+    """
+    with stage_duration.time(stage=name):
+        yield
+
+
+def timed_stage(name):
+    """
+    Decorator recording every call of a function (sync or async) as a pipeline stage.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware tracking in-flight requests and request durations per route.
+    """
+    def __init__(self, app, service):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        requests_in_flight.inc(service=self.service)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec(service=self.service)
+            # Label by route template, so path parameters don't create new series
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            request_duration.observe(time.perf_counter() - start, service=self.service, path=path)
+            requests_total.inc(service=self.service, path=path, status=status)
+
+
+def install_metrics(app, service):
+    """
+    Adds request metrics and a Prometheus /metrics endpoint to a service.
+    """
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
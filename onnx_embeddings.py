@@ -0,0 +1,168 @@
+from langchain_core.embeddings import Embeddings
+import argparse
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+# Files of an exported model directory
+MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedding_config.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed by an exported (by default int8-quantized) ONNX
+    model on ONNX Runtime, a drop-in replacement for HuggingFaceEmbeddings.
+
+    Pooling, normalization and the maximum sequence length follow the
+    sentence-transformers configuration recorded at export time, so vectors
+    match the PyTorch model's up to quantization error. Texts are sorted by
+    length and embedded in batches of batch_size, which keeps padding short;
+    threads sets ONNX Runtime's intra-op thread count (0: one per core).
+    """
+    def __init__(self, model_dir, threads=0, batch_size=32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_id = f"{self.config['model_name']}@onnx-{'int8' if self.config['quantized'] else 'fp32'}"
+        self.batch_size = batch_size
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE), options, providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        if self.config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def export_model(model_name, output_dir, quantize=True):
+    """
+    Exports a sentence-transformers model to output_dir as ONNX (int8 dynamic
+    quantization by default), with its tokenizer and pooling configuration.
+
+    Needs torch, transformers and onnx, which only the machine doing the export
+    has to install; serving only needs onnxruntime and tokenizers.
+    """
+    import torch
+    from huggingface_hub import snapshot_download
+    from transformers import AutoModel, AutoTokenizer
+
+    source_dir = snapshot_download(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(source_dir)
+    model = AutoModel.from_pretrained(source_dir).eval()
+
+    # Pooling and normalization of the sentence-transformers pipeline
+    pooling, normalize, max_seq_length = "mean", False, tokenizer.model_max_length
+    modules_path = os.path.join(source_dir, "modules.json")
+    if os.path.exists(modules_path):
+        with open(modules_path, encoding="utf-8") as f:
+            modules = json.load(f)
+        normalize = any(module["type"].endswith("Normalize") for module in modules)
+        for module in modules:
+            if module["type"].endswith("Pooling"):
+                with open(os.path.join(source_dir, module["path"], "config.json"), encoding="utf-8") as f:
+                    pooling = "cls" if json.load(f).get("pooling_mode_cls_token") else "mean"
+    bert_config_path = os.path.join(source_dir, "sentence_bert_config.json")
+    if os.path.exists(bert_config_path):
+        with open(bert_config_path, encoding="utf-8") as f:
+            max_seq_length = json.load(f).get("max_seq_length", max_seq_length)
+
+    sample = tokenizer(["contoh kalimat untuk ekspor"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *tensors):
+            return self.model(**dict(zip(input_names, tensors))).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    fp32_path = f"{model_path}.fp32" if quantize else model_path
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(), tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=17,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+
+    # A fast tokenizer saves tokenizer.json, which the tokenizers library loads without transformers
+    tokenizer.save_pretrained(output_dir)
+    if not os.path.exists(os.path.join(output_dir, TOKENIZER_FILE)):
+        shutil.rmtree(output_dir)
+        raise ValueError(f"{model_name} has no fast tokenizer (tokenizer.json)")
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "quantized": quantize,
+            "pooling": pooling,
+            "normalize": normalize,
+            "max_seq_length": max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+    logging.info(f"Exported {model_name} to {output_dir}")
+
+
+# Export the embedding model: python onnx_embeddings.py [--fp32]
+if __name__ == "__main__":
+    from embedding_model import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX for EMBEDDING_BACKEND=onnx.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--output", default=EMBEDDING_ONNX_DIR)
+    parser.add_argument("--fp32", action="store_true", help="skip the int8 quantization")
+    args = parser.parse_args()
+    export_model(args.model, args.output, quantize=not args.fp32)
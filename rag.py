@@ -1,14 +1,38 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_ollama import OllamaLLM
+from llm import generate_text, get_llm, install_busy_handler, is_busy, stream_tokens
+from deadline import DEADLINE_MESSAGE, DeadlineExceeded, cancellable_deadline, close_on_disconnect, check_deadline, install_deadline
+from embedding_model import get_embeddings
+from embedding_batcher import MicroBatchEmbeddings
+from dense_index import DenseIndex, DenseRetriever, normalize_rows
+from context_packer import pack_context
+from lexical_index import BM25Index, is_keyword_query, reciprocal_rank_fusion, tokenize
+from indexer import IncrementalIndexer
+from semantic_cache import SemanticCache
+from services import BUSY_MESSAGE
+from singleflight import SingleFlight, singleflight_stats
+from metrics import install_metrics, stage, timed_stage
+from readiness import Warmup, install_readiness
+from concurrent.futures import Future
+import logging
+import numpy as np
 import os
-import pickle
+import threading
+import time
 
 app = FastAPI()
+install_busy_handler(app)
+install_metrics(app, "rag")
+install_deadline(app, "rag")
+
+# Models and indexes are loaded in the background (see the warm-up steps below),
+# so /check answers immediately and /ready once they are loaded
+warmup = Warmup("rag")
+install_readiness(app, warmup)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Define input and output models
 class QueryRequest(BaseModel):
@@ -17,76 +41,188 @@ class QueryRequest(BaseModel):
 class QueryResponse(BaseModel):
     response: str
 
-# Function to load documents from PDFs
-def load_documents(directory_path):
-    pdf_files = [
-        os.path.join(directory_path, file)
-        for file in os.listdir(directory_path)
-        if file.endswith(".pdf")
-    ]
-    documents = []
-    for pdf_file in pdf_files:
-        loader = PyPDFLoader(pdf_file)
-        documents.extend(loader.load())
-    return documents
-
-# Function to load or save preprocessed data
-def load_preprocessed_data(directory_path):
-    emb_file = os.path.join(directory_path, 'embeddings.pkl')
-    chunk_file = os.path.join(directory_path, 'chunks.pkl')
-    if os.path.exists(emb_file) and os.path.exists(chunk_file):
-        with open(emb_file, 'rb') as f:
-            embeddings_data = pickle.load(f)
-        with open(chunk_file, 'rb') as f:
-            chunks_data = pickle.load(f)
-        return embeddings_data, chunks_data
-    return None, None
-
-def save_preprocessed_data(directory_path, embeddings_data, chunks_data):
-    os.makedirs(directory_path, exist_ok=True)
-    emb_file = os.path.join(directory_path, 'embeddings.pkl')
-    chunk_file = os.path.join(directory_path, 'chunks.pkl')
-    with open(emb_file, 'wb') as f:
-        pickle.dump(embeddings_data, f)
-    with open(chunk_file, 'wb') as f:
-        pickle.dump(chunks_data, f)
+class PrefetchResponse(BaseModel):
+    cached: bool
 
-# Initialize embeddings and vector store
-embeddings = HuggingFaceEmbeddings(model_name="LazarusNLP/all-indo-e5-small-v4")
+class AbandonResponse(BaseModel):
+    abandoned: bool
 
 # Path to preprocessed data
 preprocessed_data_dir = './preprocessed_data'
 
-# Load or preprocess data
-embeddings_data, chunks_data = load_preprocessed_data(preprocessed_data_dir)
-if embeddings_data is None or chunks_data is None:
-    documents = load_documents("docs/")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = [text_splitter.split_documents([doc]) for doc in documents]
-    chunks = [chunk for sublist in chunks for chunk in sublist]
-    embeddings_data = embeddings.embed_documents([chunk.page_content for chunk in chunks])
-    save_preprocessed_data(preprocessed_data_dir, embeddings_data, chunks)
-else:
-    chunks = chunks_data
-
-vectorstore = Chroma.from_documents(chunks, embeddings, persist_directory="./chroma_store")
-retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+# Retriever backend: "dense" searches a memory-mapped embedding matrix, "chroma" the Chroma store
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "dense")
+RAG_DENSE_DTYPE = os.getenv("RAG_DENSE_DTYPE", "float32")  # or "float16" to halve the index size
+dense_index_dir = os.path.join(preprocessed_data_dir, "dense")
+children_index_dir = os.path.join(preprocessed_data_dir, "dense_children")
+
+lexical_index_dir = os.path.join(preprocessed_data_dir, "lexical")
+
+# Hybrid retrieval fuses BM25 results with the dense ones (reciprocal rank fusion);
+# in lexical-only mode short keyword queries skip the query embedding altogether
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+RAG_LEXICAL_ONLY = os.getenv("RAG_LEXICAL_ONLY", "1") == "1"
+
+# Query embeddings of concurrent requests are computed together: the first query
+# waits up to RAG_EMBED_BATCH_WINDOW_MS for others, at most RAG_EMBED_MAX_BATCH per pass
+RAG_EMBED_BATCHING = os.getenv("RAG_EMBED_BATCHING", "1") == "1"
+RAG_EMBED_BATCH_WINDOW_MS = float(os.getenv("RAG_EMBED_BATCH_WINDOW_MS", 5))
+RAG_EMBED_MAX_BATCH = int(os.getenv("RAG_EMBED_MAX_BATCH", 32))
+
+# Token budget of the context put into the prompt
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", 1500))
+
+# Set by the warm-up steps
+embeddings = None
+vectorstore = None
+indexer = None
+retriever = None
+children_index = None
+lexical_index = None
+semantic_cache = None
+
+@warmup.step("embeddings.load")
+def load_embeddings():
+    global embeddings
+    embeddings = get_embeddings()
+    if RAG_EMBED_BATCHING:
+        embeddings = MicroBatchEmbeddings(embeddings, window=RAG_EMBED_BATCH_WINDOW_MS / 1000, max_batch_size=RAG_EMBED_MAX_BATCH)
+
+# Open the persisted index and only (re-)index documents that were added, changed or removed
+@warmup.step("index.sync")
+def sync_index():
+    global vectorstore, indexer
+    if RAG_RETRIEVER == "chroma":
+        from langchain_community.vectorstores import Chroma
+        vectorstore = Chroma(persist_directory="./chroma_store", embedding_function=embeddings)
+    indexer = IncrementalIndexer("docs/", preprocessed_data_dir, embeddings, vectorstore)
+    indexer.sync()
+
+def open_dense_index(index_dir, items):
+    """
+    Opens the dense index in index_dir, rebuilding it from the (document, embedding) items when the corpus changed.
+    """
+    if DenseIndex.stored_fingerprint(index_dir) == indexer.fingerprint():
+        return DenseIndex.open(index_dir)
+    logging.info(f"Building dense index {index_dir}")
+    items = list(items)
+    documents = [document for document, _ in items]
+    vectors = [vector for _, vector in items]
+    return DenseIndex.build(index_dir, documents, vectors, dtype=RAG_DENSE_DTYPE, fingerprint=indexer.fingerprint())
+
+@warmup.step("dense_index.open")
+def open_dense_indexes():
+    global retriever, children_index
+    if vectorstore is not None:
+        retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+    else:
+        dense_index = open_dense_index(dense_index_dir, indexer.iter_chunks())
+        retriever = DenseRetriever(index=dense_index, embeddings=embeddings, k=10)
+
+    # Child chunks of every indexed chunk, fetched by id for the "child" granularity
+    children_index = open_dense_index(children_index_dir, indexer.iter_children())
+
+# BM25 index over the same chunks, updated with the files the indexer added or removed
+@warmup.step("lexical_index.sync")
+def sync_lexical_index():
+    global lexical_index
+    lexical_index = BM25Index(lexical_index_dir)
+    lexical_index.sync(indexer)
+
+# Retrieve with MMR, reusing an already computed query embedding when available
+@timed_stage("retriever.invoke")
+def retrieve_dense(query, query_vector=None):
+    if query_vector is None:
+        return retriever.invoke(query)
+    if vectorstore is not None:
+        return vectorstore.max_marginal_relevance_search_by_vector(query_vector.tolist(), k=10)
+    return retriever.search_by_vector(query_vector)
+
+@timed_stage("lexical.search")
+def retrieve_lexical(query, k=10):
+    return [document for document, _ in lexical_index.search(query, k)]
+
+# Dense results, fused with the BM25 ones in hybrid mode
+def retrieve(query, query_vector=None):
+    dense_docs = retrieve_dense(query, query_vector)
+    if not RAG_HYBRID:
+        return dense_docs
+    return reciprocal_rank_fusion([dense_docs, retrieve_lexical(query)], limit=10)
 
 # Initialize the LLM
-llm = OllamaLLM(model="llama3")
+llm = get_llm("generation")
+
+# Semantic answer cache (set RAG_CACHE_PATH to an empty string to keep it in memory only)
+RAG_CACHE_ENABLED = os.getenv("RAG_CACHE_ENABLED", "1") == "1"
+
+@warmup.step("semantic_cache.load")
+def load_semantic_cache():
+    global semantic_cache
+    semantic_cache = SemanticCache(
+        embeddings,
+        threshold=float(os.getenv("RAG_CACHE_THRESHOLD", 0.95)),
+        max_size=int(os.getenv("RAG_CACHE_MAX_SIZE", 1000)),
+        ttl=float(os.getenv("RAG_CACHE_TTL", 24 * 3600)),
+        path=os.getenv("RAG_CACHE_PATH", os.path.join(preprocessed_data_dir, "semantic_cache.pkl")) or None,
+        fingerprint=indexer.fingerprint(),
+        terms=tokenize,
+    )
 
 # Microservices check
 @app.get("/check")   
 def health_check():
     return {"status": "ok"}
 
-# API endpoint
-@app.post("/rag", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    query = request.query
+# Concurrent identical queries share one generation
+rag_flight = SingleFlight("rag")
+rag_stream_flight = SingleFlight("rag-stream")
+
+@app.get("/rag/coalescing-stats")
+def coalescing_stats():
+    return singleflight_stats()
+
+@app.get("/rag/cache-stats")
+def cache_stats():
+    warmup.wait()
+    return semantic_cache.stats()
 
-    # Retrieve relevant documents
-    retrieved_docs = retriever.invoke(query)
+# Batch sizes and queueing delay of the query embedding; /metrics has the histograms
+@app.get("/rag/embedding-batch-stats")
+def embedding_batch_stats():
+    warmup.wait()
+    return embeddings.stats() if RAG_EMBED_BATCHING else {}
+
+def embed_query(query):
+    return np.asarray(embeddings.embed_query(query), dtype=np.float32)
+
+# Complex questions get the finer child chunks of the retrieved chunks, ranked by similarity
+def choose_granularity(query):
+    complex_keywords = {"kenapa", "mengapa", "bagaimana", "jelaskan"}
+    is_complex = len(query.split()) > 7 or any(word in query.lower() for word in complex_keywords)
+    return "child" if is_complex else "chunk"
+
+# Fetch the precomputed children of the chunks by id, most similar to the query first
+@timed_stage("children.fetch")
+def fetch_children(chunks, query_vector):
+    child_ids = [
+        f"{chunk.metadata['chunk_id']}.{j}"
+        for chunk in chunks
+        for j in range(chunk.metadata.get("child_count", 0))
+    ]
+    rows = children_index.rows_for(child_ids)
+    if not rows:
+        return []
+    scores = normalize_rows(children_index.vectors[rows]) @ normalize_rows(query_vector)
+    return [children_index.documents[rows[i]] for i in np.argsort(-scores)]
+
+# Retrieve context for the query and build the generation prompt
+@timed_stage("build_prompt")
+def build_prompt(query, query_vector=None, retrieved_docs=None):
+    if retrieved_docs is None:
+        if query_vector is None:
+            query_vector = embed_query(query)
+        # Retrieve relevant documents (reusing the cache's query embedding when available)
+        retrieved_docs = retrieve(query, query_vector)
 
     # Ensure diverse retrieval
     source_count = {}
@@ -97,24 +233,19 @@ async def process_query(request: QueryRequest):
             diversified_docs.append(doc)
             source_count[source] = source_count.get(source, 0) + 1
 
-    # Assess query complexity
-    complex_keywords = {"kenapa", "mengapa", "bagaimana", "jelaskan"}
-    is_complex = len(query.split()) > 7 or any(word in query.lower() for word in complex_keywords)
-
-    if is_complex:
-        # Late chunking
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = [text_splitter.split_documents([doc]) for doc in diversified_docs]
-        chunks = [chunk for sublist in chunks for chunk in sublist]
-    else:
-        # Use pre-chunked documents
-        chunks = diversified_docs
+    # Pick the granularity; chunks indexed before child chunks existed have none and are used whole
+    chunks = diversified_docs
+    if choose_granularity(query) == "child":
+        if query_vector is None:
+            query_vector = embed_query(query)
+        chunks = fetch_children(diversified_docs, query_vector) or diversified_docs
 
-    # Combine context
-    context = "\n\n".join([chunk.page_content for chunk in chunks])
+    # Combine context within the token budget, without repeating overlapping text
+    with stage("context.pack"):
+        context = pack_context(chunks, RAG_CONTEXT_TOKENS)
 
     # Prepare prompt
-    prompt = f"""
+    return f"""
     You are an expert medical AI assistant. Use the provided context and your own knowledge to answer the question in a clear, concise, and professional manner. Remember, always answer in Bahasa Indonesia.
 
     ### Instructions:
@@ -131,13 +262,162 @@ async def process_query(request: QueryRequest):
     ### Answer:
     """
 
+# Look up the semantic cache; returns (cached_response, query_vector)
+@timed_stage("semantic_cache.lookup")
+def lookup_cache(query):
+    if RAG_CACHE_ENABLED:
+        return semantic_cache.lookup(query)
+    return None, None
+
+# Exact-text cache lookup for queries that skip the embedding
+@timed_stage("semantic_cache.lookup_text")
+def lookup_cache_text(query):
+    if RAG_CACHE_ENABLED:
+        return semantic_cache.lookup_text(query)
+    return None
+
+# Cache lookup and retrieval for a query; returns (cached_response, query_vector, prompt)
+def prepare_query(query):
+    check_deadline("rag.prepare")
+    # Keyword queries with BM25 matches skip the embedding: exact cache match, lexical retrieval
+    if RAG_LEXICAL_ONLY and is_keyword_query(query):
+        lexical_docs = retrieve_lexical(query)
+        if lexical_docs:
+            cached_response = lookup_cache_text(query)
+            if cached_response is not None:
+                return cached_response, None, None
+            return None, None, build_prompt(query, retrieved_docs=lexical_docs)
+
+    # Answer from the semantic cache when a similar query was answered before
+    cached_response, query_vector = lookup_cache(query)
+    if cached_response is not None:
+        return cached_response, query_vector, None
+    check_deadline("rag.retrieve")
+    return None, query_vector, build_prompt(query, query_vector)
+
+# Queries prepared ahead of time by /rag/prefetch (the backend's speculative mode),
+# handed to the next /rag call for the same query within RAG_PREFETCH_TTL seconds.
+# At most RAG_PREFETCH_MAX are kept, the oldest are dropped first.
+RAG_PREFETCH_TTL = float(os.getenv("RAG_PREFETCH_TTL", 30))
+RAG_PREFETCH_MAX = int(os.getenv("RAG_PREFETCH_MAX", 256))
+prefetched = {}  # query -> (expires_at, Future of prepare_query(query), deadline of the prefetch)
+prefetched_lock = threading.Lock()
+
+def drop_expired_prefetches(now):
+    # Called with prefetched_lock held
+    for query in [query for query, (expires_at, _, _) in prefetched.items() if expires_at <= now]:
+        del prefetched[query]
+
+def take_prepared(query):
+    """
+    Returns the prefetched preparation of the query (waiting for it if still running), else prepares it now.
+    """
+    with prefetched_lock:
+        drop_expired_prefetches(time.monotonic())
+        entry = prefetched.pop(query, None)
+    if entry is not None:
+        try:
+            return entry[1].result()
+        except Exception as e:
+            logging.warning(f"Prefetch for {query!r} failed, preparing again: {e}")
+    return prepare_query(query)
+
+@app.post("/rag/prefetch", response_model=PrefetchResponse)
+def prefetch_query(request: QueryRequest):
+    warmup.wait()
+    future = Future()
+    with cancellable_deadline("rag") as deadline:
+        now = time.monotonic()
+        with prefetched_lock:
+            drop_expired_prefetches(now)
+            prefetched.pop(request.query, None)
+            prefetched[request.query] = (now + RAG_PREFETCH_TTL, future, deadline)
+            while len(prefetched) > RAG_PREFETCH_MAX:
+                del prefetched[next(iter(prefetched))]
+        try:
+            prepared = prepare_query(request.query)
+        except Exception as e:
+            future.set_exception(e)
+            if isinstance(e, DeadlineExceeded):
+                raise  # answered 504 by install_deadline
+            raise HTTPException(status_code=500, detail=str(e))
+    future.set_result(prepared)
+    return PrefetchResponse(cached=prepared[0] is not None)
+
+# Called by the backend when it picked an intent that does not use the prefetch
+@app.post("/rag/prefetch/abandon", response_model=AbandonResponse)
+def abandon_prefetch(request: QueryRequest):
+    with prefetched_lock:
+        entry = prefetched.pop(request.query, None)
+    if entry is not None:
+        # The prefetch stops at its next deadline check (answering 504 to nobody)
+        entry[2].cancel()
+    return AbandonResponse(abandoned=entry is not None)
+
+# API endpoint
+@app.post("/rag", response_model=QueryResponse)
+def process_query(request: QueryRequest):
+    warmup.wait()
+    query = request.query
+
+    cached_response, query_vector, prompt = take_prepared(query)
+    if cached_response is not None:
+        return QueryResponse(response=cached_response)
+
+    def generate():
+        response = generate_text(llm, prompt)
+        if RAG_CACHE_ENABLED:
+            semantic_cache.store(query, response, query_vector)
+        return response
+
     # Generate response
     try:
-        response = llm.invoke(prompt)
+        response = rag_flight.do(query, generate)
     except Exception as e:
+        if is_busy(e) or isinstance(e, DeadlineExceeded):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
+
     return QueryResponse(response=response)
 
+# Streaming API endpoint, sends the answer as chunked plain text while it is generated
+@app.post("/rag/stream")
+def stream_query(request: QueryRequest):
+    warmup.wait()
+    query = request.query
+    start_time = time.perf_counter()
+
+    cached_response, query_vector, prompt = take_prepared(query)
+    if cached_response is not None:
+        return StreamingResponse(iter([cached_response]), media_type="text/plain; charset=utf-8")
+
+    def generate():
+        parts = []
+        try:
+            for token in stream_tokens(llm, prompt):
+                if not parts:
+                    logging.info(f"RAG time to first token: {time.perf_counter() - start_time:.3f}s")
+                parts.append(token)
+                yield token
+        except DeadlineExceeded:
+            # Out of time: the answer so far is sent as is (and not cached)
+            if not parts:
+                yield DEADLINE_MESSAGE
+            return
+        except Exception as e:
+            # The status is already sent, so a shed call is reported in the stream itself
+            if is_busy(e) and not parts:
+                yield BUSY_MESSAGE
+                return
+            raise
+        logging.info(f"RAG total generation time: {time.perf_counter() - start_time:.3f}s")
+        if RAG_CACHE_ENABLED:
+            semantic_cache.store(query, "".join(parts), query_vector)
+
+    return StreamingResponse(close_on_disconnect(rag_stream_flight.stream(query, generate)), media_type="text/plain; charset=utf-8")
+
+warmup.start()
+
 # Run the app
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,123 @@
+from fastapi.responses import JSONResponse
+import logging
+import os
+import threading
+import time
+
+# Seconds a request that arrives during warm-up waits for it before getting a 503
+STARTUP_REQUEST_WAIT = float(os.getenv("STARTUP_REQUEST_WAIT", 120))
+
+# Reply while the service is still loading its models and indexes
+STARTING_MESSAGE = "Layanan sedang dimuat. Silakan coba beberapa saat lagi."
+
+
+class ServiceStarting(Exception):
+    """
+    Raised when a request needs a resource that is still being loaded (or failed to load).
+    """
+
+
+class Warmup:
+    """
+    The heavy resources of a service (models, indexes), loaded on a background
+    thread so the HTTP server starts answering /check right away.
+
+    Steps run once, in the order they were added; /ready answers 503 until
+    every step (and every dependency, e.g. the in-process services of the
+    monolith backend) has finished, and reports when each step started and how
+    long it took.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.created_at = time.time()
+        self.steps = []
+        self.timeline = []
+        self.dependencies = []
+        self.error = None
+        self.done = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_step(self, name, fn):
+        self.steps.append((name, fn))
+        return fn
+
+    def step(self, name):
+        """
+        Decorator adding a function as a warm-up step.
+        """
+        return lambda fn: self.add_step(name, fn)
+
+    def start(self):
+        """
+        Runs the steps on a background thread; later calls do nothing.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"warmup-{self.service}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        for name, fn in self.steps:
+            record = {"name": name, "status": "running", "started_at": time.time(), "seconds": None}
+            self.timeline.append(record)
+            start = time.perf_counter()
+            try:
+                fn()
+                record["status"] = "ready"
+            except Exception as e:
+                logging.exception(f"Warm-up step {name} of {self.service} failed")
+                record["status"] = "failed"
+                self.error = f"{name}: {e}"
+            record["seconds"] = round(time.perf_counter() - start, 3)
+            if self.error:
+                break
+            logging.info(f"Warm-up step {name} of {self.service} took {record['seconds']}s")
+        self.done.set()
+
+    @property
+    def ready(self):
+        return self.done.is_set() and self.error is None and all(dependency.ready for dependency in self.dependencies)
+
+    def wait(self, timeout=STARTUP_REQUEST_WAIT):
+        """
+        Blocks until the warm-up has finished; raises ServiceStarting when it failed or took longer than timeout.
+        """
+        deadline = time.monotonic() + timeout
+        for warmup in [self, *self.dependencies]:
+            if not warmup.done.wait(max(0.0, deadline - time.monotonic())):
+                raise ServiceStarting(f"{warmup.service} is still warming up")
+            if warmup.error:
+                raise ServiceStarting(f"{warmup.service} failed to warm up: {warmup.error}")
+
+    def status(self):
+        if self.error or any(dependency.status()["status"] == "failed" for dependency in self.dependencies):
+            status = "failed"
+        else:
+            status = "ready" if self.ready else "starting"
+        return {
+            "service": self.service,
+            "status": status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "steps": list(self.timeline),
+            "pending": [name for name, _ in self.steps[len(self.timeline):]],
+            "dependencies": [dependency.status() for dependency in self.dependencies],
+        }
+
+
+def install_readiness(app, warmup):
+    """
+    Adds the /ready readiness probe (liveness stays on /check) and answers 503
+    when a request cannot wait for the warm-up.
+    """
+    @app.get("/ready")
+    def readiness_check():
+        status = warmup.status()
+        return JSONResponse(status_code=200 if status["status"] == "ready" else 503, content=status)
+
+    @app.exception_handler(ServiceStarting)
+    async def service_starting_handler(request, error):
+        logging.warning(str(error))
+        return JSONResponse(status_code=503, content={"detail": STARTING_MESSAGE})
@@ -1,44 +1,134 @@
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import argparse
+import os
 import subprocess
+import threading
 import time
 import requests
 
-# List of microservices with their check URLs
+# List of microservices with their liveness (/check) and readiness (/ready) URLs
 microservices = [
-    {"name": "backend", "url": "http://localhost:8000/check"},
-    {"name": "intent", "url": "http://localhost:8001/check"},
-    {"name": "rag", "url": "http://localhost:8002/check"},
-    {"name": "function_doctorname", "url": "http://localhost:8003/check"},
-    {"name": "function_doctordisease", "url": "http://localhost:8004/check"},
-    {"name": "function_doctorspecialization", "url": "http://localhost:8005/check"},
-    {"name": "function_generalquery", "url": "http://localhost:8006/check"}
+    {"name": "backend", "url": "http://localhost:8000/check", "ready_url": "http://localhost:8000/ready"},
+    {"name": "intent", "url": "http://localhost:8001/check", "ready_url": "http://localhost:8001/ready"},
+    {"name": "rag", "url": "http://localhost:8002/check", "ready_url": "http://localhost:8002/ready"},
+    {"name": "function_doctorname", "url": "http://localhost:8003/check", "ready_url": "http://localhost:8003/ready"},
+    {"name": "function_doctordisease", "url": "http://localhost:8004/check", "ready_url": "http://localhost:8004/ready"},
+    {"name": "function_doctorspecialization", "url": "http://localhost:8005/check", "ready_url": "http://localhost:8005/ready"},
+    {"name": "function_generalquery", "url": "http://localhost:8006/check", "ready_url": "http://localhost:8006/ready"},
+    {"name": "llm_gateway", "url": "http://localhost:8007/check", "ready_url": "http://localhost:8007/ready"}
 ]
 
-# Function to check if a microservice is up
-def is_microservice_up(url):
-    try:
-        response = requests.get(url)
-        return response.status_code == 200
-    except requests.RequestException:
-        return False
+# Readiness polling: the first retry comes quickly, later ones back off up to the cap
+POLL_INITIAL_DELAY = 0.1
+POLL_BACKOFF = 1.5
+POLL_MAX_DELAY = 2.0
+
+# Seconds to wait for every service to be ready before giving up
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", 600))
+
+# Deployment modes: every service in its own process, or the backend serving all of them in-process
+MODES = ["http", "monolith"]
 
-# Function to start microservices
-def start_microservices():
+def microservices_for(mode):
+    """
+    Returns the processes to start for a deployment mode.
+    """
+    if mode == "monolith":
+        return [microservice for microservice in microservices if microservice["name"] in ("backend", "llm_gateway")]
+    return microservices
+
+# Function to start microservices; all processes are spawned at once and boot in parallel
+def start_microservices(mode="http"):
     processes = []
-    for microservice in microservices:
+    env = dict(os.environ, BACKEND_MODE=mode)
+    for microservice in microservices_for(mode):
         print(f"Starting {microservice['name']}...")
-        process = subprocess.Popen(["uvicorn", microservice["name"] + ":app", "--host", "0.0.0.0", "--port", str(microservice["url"].split(":")[-1].split("/")[0])])
+        process = subprocess.Popen(["uvicorn", microservice["name"] + ":app", "--host", "0.0.0.0", "--port", str(microservice["url"].split(":")[-1].split("/")[0])], env=env)
+        process.service_name = microservice["name"]
+        process.spawned_at = time.time()
         processes.append(process)
     return processes
 
-# Function to wait until all microservices are up
-def wait_for_microservices():
-    all_up = False
-    while not all_up:
-        print("Checking if all microservices are up...")
-        all_up = all(is_microservice_up(microservice["url"]) for microservice in microservices)
-        if not all_up:
-            time.sleep(5)
+def warmup_error(report):
+    """
+    The error of a failed /ready report, looking into the in-process services it depends on.
+    """
+    if report.get("error"):
+        return f"{report.get('service')}: {report['error']}"
+    for dependency in report.get("dependencies", []):
+        error = warmup_error(dependency)
+        if error:
+            return error
+    return "unknown error"
+
+def wait_until_ready(microservice, process=None, deadline=None, stop=None):
+    """
+    Polls a microservice with exponential backoff until /ready answers 200; returns
+    when it came up (/check) and became ready, and its /ready report.
+    Raises RuntimeError as soon as /ready reports that a warm-up step failed,
+    and gives up when the stop event is set (another service failed).
+    """
+    timing = {"name": microservice["name"], "spawned_at": getattr(process, "spawned_at", time.time()), "live_at": None, "ready_at": None}
+    delay = POLL_INITIAL_DELAY
+    while stop is None or not stop.is_set():
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{microservice['name']} exited with code {process.returncode} during startup")
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"{microservice['name']} was not ready in time")
+        try:
+            if timing["live_at"] is None and requests.get(microservice["url"], timeout=2).status_code == 200:
+                timing["live_at"] = time.time()
+            if timing["live_at"] is not None:
+                response = requests.get(microservice["ready_url"], timeout=2)
+                if response.status_code == 200:
+                    timing["ready_at"] = time.time()
+                    timing["report"] = response.json()
+                    return timing
+                report = response.json()
+                if report.get("status") == "failed":
+                    raise RuntimeError(f"{microservice['name']} failed to warm up ({warmup_error(report)})")
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+    raise RuntimeError(f"stopped waiting for {microservice['name']}")
+
+def print_startup_timeline(timings):
+    """
+    Prints when each service came up and became ready, and its warm-up steps, in seconds since it was spawned.
+    """
+    def print_steps(report, spawned_at, indent):
+        for step in report.get("steps", []):
+            print(f"{indent}{step['name']:<32} +{step['started_at'] - spawned_at:6.2f}s  {step['seconds']}s  {step['status']}")
+        for dependency in report.get("dependencies", []):
+            print(f"{indent}[{dependency['service']}]")
+            print_steps(dependency, spawned_at, indent + "  ")
+
+    print("Startup timeline (seconds since spawn):")
+    for timing in sorted(timings, key=lambda timing: timing["ready_at"]):
+        spawned_at = timing["spawned_at"]
+        print(f"  {timing['name']:<30} live +{timing['live_at'] - spawned_at:6.2f}s  ready +{timing['ready_at'] - spawned_at:6.2f}s")
+        print_steps(timing.get("report", {}), spawned_at, "    ")
+
+# Function to wait until all microservices are ready, polling them concurrently
+def wait_for_microservices(mode="http", processes=None, timeout=STARTUP_TIMEOUT):
+    print("Waiting for the microservices to be ready...")
+    by_name = {getattr(process, "service_name", None): process for process in processes or []}
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    services = microservices_for(mode)
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(services)) as executor:
+        futures = [executor.submit(wait_until_ready, microservice, by_name.get(microservice["name"]), deadline, stop) for microservice in services]
+        # Fail as soon as one service does, instead of waiting for the others
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [future for future in done if future.exception() is not None]
+        if failed:
+            stop.set()
+            raise failed[0].exception()
+        timings = [future.result() for future in futures]
     print("All microservices are up!")
+    print_startup_timeline(timings)
+    return timings
 
 # Function to stop all microservices
 def stop_microservices(processes):
@@ -53,11 +143,18 @@ def stop_microservices(processes):
 
 # Start microservices and wait until they are fully up
 if __name__ == "__main__":
-    processes = start_microservices()
+    parser = argparse.ArgumentParser(description="Start the chatbot services and the Streamlit frontend.")
+    parser.add_argument("--mode", choices=MODES, default=os.getenv("BACKEND_MODE", "http"),
+                        help="http: one process per microservice (ports 8000-8007); monolith: the backend and the LLM gateway only")
+    parser.add_argument("--startup-timeout", type=float, default=STARTUP_TIMEOUT,
+                        help=f"seconds to wait for every service to be ready (default: {STARTUP_TIMEOUT:g})")
+    args = parser.parse_args()
+
+    processes = start_microservices(args.mode)
 
     try:
         # Wait for the services to be fully up
-        wait_for_microservices()
+        wait_for_microservices(args.mode, processes, args.startup_timeout)
 
         # After all microservices are up, start the Streamlit frontend
         print("Starting Streamlit frontend...")
@@ -65,6 +162,8 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         print("\nManual stop triggered. Stopping microservices...")
+    except (RuntimeError, TimeoutError) as e:
+        print(f"Startup failed: {e}")
 
     # Stop all microservices
     stop_microservices(processes)
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+import numpy as np
+import atexit
+import logging
+import os
+import pickle
+import threading
+import time
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings.
+
+    A lookup returns the stored answer of the most similar cached query when its
+    cosine similarity reaches the threshold and, when a terms function is
+    given, both queries have the same set of terms (embeddings of short
+    questions about different diseases can be closer than the threshold).
+    Entries are evicted least recently used first once max_size is reached,
+    and expire ttl seconds after insertion. Entries built for another corpus
+    fingerprint are not loaded. When a path is given, the cache is reloaded
+    from it on start and written back by a background thread save_delay
+    seconds after a change, and on exit.
+    """
+    def __init__(self, embeddings, threshold=0.95, max_size=1000, ttl=24 * 3600, path=None, fingerprint=None, terms=None, save_delay=2.0):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.fingerprint = fingerprint
+        self.terms = terms
+        self.save_delay = save_delay
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (query, vector, answer, created_at)
+        self._next_key = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._changed = threading.Event()
+        self._writer = None
+        self._load()
+        if path:
+            atexit.register(self.flush)
+
+    def embed(self, query):
+        return np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vector):
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    def lookup(self, query, vector=None):
+        """
+        Returns (answer, vector); answer is None on a miss. The query embedding
+        is returned so callers can reuse it for retrieval and store().
+        """
+        if vector is None:
+            vector = self.embed(query)
+        normalized = self._normalize(vector)
+        with self._lock:
+            self._expire()
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.vstack([self._entries[key][1] for key in self._matrix_keys])
+                similarities = self._matrix @ normalized
+                candidates = np.flatnonzero(similarities >= self.threshold)
+                query_terms = set(self.terms(query)) if self.terms is not None and len(candidates) else None
+                for index in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+                    key = self._matrix_keys[index]
+                    if query_terms is not None and set(self.terms(self._entries[key][0])) != query_terms:
+                        continue
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][2], vector
+            self.misses += 1
+            return None, vector
+
+    def lookup_text(self, query):
+        """
+        Returns the answer stored for the same query text (ignoring case and
+        spacing), or None; unlike lookup() it needs no query embedding.
+        """
+        text = " ".join(query.casefold().split())
+        with self._lock:
+            self._expire()
+            for key in reversed(self._entries):
+                if " ".join(self._entries[key][0].casefold().split()) == text:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][2]
+            self.misses += 1
+            return None
+
+    def store(self, query, answer, vector=None):
+        if vector is None:
+            vector = self.embed(query)
+        with self._lock:
+            self._entries[self._next_key] = (query, self._normalize(vector), answer, time.time())
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            self._schedule_save()
+
+    def invalidate(self):
+        """
+        Drops every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._schedule_save()
+
+    def flush(self):
+        """
+        Writes pending changes to path now.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                data = {"fingerprint": self.fingerprint, "entries": list(self._entries.items())}
+            try:
+                self._save(data)
+            except Exception as e:
+                logging.error(f"Could not save semantic cache to {self.path}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry[3] < cutoff]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logging.error(f"Could not load semantic cache from {self.path}: {e}")
+            return
+        if self.fingerprint is not None and data.get("fingerprint") != self.fingerprint:
+            logging.info("Discarding semantic cache built for a different document corpus")
+            return
+        self._entries = OrderedDict(data["entries"])
+        self._next_key = max(self._entries, default=-1) + 1
+        self._expire()
+
+    def _schedule_save(self):
+        # Called with self._lock held; pickling happens on the writer thread
+        if not self.path:
+            return
+        self._dirty = True
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_changes, name="semantic-cache-writer", daemon=True)
+            self._writer.start()
+        self._changed.set()
+
+    def _write_changes(self):
+        while True:
+            self._changed.wait()
+            time.sleep(self.save_delay)
+            self._changed.clear()
+            self.flush()
+
+    def _save(self, data):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,137 @@
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import urlparse
+import asyncio
+import httpx
+import importlib
+import inspect
+import json
+
+# Reply shown to the user when a call is shed because the LLM is overloaded (HTTP 429)
+BUSY_MESSAGE = "Maaf, sistem sedang sibuk. Silakan coba beberapa saat lagi."
+
+# Module that serves each downstream service, for in-process (monolith) dispatch
+SERVICE_MODULES = {
+    "intent": "intent",
+    "rag": "rag",
+    "rag_prefetch": "rag",
+    "rag_prefetch_abandon": "rag",
+    "doctor_name": "function_doctorname",
+    "doctor_disease": "function_doctordisease",
+    "doctor_specialization": "function_doctorspecialization",
+    "general_query": "function_generalquery",
+}
+
+
+class ServiceResponse:
+    """
+    Status code and body of a service call, with the parts of the httpx.Response
+    interface the backend relies on (status_code, text, json()).
+    """
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ServiceError(Exception):
+    """
+    Raised by stream() when the service answers with a non-200 status.
+    """
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class HttpService:
+    """
+    A downstream service reached over HTTP through a shared keep-alive client.
+    """
+    def __init__(self, client, url, stream_url=None):
+        self.client = client
+        self.url = url
+        self.stream_url = stream_url
+
+    async def post(self, payload, headers=None, timeout=None):
+        response = await self.client.post(self.url, json=payload, headers=headers, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+        return ServiceResponse(response.status_code, response.text)
+
+    async def stream(self, payload, headers=None, timeout=None):
+        async with self.client.stream("POST", self.stream_url, json=payload, headers=headers, timeout=timeout or httpx.USE_CLIENT_DEFAULT) as response:
+            if response.status_code != 200:
+                raise ServiceError(response.status_code, (await response.aread()).decode(errors="replace"))
+            async for chunk in response.aiter_text():
+                yield chunk
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class LocalService:
+    """
+    A downstream service called in-process: the FastAPI endpoint registered for
+    the service's path is invoked directly, without HTTP or a second process.
+
+    The endpoints block on the LLM and the embedding model (even the async ones),
+    so they run on worker threads to keep the caller's event loop responsive.
+    The worker threads inherit the caller's context, and with it its request
+    deadline, so headers and timeout are accepted for interface parity only.
+    """
+    def __init__(self, module_name, url, stream_url=None):
+        module = importlib.import_module(module_name)
+        self.app = module.app
+        # The module's background warm-up (readiness.Warmup), if it has one
+        self.warmup = getattr(module, "warmup", None)
+        self.endpoint = self._find_endpoint(module.app, url)
+        self.stream_endpoint = self._find_endpoint(module.app, stream_url) if stream_url else None
+
+    @staticmethod
+    def _find_endpoint(app, url):
+        path = urlparse(url).path
+        for route in app.routes:
+            if getattr(route, "path", None) == path and "POST" in route.methods:
+                return route.endpoint
+        raise LookupError(f"No POST endpoint for {path}")
+
+    @staticmethod
+    async def _call(endpoint, payload):
+        # Validate the payload into the endpoint's request model, as FastAPI would
+        request_model = next(iter(inspect.signature(endpoint).parameters.values())).annotation
+        request = request_model(**payload)
+        if inspect.iscoroutinefunction(endpoint):
+            return await run_in_threadpool(asyncio.run, endpoint(request))
+        return await run_in_threadpool(endpoint, request)
+
+    async def _error_response(self, error):
+        # Same outcome as the error in the HTTP service: the app's exception handlers, else a 500
+        if isinstance(error, HTTPException):
+            return ServiceResponse(error.status_code, json.dumps({"detail": error.detail}))
+        for error_type in type(error).__mro__:
+            handler = self.app.exception_handlers.get(error_type)
+            if handler:
+                response = await handler(None, error)
+                return ServiceResponse(response.status_code, response.body.decode())
+        return ServiceResponse(500, str(error))
+
+    async def post(self, payload, headers=None, timeout=None):
+        try:
+            result = await self._call(self.endpoint, payload)
+        except Exception as e:
+            return await self._error_response(e)
+        return ServiceResponse(200, json.dumps(jsonable_encoder(result)))
+
+    async def stream(self, payload, headers=None, timeout=None):
+        try:
+            response = await self._call(self.stream_endpoint, payload)
+        except Exception as e:
+            error = await self._error_response(e)
+            raise ServiceError(error.status_code, error.text)
+        async for chunk in response.body_iterator:
+            yield chunk if isinstance(chunk, str) else chunk.decode()
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,281 @@
+from functools import wraps
+from deadline import DeadlineExceeded, current_deadline, remaining
+from metrics import REGISTRY
+import asyncio
+import contextvars
+import os
+import re
+import threading
+
+# How queries are normalized before identical in-flight requests are merged:
+#   exact:    byte-for-byte equal
+#   casefold: case and whitespace ignored ("Jadwal  dokter THT" == "jadwal dokter tht")
+#   alnum:    punctuation ignored as well ("jadwal dokter THT?" == "jadwal dokter tht")
+NORMALIZERS = {
+    "exact": lambda query: query,
+    "casefold": lambda query: " ".join(query.casefold().split()),
+    "alnum": lambda query: " ".join(re.sub(r"[^\w\s]", " ", query.casefold()).split()),
+}
+SINGLEFLIGHT_NORMALIZATION = os.getenv("SINGLEFLIGHT_NORMALIZATION", "casefold")
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+
+# Every flight group created in this process, by name, for singleflight_stats()
+_groups = {}
+
+
+def singleflight_stats():
+    """
+    Returns the counters of every flight group in this process.
+    """
+    return {name: group.stats() for name, group in _groups.items()}
+
+
+def _collect_metrics():
+    counters = [
+        ("chatbot_singleflight_calls_total", "Calls entering a single-flight group.", "calls"),
+        ("chatbot_singleflight_executions_total", "Computations actually run by a single-flight group.", "executions"),
+        ("chatbot_singleflight_coalesced_total", "Calls served by another call's in-flight computation.", "coalesced"),
+    ]
+    return [
+        (name, "counter", help_text, [(name, {"group": group.name}, getattr(group, attribute)) for group in _groups.values()])
+        for name, help_text, attribute in counters
+    ]
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+class _FlightGroup:
+    def __init__(self, name, normalization=None):
+        self.name = name
+        self.normalize = NORMALIZERS[normalization or SINGLEFLIGHT_NORMALIZATION]
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        _groups[name] = self
+
+    def stats(self):
+        return {"calls": self.calls, "executions": self.executions, "coalesced": self.coalesced}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """
+    Chunks of one stream, replayed to every consumer that joins while it is produced.
+
+    consumers counts the iterators handed out and not yet closed; the producer
+    stops once it drops to zero (every client disconnected).
+    """
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.consumers = 0
+        self.condition = threading.Condition()
+
+    def join(self, stage):
+        with self.condition:
+            self.consumers += 1
+        return _Consumer(self, stage)
+
+    def leave(self):
+        with self.condition:
+            self.consumers -= 1
+
+    @property
+    def abandoned(self):
+        return self.consumers == 0
+
+
+class _Consumer:
+    """
+    One consumer's iterator over a broadcast. close() may be called from any
+    thread, even while another thread waits in __next__ (e.g. when the client
+    disconnects), and makes the consumer leave the broadcast.
+
+    Waiting for the next chunk is bounded by the deadline of the request that
+    joined; when it passes, the consumer leaves and raises DeadlineExceeded(stage).
+    """
+    def __init__(self, broadcast, stage):
+        self.broadcast = broadcast
+        self.stage = stage
+        self.deadline = current_deadline()
+        self.position = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        broadcast = self.broadcast
+        timeout = self.deadline.remaining() if self.deadline is not None else None
+        with broadcast.condition:
+            ready = broadcast.condition.wait_for(
+                lambda: len(broadcast.chunks) > self.position or broadcast.finished or self.closed, timeout
+            )
+            if self.position < len(broadcast.chunks) and not self.closed:
+                self.position += 1
+                return broadcast.chunks[self.position - 1]
+            if not ready:
+                error = DeadlineExceeded(self.stage)
+            else:
+                error = None if self.closed else broadcast.error
+        self.close()
+        if error:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.broadcast.leave()
+        with self.broadcast.condition:
+            self.broadcast.condition.notify_all()
+
+
+class SingleFlight(_FlightGroup):
+    """
+    Merges concurrent calls for the same normalized query (thread-based).
+
+    The first caller runs the computation; callers arriving while it is in
+    flight wait for it and receive the same result or exception. A waiting
+    caller gives up with DeadlineExceeded when its own request deadline
+    passes first. Nothing is kept once the call finishes, so later requests
+    compute afresh.
+    """
+    def __init__(self, name, normalization=None):
+        super().__init__(name, normalization)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def _join(self, query, new_flight):
+        # Returns (key, flight, is_leader); the first caller for a key becomes its leader
+        key = self.normalize(query)
+        with self.lock:
+            self.calls += 1
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return key, flight, False
+            flight = self.in_flight[key] = new_flight()
+            self.executions += 1
+            return key, flight, True
+
+    def _leave(self, key):
+        with self.lock:
+            del self.in_flight[key]
+
+    def do(self, query, fn):
+        """
+        Returns fn(), shared with every concurrent call for the same query.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+
+        key, call, leader = self._join(query, _Call)
+        if not leader:
+            if not call.done.wait(timeout=remaining()):
+                raise DeadlineExceeded(f"{self.name}.coalesced")
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._leave(key)
+            call.done.set()
+
+    def stream(self, query, fn):
+        """
+        Returns an iterator over the chunks of fn(), shared with every concurrent call
+        for the same query; late joiners first receive the chunks already produced.
+
+        The stream is produced on its own thread, in the leader's context (so it
+        sees the leader's request deadline). It is stopped, closing fn()'s
+        iterator, once every consumer has gone away.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+
+        key, broadcast, leader = self._join(query, _Broadcast)
+        consumer = broadcast.join(f"{self.name}.coalesced")
+        if leader:
+            def produce():
+                chunks = fn()
+                try:
+                    for chunk in chunks:
+                        with broadcast.condition:
+                            broadcast.chunks.append(chunk)
+                            broadcast.condition.notify_all()
+                        if broadcast.abandoned:
+                            chunks.close()
+                            break
+                except Exception as e:
+                    broadcast.error = e
+                finally:
+                    self._leave(key)
+                    with broadcast.condition:
+                        broadcast.finished = True
+                        broadcast.condition.notify_all()
+
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(produce,), name=f"singleflight-{self.name}", daemon=True).start()
+        return consumer
+
+
+class AsyncSingleFlight(_FlightGroup):
+    """
+    Merges concurrent calls for the same normalized query (asyncio).
+
+    The first caller's coroutine runs as a task that every concurrent caller
+    awaits; a caller that is cancelled does not cancel the shared task.
+    """
+    def __init__(self, name, normalization=None):
+        super().__init__(name, normalization)
+        self.in_flight = {}
+
+    async def do(self, query, fn):
+        """
+        Returns await fn(), shared with every concurrent call for the same query.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn()
+
+        key = self.normalize(query)
+        self.calls += 1
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = self.in_flight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+def single_flight(name, normalization=None):
+    """
+    Decorator merging concurrent calls of a function whose only argument is the user query.
+    """
+    flight = SingleFlight(name, normalization)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(query):
+            return flight.do(query, lambda: fn(query))
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+import re
+
+# Indonesian and English surface forms of each canonical specialty (lowercase, without punctuation)
+SPECIALTY_SYNONYMS = {
+    'Kardiolog': [
+        'kardiolog', 'kardiologi', 'dokter jantung', 'spesialis jantung', 'ahli jantung',
+        'cardiologist', 'cardiology', 'heart doctor',
+    ],
+    'Neurolog': [
+        'neurolog', 'neurologi', 'dokter saraf', 'dokter syaraf', 'spesialis saraf', 'spesialis syaraf',
+        'ahli saraf', 'neurologist', 'neurology',
+    ],
+    'Dermatolog': [
+        'dermatolog', 'dermatologi', 'dokter kulit', 'spesialis kulit', 'dokter kulit dan kelamin',
+        'dermatologist', 'dermatology', 'skin doctor',
+    ],
+    'Pediater': [
+        'pediater', 'pediatri', 'dokter anak', 'spesialis anak', 'pediatrician', 'pediatrics',
+    ],
+    'Ortopedi': [
+        'ortopedi', 'orthopedi', 'dokter tulang', 'spesialis tulang', 'ahli tulang',
+        'orthopedic', 'orthopedist', 'orthopaedic',
+    ],
+    'Praktisi Umum': [
+        'praktisi umum', 'dokter umum', 'general practitioner',
+    ],
+    'Androlog': [
+        'androlog', 'andrologi', 'spesialis andrologi', 'dokter andrologi', 'andrologist',
+    ],
+    'Endokrin': [
+        'endokrin', 'endokrinolog', 'endokrinologi', 'dokter hormon', 'spesialis endokrin',
+        'endocrinologist', 'endocrinology',
+    ],
+    'Ahli Bedah': [
+        'ahli bedah', 'dokter bedah', 'spesialis bedah', 'surgeon',
+    ],
+    'Obstetri': [
+        'obstetri', 'obgyn', 'dokter kandungan', 'spesialis kandungan', 'dokter kebidanan',
+        'ginekolog', 'obstetrician', 'gynecologist',
+    ],
+    'Onkologi': [
+        'onkologi', 'onkolog', 'dokter kanker', 'spesialis kanker', 'oncologist', 'oncology',
+    ],
+    'Psikiater': [
+        'psikiater', 'dokter jiwa', 'spesialis jiwa', 'spesialis kejiwaan', 'psychiatrist',
+    ],
+    'Ahli Pencernaan': [
+        'ahli pencernaan', 'dokter pencernaan', 'spesialis pencernaan', 'dokter lambung',
+        'gastroenterolog', 'gastroenterologi', 'gastroenterologist',
+    ],
+    'Pulmonologi': [
+        'pulmonologi', 'pulmonolog', 'dokter paru', 'dokter paru paru', 'spesialis paru',
+        'pulmonologist', 'lung doctor',
+    ],
+    'Reumatologi': [
+        'reumatologi', 'reumatolog', 'rematologi', 'dokter rematik', 'dokter reumatik',
+        'rheumatologist', 'rheumatology',
+    ],
+    'Nephrologi': [
+        'nephrologi', 'nefrologi', 'nefrolog', 'dokter ginjal', 'spesialis ginjal',
+        'nephrologist', 'kidney doctor',
+    ],
+    'Spesialis THT': [
+        'spesialis tht', 'dokter tht', 'tht', 'ent', 'dokter telinga hidung tenggorokan',
+        'ent doctor', 'otolaryngologist',
+    ],
+    'Ahli Alergi': [
+        'ahli alergi', 'dokter alergi', 'spesialis alergi', 'alergolog', 'allergist',
+    ],
+    'Fisioterapis': [
+        'fisioterapis', 'fisioterapi', 'terapis fisik', 'physiotherapist', 'physiotherapy',
+    ],
+    'Chiropractor': [
+        'chiropractor', 'kiropraktor', 'kiropraktik', 'chiropractic',
+    ],
+}
+
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+# One alternation over every surface form, longest first so "dokter kulit dan kelamin" beats "dokter kulit"
+_surface_to_specialty = {
+    _normalize(surface): specialty
+    for specialty, surfaces in SPECIALTY_SYNONYMS.items()
+    for surface in [specialty] + surfaces
+}
+_surface_pattern = re.compile(
+    r"\b(?:" + "|".join(re.escape(surface) for surface in sorted(_surface_to_specialty, key=len, reverse=True)) + r")\b"
+)
+
+
+def match_specialty(query):
+    """
+    Returns the canonical specialty named in the query, or None. The first mention wins.
+    """
+    match = _surface_pattern.search(_normalize(query))
+    return _surface_to_specialty[match.group(0)] if match else None
@@ -0,0 +1,120 @@
+from metrics import REGISTRY
+import asyncio
+import logging
+import time
+
+# Every speculative task started in this process, by name, for speculation_stats()
+_tasks = {}
+
+
+def speculation_stats():
+    """
+    Returns the counters of every speculative task in this process.
+    """
+    return {name: task.stats() for name, task in _tasks.items()}
+
+
+def _collect_metrics():
+    counters = [
+        ("chatbot_speculation_started_total", "Speculative lookups started alongside intent classification.", "started"),
+        ("chatbot_speculation_used_total", "Speculative lookups whose result was used by the chosen handler.", "used"),
+        ("chatbot_speculation_wasted_total", "Speculative lookups discarded or cancelled because another intent was chosen.", "wasted"),
+        ("chatbot_speculation_failed_total", "Speculative lookups that failed.", "failed"),
+        ("chatbot_speculation_wasted_seconds_total", "Time spent on speculative lookups whose result was not used.", "wasted_seconds"),
+        ("chatbot_speculation_saved_seconds_total", "Lookup time hidden behind intent classification.", "saved_seconds"),
+    ]
+    return [
+        (name, "counter", help_text, [(name, {"task": task.name}, getattr(task, attribute)) for task in _tasks.values()])
+        for name, help_text, attribute in counters
+    ]
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+class SpeculativeTask:
+    """
+    A lookup that does not depend on the intent, run while the intent is being
+    classified. `run` is an async callable taking the query; `intents` are the
+    intents whose handler uses the result.
+    """
+    def __init__(self, name, run, intents):
+        self.name = name
+        self.run = run
+        self.intents = set(intents)
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.failed = 0
+        self.wasted_seconds = 0.0
+        self.saved_seconds = 0.0
+        _tasks[name] = self
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "used": self.used,
+            "wasted": self.wasted,
+            "failed": self.failed,
+            "wasted_seconds": round(self.wasted_seconds, 6),
+            "saved_seconds": round(self.saved_seconds, 6),
+        }
+
+
+class Speculation:
+    """
+    The speculative lookups of one request.
+
+    start() launches every task; resolve(intent) is called once the intent is
+    known: tasks serving that intent keep running for the handler, the others
+    are cancelled. The time a used task ran before the intent was known is
+    counted as saved, the time spent on a discarded task as wasted.
+    """
+    def __init__(self, tasks, query):
+        self.tasks = tasks
+        self.query = query
+        self.running = {}
+
+    def start(self):
+        for task in self.tasks:
+            task.started += 1
+            future = asyncio.ensure_future(task.run(self.query))
+            future.started_at = time.perf_counter()
+            future.finished_at = None
+            future.add_done_callback(self._finished)
+            self.running[task.name] = (task, future)
+        return self
+
+    @staticmethod
+    def _finished(future):
+        future.finished_at = time.perf_counter()
+        if not future.cancelled() and future.exception() is not None:
+            logging.warning(f"Speculative lookup failed: {future.exception()}")
+
+    def resolve(self, intent):
+        """
+        Keeps the tasks the handler of `intent` uses and cancels the rest; returns the kept futures by task name.
+        """
+        now = time.perf_counter()
+        kept = {}
+        for name, (task, future) in self.running.items():
+            elapsed = (future.finished_at or now) - future.started_at
+            failed = future.done() and not future.cancelled() and future.exception() is not None
+            if failed:
+                task.failed += 1
+            elif intent in task.intents:
+                task.used += 1
+                task.saved_seconds += elapsed
+                kept[name] = future
+                continue
+            else:
+                task.wasted += 1
+                task.wasted_seconds += elapsed
+            future.cancel()
+        self.running = {}
+        return kept
+
+    def cancel(self):
+        """
+        Discards every task, e.g. when classification failed.
+        """
+        return self.resolve(None)
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+from Levenshtein import ratio
+
+from fuzzy_index import FuzzyIndex
+
+
+def linear_best_match(rows, query, threshold):
+    # Highest ratio wins, the earliest entry wins ties, threshold applied afterwards
+    best, best_ratio = None, 0.0
+    for key, value in rows:
+        similarity = ratio(query.lower(), key.lower())
+        if similarity > best_ratio:
+            best, best_ratio = value, similarity
+    return (best if best is not None and best_ratio >= threshold else None), best_ratio
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_best_match_equals_a_linear_scan(seed):
+    rng = random.Random(seed)
+    alphabet = "aab cdeE"
+
+    def random_string():
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 14)))
+
+    for _ in range(40):
+        keys = [random_string() for _ in range(rng.randint(1, 300))]
+        keys += rng.sample(keys, min(5, len(keys)))  # duplicates, to exercise ties
+        rows = [(key, i) for i, key in enumerate(keys)]
+        index = FuzzyIndex(rows, max_candidates=rng.choice([1, 4, 64]), common_posting_length=rng.choice([1, 8, 256]))
+        for _ in range(10):
+            query = random_string()
+            threshold = rng.choice([0.0, 0.5, 0.7, 0.9])
+            value, score = index.best_match(query, threshold)
+            expected_value, expected_score = linear_best_match(rows, query, threshold)
+            assert value == expected_value, (query, threshold)
+            if value is not None:
+                assert score == pytest.approx(expected_score)
@@ -0,0 +1,32 @@
+import asyncio
+
+from llm_gateway import LLMScheduler
+
+CLASSES = {
+    "intent": {"priority": 0, "max_concurrency": 1, "max_queue": 8, "max_wait": 5.0},
+    "generation": {"priority": 2, "max_concurrency": 1, "max_queue": 8, "max_wait": 5.0},
+}
+
+
+def test_intent_call_overtakes_queued_generations():
+    async def scenario():
+        scheduler = LLMScheduler(CLASSES, max_concurrency=1)
+        await scheduler.acquire("generation")  # holds the only slot
+        admitted = []
+
+        async def call(llm_class, name):
+            await scheduler.acquire(llm_class)
+            admitted.append(name)
+            scheduler.release(llm_class)
+
+        tasks = [asyncio.ensure_future(call("generation", f"generation-{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call("intent", "intent")))
+        await asyncio.sleep(0)
+        assert scheduler.metrics()["classes"]["generation"]["queue_depth"] == 2
+
+        scheduler.release("generation")
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["intent", "generation-0", "generation-1"]
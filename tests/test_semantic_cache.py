@@ -0,0 +1,54 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+from lexical_index import tokenize
+from semantic_cache import SemanticCache
+
+
+class NearDuplicateEmbeddings:
+    """
+    Puts every question within a cosine of ~0.99 of every other, like e5 does
+    for short Indonesian questions that only differ in the disease name.
+    """
+    def embed_query(self, query):
+        seed = int.from_bytes(hashlib.sha256(query.encode("utf-8")).digest()[:4], "little")
+        noise = np.random.default_rng(seed).standard_normal(32)
+        return np.ones(32) + 0.05 * noise
+
+
+def test_distinct_disease_questions_do_not_collide():
+    embedding_only = SemanticCache(NearDuplicateEmbeddings(), threshold=0.95)
+    embedding_only.store("Apa saja gejala demam berdarah?", "jawaban demam berdarah")
+    assert embedding_only.lookup("Apa saja gejala tifus?")[0] == "jawaban demam berdarah"
+
+    cache = SemanticCache(NearDuplicateEmbeddings(), threshold=0.95, terms=tokenize)
+    cache.store("Apa saja gejala demam berdarah?", "jawaban demam berdarah")
+    assert cache.lookup("Apa saja gejala tifus?")[0] is None
+    assert cache.lookup("gejala demam berdarah apa saja")[0] == "jawaban demam berdarah"
+
+
+def test_lookup_prefers_the_most_similar_entry_with_the_same_terms():
+    cache = SemanticCache(NearDuplicateEmbeddings(), threshold=0.95, terms=tokenize)
+    cache.store("Apa penyebab diabetes?", "jawaban diabetes")
+    cache.store("Apa penyebab hipertensi?", "jawaban hipertensi")
+
+    assert cache.lookup("penyebab hipertensi apa")[0] == "jawaban hipertensi"
+    assert cache.lookup("penyebab diabetes")[0] == "jawaban diabetes"
+    assert cache.stats()["hits"] == 2
+
+
+def test_store_is_persisted_by_flush(tmp_path):
+    path = os.path.join(tmp_path, "cache.pkl")
+    cache = SemanticCache(NearDuplicateEmbeddings(), path=path, fingerprint="v1", save_delay=3600)
+    cache.store("Apa itu asma?", "jawaban asma")
+    assert not os.path.exists(path)
+
+    cache.flush()
+    with open(path, "rb") as f:
+        assert pickle.load(f)["fingerprint"] == "v1"
+    reloaded = SemanticCache(NearDuplicateEmbeddings(), path=path, fingerprint="v1")
+    assert reloaded.lookup_text("apa itu  ASMA?") == "jawaban asma"
+    assert SemanticCache(NearDuplicateEmbeddings(), path=path, fingerprint="v2").stats()["size"] == 0
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from deadline import DeadlineExceeded, RequestDeadline, _current
+from singleflight import SingleFlight
+
+
+def with_deadline(seconds, fn):
+    token = _current.set(RequestDeadline("test", time.monotonic() + seconds))
+    try:
+        return fn()
+    finally:
+        _current.reset(token)
+
+
+def test_follower_gives_up_at_its_deadline():
+    flight = SingleFlight("test-follower-deadline")
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("q", release.wait))
+    leader.start()
+    while not flight.in_flight:
+        time.sleep(0.001)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with_deadline(0.05, lambda: flight.do("q", lambda: "not run"))
+    assert time.monotonic() - start < 1
+    release.set()
+    leader.join()
+
+
+def test_stream_follower_gives_up_at_its_deadline():
+    flight = SingleFlight("test-stream-deadline")
+    release = threading.Event()
+
+    def chunks():
+        yield "a"
+        release.wait()
+        yield "b"
+
+    leader = flight.stream("q", chunks)
+    assert next(leader) == "a"
+    follower = with_deadline(0.05, lambda: flight.stream("q", chunks))
+    assert next(follower) == "a"
+    with pytest.raises(DeadlineExceeded):
+        next(follower)
+    release.set()
+    assert list(leader) == ["b"]
+
+
+def run_concurrently(flight, fn, callers=8):
+    started = threading.Barrier(callers)
+    outcomes = [None] * callers
+
+    def call(i):
+        started.wait()
+        try:
+            outcomes[i] = ("result", flight.do("Jadwal dokter THT", fn))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_concurrent_calls_run_fn_once():
+    flight = SingleFlight("test-once")
+    executions = []
+
+    def fn():
+        executions.append(1)
+        time.sleep(0.1)
+        return "jadwal"
+
+    outcomes = run_concurrently(flight, fn)
+    assert len(executions) == 1
+    assert outcomes == [("result", "jadwal")] * len(outcomes)
+    assert flight.stats() == {"calls": 8, "executions": 1, "coalesced": 7}
+
+
+def test_concurrent_calls_share_the_error():
+    flight = SingleFlight("test-error")
+    error = RuntimeError("LLM down")
+    executions = []
+
+    def fn():
+        executions.append(1)
+        time.sleep(0.1)
+        raise error
+
+    outcomes = run_concurrently(flight, fn)
+    assert len(executions) == 1
+    assert all(kind == "error" and raised is error for kind, raised in outcomes)
+    assert not flight.in_flight